@@ -0,0 +1,30 @@
+"""
+Fail posts whose upload jobs were lost, e.g. with a crashed job worker.
+
+Posts pending longer than settings.job_stale_after seconds are marked
+failed, run it periodically, e.g. from cron.
+
+Usage:
+    python -m app.commands.fail_stale_uploads
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from app.conf.config import settings
+from app.models.db import SessionLocal
+from app.repository.posts import fail_stale_uploads
+
+
+async def main() -> None:
+    # Post.created_at is set by the database, in UTC
+    before = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=settings.job_stale_after)
+    db = SessionLocal()
+    try:
+        failed = await fail_stale_uploads(db, before)
+        print(f"{len(failed)} stale uploads failed")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,14 @@
+"""
+Run background jobs, e.g. uploads of new posts, outside of API processes.
+
+Usage:
+    python -m app.commands.job_worker
+"""
+import asyncio
+
+import app.repository.posts  # noqa: F401, registers jobs
+from app.services.jobs import job_worker
+
+
+if __name__ == "__main__":
+    asyncio.run(job_worker.run_forever())
@@ -0,0 +1,30 @@
+"""
+Delete tombstones of deleted posts older than settings.duplicate_deletions_ttl seconds.
+
+Duplicate indexes of API processes learn about deleted posts from the
+tombstones, run it periodically, e.g. from cron.
+
+Usage:
+    python -m app.commands.prune_post_deletions
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from app.conf.config import settings
+from app.models.db import SessionLocal
+from app.repository.posts import prune_post_deletions
+
+
+async def main() -> None:
+    # PostDeletion.deleted_at is set by the database, in UTC
+    before = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=settings.duplicate_deletions_ttl)
+    db = SessionLocal()
+    try:
+        pruned = await prune_post_deletions(db, before)
+        print(f"{pruned} tombstones of deleted posts pruned")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,28 @@
+"""
+Recalculate denormalized counters of posts.
+
+Usage:
+    python -m app.commands.reconcile_counters
+"""
+import asyncio
+
+from app.models.db import SessionLocal
+from app.repository.posts import reconcile_comments_count
+from app.services.cache import response_cache
+from app.services.rating import reconcile_ratings
+
+
+async def main() -> None:
+    db = SessionLocal()
+    try:
+        fixed = await reconcile_comments_count(db)
+        print(f"comments_count fixed for {fixed} posts")
+        fixed = await reconcile_ratings(db)
+        print(f"rating fixed for {fixed} posts")
+        await response_cache.clear()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
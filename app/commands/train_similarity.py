@@ -0,0 +1,25 @@
+"""
+Train the coarse quantiser of photo vectors, so similarity search scans
+only a few lists instead of every photo. Run it again when many photos
+were added since the last training.
+
+Usage:
+    python -m app.commands.train_similarity [lists]
+"""
+import sys
+
+from app.conf.config import settings
+from app.services.similarity import get_vector_store
+
+
+def main(lists: int = settings.similarity_ivf_lists) -> None:
+    store = get_vector_store()
+    rows = store.train(lists)
+    if rows:
+        print(f"quantiser trained with {lists} lists on {rows} rows")
+    else:
+        print(f"not enough vectors for {lists} lists, search scans all of them")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else settings.similarity_ivf_lists)
@@ -1,3 +1,5 @@
+from typing import Dict
+
 from fastapi.templating import Jinja2Templates
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -14,11 +16,39 @@ class Settings(BaseSettings):
     postgres_password: str = "test"
     postgres_port: str = "5432"
     postgres_host: str = "localhost"
+    # AsyncSession on asyncpg instead of Session on psycopg2
+    database_async: bool = False
+    # connection pool of every worker process
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # a statement run this often in one request is logged as a likely N+1 query
+    sql_repeat_threshold: int = 10
+    # statements and database time of a request in its Server-Timing header
+    server_timing: bool = True
+    # every worker writes its metrics here for /metrics, empty it on deploy
+    metrics_dir: str = "/tmp/photoshare/metrics"
+    metrics_flush_interval: float = 5.0
+    # Bearer token of the Prometheus scraper, empty serves /metrics to anyone
+    metrics_token: str = ""
+    # JSON lines on stdout, levels and shares of kept records below WARNING by logger name
+    log_json: bool = True
+    log_level: str = "INFO"
+    log_levels: Dict[str, str] = {}
+    log_sampling: Dict[str, float] = {}
 
     redis_host: str = "localhost"
     redis_port: int = 6379
 
     redis_cache_time: int = 900
+    # "redis" or "memory"
+    cache_backend: str = "redis"
+    cache_max_entries: int = 1024
+    user_cache_ttl: int = 60
+
+    tag_suggest_ttl: int = 300
 
     secret_key: str = "secret"
     algorithm: str = "HS256"
@@ -36,8 +66,65 @@ class Settings(BaseSettings):
     cloudinary_api_key: str = "key"
     cloudinary_api_secret: str = "secret"
 
+    # "cloudinary" or "local", local files are served by /api/media
+    storage_backend: str = "cloudinary"
+    storage_local_dir: str = "media"
+    storage_local_url: str = "/api/media"
+    # thumbnails of photos are resized in a process pool
+    variant_workers: int = 2
+    variant_quality: int = 80
+    # "local" renders effects with app.services.effects, "storage" uses Cloudinary transformations
+    effects_engine: str = "local"
+    effect_max_width: int = 1600
+    effect_cache_max_entries: int = 128
+    effect_cache_ttl: int = 604800
+    # near-duplicate photos by perceptual hash: "reject" with 409, "link" to the existing photo or "off"
+    duplicate_mode: str = "link"
+    duplicate_max_distance: int = 4
+    # indexes of other processes are caught up re-reading this many seconds, commits may come late
+    duplicate_sync_overlap: int = 60
+    # tombstones of deleted posts are kept this many seconds, see app.commands.prune_post_deletions
+    duplicate_deletions_ttl: int = 604800
+    # "more like this" vectors of photos, memory-mapped from this directory
+    similarity_dir: str = "data/similarity"
+    # quantiser lists, trained by app.commands.train_similarity, and lists scanned per query
+    similarity_ivf_lists: int = 1024
+    similarity_nprobe: int = 8
+    # latest comments of every post in feeds, the full list is only in a single post
+    feed_comments_preview: int = 3
+
+    # blocking uploads run in a thread pool, extra ones are rejected with 429
+    upload_workers: int = 4
+    upload_queue_size: int = 16
+    # larger uploads are rejected with 413, up to threshold bytes of an upload stay in memory
+    upload_max_size: int = 20 * 1024 * 1024
+    upload_memory_threshold: int = 1024 * 1024
+    # photos of new posts wait here for the job worker
+    upload_spool_dir: str = "/tmp/photoshare/spool"
+    # "spool" hands jobs the spooled file, upload_spool_dir must then be a volume shared
+    # by all hosts consuming the job queue; "storage" stages photos in the storage backend
+    upload_staging: str = "spool"
+    # resumable uploads keep their chunks here, sessions idle for ttl seconds are removed
+    upload_session_dir: str = "/tmp/photoshare/sessions"
+    upload_session_ttl: int = 86400
+    upload_chunk_size: int = 5 * 1024 * 1024
+
+    # "redis" or "memory", memory queue is seen only by its own process
+    job_queue: str = "redis"
+    job_concurrency: int = 4
+    job_max_attempts: int = 3
+    # seconds before the first retry of a failed job, doubled for every next one
+    job_retry_delay: float = 5.0
+    # consume jobs in API processes too, otherwise only in app.commands.job_worker
+    job_worker_in_app: bool = True
+    # seconds after which a pending post is failed by app.commands.fail_stale_uploads, its job was lost
+    job_stale_after: int = 3600
+
     def postgres_url(self) -> str:
         return f"postgresql://{self.postgres_user}:{self.postgres_password}@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
 
+    def postgres_async_url(self) -> str:
+        return f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
+
 
 settings = Settings()
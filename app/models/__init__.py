@@ -1,6 +1,6 @@
-from app.models.db import Base, get_db
+from app.models.db import Base, get_db, maybe_await
 from app.models.user import User, Role
-from app.models.post import Post, post_m2m_tag
+from app.models.post import Post, PostDeletion, PostStatus, post_m2m_tag
 from app.models.tag import Tag
 from app.models.comment import Comment
 from app.models.rating import Rating
@@ -10,9 +10,12 @@ __all__ = [
     "User",
     "Role",
     "Post",
+    "PostStatus",
+    "PostDeletion",
     "post_m2m_tag",
     "Tag",
     "Comment",
     "get_db",
+    "maybe_await",
     "Rating",
 ]
\ No newline at end of file
@@ -4,6 +4,7 @@ from sqlalchemy import (
     String,
     DateTime,
     ForeignKey,
+    Index,
     func
 )
 from sqlalchemy.orm import relationship
@@ -34,4 +35,9 @@ class Comment(Base):
     post_id = Column('post_id', ForeignKey("posts.id", ondelete='CASCADE'), default=None)
     # post = relationship('Post', backref="comments", lazy="selectin")
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
-    user = relationship('User', backref="comments", lazy="selectin")
+    user = relationship('User', backref="comments", lazy="raise")
+
+    # latest comments of posts in a feed page, see app.repository.posts.attach_latest_comments
+    __table_args__ = (
+        Index("ix_comments_post_id_created_at_id", post_id, created_at, id),
+    )
@@ -1,22 +1,77 @@
+import inspect
+from typing import Any
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 from app.conf.config import settings
+from app.services.db_pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool, instrument_engine
+from app.services.query_stats import instrument_queries
+
 
+def pool_options() -> dict:
+    """
+    Connection pool options from settings, per worker process.
+    """
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
 
-engine = create_engine(settings.postgres_url())
+
+engine = create_engine(settings.postgres_url(), poolclass=InstrumentedQueuePool, **pool_options())
+instrument_engine(engine, "sync")
+instrument_queries(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# asyncpg engine, used by requests when settings.database_async is on
+async_engine = None
+AsyncSessionLocal = None
+if settings.database_async:
+    async_engine = create_async_engine(settings.postgres_async_url(),
+                                       poolclass=InstrumentedAsyncQueuePool,
+                                       **pool_options())
+    instrument_engine(async_engine.sync_engine, "async")
+    instrument_queries(async_engine.sync_engine)
+    # objects must not expire after commit, AsyncSession can't lazy load them
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
-# Dependency
-def get_db():
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
-    # except Exception as err:
-    #     print("get_db !!!!!!!!!!!!!!!!!!")
-    #     raise err
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Dependency
+get_db = get_async_db if settings.database_async else get_sync_db
+
+
+async def maybe_await(value: Any) -> Any:
+    """
+    Await result of AsyncSession method, return result of Session method as is.
+
+    Lets repositories run on Session and AsyncSession:
+    ``result = await maybe_await(db.execute(select(Post)))``
+
+    Args:
+        value (Any):  Result of session method.
+    Returns:
+        Any:  Result.
+    """
+    if inspect.isawaitable(value):
+        return await value
+    return value
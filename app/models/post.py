@@ -1,4 +1,5 @@
 from datetime import date
+from enum import Enum
 from sqlalchemy import (
     Column,
     Integer,
@@ -7,8 +8,13 @@ from sqlalchemy import (
     ForeignKey,
     Table,
     func,
-    Float
+    Float,
+    Index,
+    Text,
+    Enum as EnumSQL,
+    JSON,
 )
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import  Mapped, mapped_column, relationship
 
 from app.models import Base
@@ -22,6 +28,12 @@ post_m2m_tag = Table(
 )
 
 
+class PostStatus(str, Enum):
+    pending: str = "pending"
+    ready: str = "ready"
+    failed: str = "failed"
+
+
 class Post(Base):  
     """
     Post 
@@ -35,9 +47,20 @@ class Post(Base):
                         updated_at: datatime,\n
                         tags: relationship(list[Tag]),\n
                         rating: float,\n
+                        rating_sum: int,\n
+                        rating_count: int,\n
                         user_id: int,\n
                         user: relationship(User),\n
-                        comments_count: int\n
+                        comments_count: int,\n
+                        search_vector: tsvector,\n
+                        status: PostStatus,\n
+                        variants: json,\n
+                        photo_hash: str,\n
+                        photo_phash: str,\n
+                        duplicate_of_id: int,\n
+                        phash_changed_at: datetime,\n
+                        blurhash: str,\n
+                        dominant_color: str\n
                         )
     """    
     __tablename__ = "posts"
@@ -47,11 +70,67 @@ class Post(Base):
     transform_url = Column(String(255))
     description = Column(String(255), nullable=False)
     created_at = Column('created_at', DateTime, default=func.now())
+    # edits of the post, counter UPDATEs set updated_at=Post.updated_at to keep it
     updated_at = Column("updated_at", DateTime, default=None, nullable=True, onupdate=func.now())
-    tags = relationship("Tag", secondary=post_m2m_tag, backref="posts", lazy="selectin")
+    # relationships are loaded by profiles of app.services.loading, never implicitly
+    tags = relationship("Tag", secondary=post_m2m_tag, backref="posts", lazy="raise")
     rating = Column(Float)
+    # rating = rating_sum / rating_count, maintained by app.services.rating
+    rating_sum = Column(Integer, default=0, server_default="0", nullable=False)
+    rating_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # set by admins, wins over rating_sum / rating_count, which are still kept
+    rating_override = Column(Float, nullable=True)
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
-    user = relationship('User', backref="posts", lazy="selectin")
-    comments_count = 0
-    comments = relationship('Comment', backref='post', lazy="selectin", cascade="all, delete-orphan")
+    user = relationship('User', backref="posts", lazy="raise")
+    # maintained by app.repository.comments, see app.commands.reconcile_counters
+    comments_count = Column(Integer, default=0, server_default="0", nullable=False)
+    comments = relationship('Comment', backref='post', lazy="raise", cascade="all, delete-orphan",
+                            passive_deletes=True)
+    # filled by database triggers from description and tags, see app.services.search
+    search_vector = mapped_column(TSVECTOR().with_variant(Text(), "sqlite"), deferred=True)
+    # pending until the job worker uploads the photo, see app.repository.posts.create_post
+    status = Column(EnumSQL(PostStatus), default=PostStatus.ready, server_default=PostStatus.ready.name, nullable=False)
+    # {"256": {"webp": url, "jpeg": url}, ...}, see app.services.variants
+    variants = Column(JSON, nullable=True)
+    # SHA-256 of photo, addresses rendered effects in app.services.effects
+    photo_hash = Column(String(64), nullable=True)
+    # perceptual hash of photo, near-duplicates are found by app.services.duplicates
+    photo_phash = Column(String(16), nullable=True)
+    # post whose photo this post shares, see settings.duplicate_mode
+    duplicate_of_id = Column(Integer, ForeignKey("posts.id", ondelete="SET NULL"), nullable=True)
+    # set to func.now() by every write of photo_phash or status, unlike updated_at, so that
+    # app.services.duplicates catches up with an indexed query, see also PostDeletion
+    phash_changed_at = Column(DateTime, default=func.now(), server_default=func.now(), nullable=False)
+    # shown while the photo loads, see app.services.placeholders
+    blurhash = Column(String(64), nullable=True)
+    dominant_color = Column(String(7), nullable=True)
+
+    # keyset pagination indexes, see app.services.pagination.PostCursor
+    __table_args__ = (
+        Index("ix_posts_created_at_id", created_at, id),
+        Index("ix_posts_rating_id", func.coalesce(rating, 0), id),
+        Index("ix_posts_user_id_created_at_id", user_id, created_at, id),
+        Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_posts_phash_changed_at", phash_changed_at),
+    )
+
+
+class PostDeletion(Base):
+    """
+    Tombstone of a deleted post
+
+    Database object PostDeletion(id: int,\n
+                                post_id: int,\n
+                                deleted_at: datetime\n
+                                )
+
+    Written with the delete, app.services.duplicates removes the post from
+    the index of every process by it. Pruned by
+    app.commands.prune_post_deletions.
+    """
+    __tablename__ = "post_deletions"
+    id = Column(Integer, primary_key=True)
+    # no foreign key, the post is gone
+    post_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=func.now(), server_default=func.now(), nullable=False, index=True)
     
\ No newline at end of file
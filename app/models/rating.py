@@ -4,7 +4,7 @@ from sqlalchemy import (
     ForeignKey,
     DateTime
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import backref, relationship
 
 from app.models import Base, Post , User
 
@@ -14,7 +14,8 @@ class Rating(Base):
     id = Column(Integer, primary_key=True)
     rate = Column(Integer)
     post_id = Column("post_id", ForeignKey("posts.id", ondelete="CASCADE"))
-    post = relationship("Post", backref="ratings", lazy="selectin")
+    # ratings go with their post in the database, they are not loaded to delete it
+    post = relationship("Post", backref=backref("ratings", passive_deletes=True), lazy="raise")
     user_id = Column("user_id", ForeignKey("users.id", ondelete="CASCADE"))
-    user = relationship("User", backref="ratings", lazy="selectin")
+    user = relationship("User", backref="ratings", lazy="raise")
     create_at = Column(DateTime)
@@ -2,6 +2,7 @@ from sqlalchemy import (
     Column,
     Integer,
     String,
+    Index,
 )
 
 from app.models import Base
@@ -11,3 +12,9 @@ class Tag(Base):
     __tablename__ = "tags"
     id = Column(Integer, primary_key=True)
     text = Column(String(32), nullable=False)
+
+    # substring and similarity search, see app.repository.tags.search_tags_by_query
+    __table_args__ = (
+        Index("ix_tags_text_trgm", text,
+              postgresql_using="gin", postgresql_ops={"text": "gin_trgm_ops"}),
+    )
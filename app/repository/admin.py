@@ -1,10 +1,16 @@
 from datetime import datetime
+from typing import List
 
 from sqlalchemy.orm import Session
 from fastapi import UploadFile
 
-from app.models import Post
-from app.services.cloudinary import upload_photo
+from app.models import Post, PostDeletion, maybe_await
+from app.services.cache import POSTS_TAG, POST_TAG, response_cache
+from app.services.duplicates import duplicate_index, load_duplicate_index
+from app.services.loading import LoadProfile
+from app.services.search import post_search_index
+from app.services.similarity import remove_photo_vector
+from app.repository.posts import get_post_by_id, refresh_post, replace_post_photo
 from app.repository.tags import get_list_of_tags_by_string
 
 
@@ -18,10 +24,15 @@ async def delete_post_by_id(post_id: int, db: Session) -> Post | None:
     Returns:
         Post | None:  Database object Post.
     """    
-    post = db.query(Post).filter_by(id=post_id).first()
+    post = await get_post_by_id(post_id, db, LoadProfile.existence)
     if post:
-        db.delete(post)
-        db.commit()
+        await maybe_await(db.delete(post))
+        db.add(PostDeletion(post_id=post_id))
+        await maybe_await(db.commit())
+        post_search_index.remove(post_id)
+        duplicate_index.remove(post_id)
+        await remove_photo_vector(post_id)
+        await response_cache.invalidate(POSTS_TAG, POST_TAG.format(post_id=post_id))
     return post
 
 
@@ -42,21 +53,46 @@ async def update_post_by_id(post_id: int,
         photo (UploadFile, optional):  New picture for post.
         description (str, optional):  New description for post.
         tags (str, optional):  New tag\'s for post.
-        rating (int, optional):  New rating for post.
+        rating (int, optional):  New rating for post, kept over later rates.
+    Raises:
+        DuplicatePhoto:  HTTP_409_CONFLICT
+        UploadTooLarge:  HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        UnsupportedMediaType:  HTTP_415_UNSUPPORTED_MEDIA_TYPE
     Returns:
         Post | None:  Database object Post.
     """    
-    post = db.query(Post).filter_by(id=post_id).first()
+    if tags:
+        # new tags are committed, which expires a loaded post
+        tags = await get_list_of_tags_by_string(tags, db)
+    post = await get_post_by_id(post_id, db, LoadProfile.admin)
     if post:
         if photo:
-            post.photo_url, post.photo_public_id = upload_photo(photo, post)
+            await replace_post_photo(post, photo, db)
         if description:
             post.description = description
         if tags:
-            tags = await get_list_of_tags_by_string(tags, db)
             post.tags = tags
         if rating:
-            post.rating = rating
-        db.commit()
-        db.refresh(post)
+            # kept over rates, see app.services.rating
+            post.rating_override = post.rating = rating
+        await maybe_await(db.commit())
+        await refresh_post(post, db, LoadProfile.admin)
+        post_search_index.add(post)
+        if photo:
+            duplicate_index.add(post.id, post.photo_phash)
+        await response_cache.invalidate(POSTS_TAG, POST_TAG.format(post_id=post_id))
     return post
+
+
+async def get_duplicate_clusters(db: Session, max_distance: int) -> List[List[int]]:
+    """
+    Groups of posts with near-duplicate photos.
+
+    Args:
+        db (Session):  The database session.
+        max_distance (int):  Largest Hamming distance of perceptual hashes.
+    Returns:
+        List[List[int]]:  Post.id lists, largest group first.
+    """
+    index = await load_duplicate_index(db)
+    return index.clusters(max_distance)
@@ -1,8 +1,10 @@
 from typing import List
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
-from app.models import Comment
+from app.models import Comment, Post, maybe_await
 from app.schemas.comments import CommentCreate, CommentUpdate
+from app.services.cache import COMMENTS_TAG, POSTS_TAG, POST_TAG, response_cache
+from app.services.loading import COMMENT_OPTIONS
 
 
 async def get_comment_by_id(comment_id: int, db: Session) -> Comment | None:
@@ -15,8 +17,8 @@ async def get_comment_by_id(comment_id: int, db: Session) -> Comment | None:
     Returns:
         Comment | None:  Database object Comment.
     """    
-    query = select(Comment).filter_by(id=comment_id)
-    comment = db.execute(query)
+    query = select(Comment).options(*COMMENT_OPTIONS).filter_by(id=comment_id)
+    comment = await maybe_await(db.execute(query))
     return comment.scalar_one_or_none()
 
 
@@ -38,12 +40,13 @@ async def get_comments_by_post(
     """    
     query = (
         select(Comment)
+        .options(*COMMENT_OPTIONS)
         .filter_by(post_id=post_id)
         .group_by(Comment.created_at, Comment.id)
         .offset(offset)
         .limit(limit)
     )
-    comments = db.execute(query)
+    comments = await maybe_await(db.execute(query))
     return comments.scalars().all()
 
 
@@ -65,8 +68,10 @@ async def create_comment(
     """    
     db_comment = Comment(**comment.model_dump(exclude_unset=True), user_id=user_id)
     db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
+    await __change_comments_count(db_comment.post_id, 1, db)
+    await maybe_await(db.commit())
+    await __refresh_comment(db_comment, db)
+    await __invalidate_post_comments(db_comment.post_id)
     return db_comment
 
 
@@ -85,11 +90,12 @@ async def update_comment(
     Returns:
         Comment:  Database object Comment.
     """    
-    db_comment = db.query(Comment).filter_by(id=comment_id).first()
+    db_comment = await get_comment_by_id(comment_id, db)
     for key, value in comment.model_dump(exclude_unset=True).items():
         setattr(db_comment, key, value)
-    db.commit()
-    db.refresh(db_comment)
+    await maybe_await(db.commit())
+    await __refresh_comment(db_comment, db)
+    await __invalidate_post_comments(db_comment.post_id)
     return db_comment
 
 
@@ -103,7 +109,58 @@ async def delete_comment(comment_id: int, db: Session) -> Comment:
     Returns:
         Comment:  Database object Comment.
     """    
-    comment = db.query(Comment).filter_by(id=comment_id).first()
-    db.delete(comment)
-    db.commit()
+    comment = await get_comment_by_id(comment_id, db)
+    await maybe_await(db.delete(comment))
+    await __change_comments_count(comment.post_id, -1, db)
+    await maybe_await(db.commit())
+    await __invalidate_post_comments(comment.post_id)
     return comment
+
+
+async def __refresh_comment(comment: Comment, db: Session) -> None:
+    """
+    Internal function for def create_comment and def update_comment
+
+    Reload comment after commit, with its author.
+
+    Args:
+        comment (Comment):  Database object Comment.
+        db (Session):  The database session.
+    """
+    result = await maybe_await(db.execute(
+        select(Comment).options(*COMMENT_OPTIONS).filter_by(id=comment.id)
+        .execution_options(populate_existing=True)
+    ))
+    result.scalar_one()
+
+
+async def __change_comments_count(post_id: int, delta: int, db: Session) -> None:
+    """
+    Internal function for def create_comment and def delete_comment
+
+    Change Post.comments_count in database in the same transaction as comment.
+
+    Args:
+        post_id (int):  Database object Post.id.
+        delta (int):  1 or -1.
+        db (Session):  The database session.
+    """
+    await maybe_await(db.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(comments_count=Post.comments_count + delta, updated_at=Post.updated_at)
+    ))
+
+
+async def __invalidate_post_comments(post_id: int) -> None:
+    """
+    Internal function for def create_comment, def update_comment and def delete_comment
+
+    Drop cached comments of post and cached posts, they embed comments.
+
+    Args:
+        post_id (int):  Database object Post.id.
+    """
+    await response_cache.invalidate(COMMENTS_TAG.format(post_id=post_id),
+                                    POST_TAG.format(post_id=post_id),
+                                    POSTS_TAG)
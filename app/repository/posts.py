@@ -1,101 +1,207 @@
 from datetime import datetime, date
 
-from sqlalchemy.orm import Session, aliased, Query
-from sqlalchemy import and_, or_, func, desc, asc, Date, cast
-from typing import List
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql import Select
+from sqlalchemy import and_, or_, func, desc, asc, Date, cast, delete, select, update
+from typing import List, Tuple
 from fastapi import UploadFile
-
-from app.models import Post, User, Comment, Tag, post_m2m_tag
-from app.services.cloudinary import upload_photo, transform_photo
+from starlette.concurrency import run_in_threadpool
+
+from app.models import Post, PostDeletion, PostStatus, User, Comment, Tag, post_m2m_tag, maybe_await
+from app.conf.config import settings
+from app.services.analysis import analyse_upload, photo_phash
+from app.services.cloudinary import upload_photo_async, transform_photo
+from app.services.duplicates import DuplicatePhoto, duplicate_index, load_duplicate_index
+from app.services.effects import apply_effect
+from app.services.jobs import JobQueueUnavailable, job_worker
+from app.services.loading import COMMENT_OPTIONS, LoadProfile, post_options
+from app.services.resumable import get_upload_sessions, ingest_session
+from app.services.uploads import (SpooledUpload, discard_spooled, discard_staged, fetch_staged, file_digest,
+                                  ingest_upload, stage_spooled)
+from app.services.variants import store_variants
 from app.repository.tags import (
     get_list_of_tags_by_string,
-    search_tags_by_query,
     get_tags_by_name
 )
 from app.schemas.post import PostSearchSchema, OrderByEnum, OrderEnum
+from app.services.cache import POSTS_TAG, POST_TAG, response_cache
+from app.services.pagination import PostCursor
+from app.services.search import full_text_search, post_search_index
+from app.services.similarity import copy_photo_vector, index_photo, remove_photo_vector, similar_post_ids
+
+SEARCH_COUNT_LIMIT = 1000
+UPLOAD_POST_PHOTO_JOB = "upload_post_photo"
 
 
-async def get_all_posts(limit: int, offset: int, db: Session) -> List[Post]:
+async def get_all_posts(
+    limit: int, offset: int, db: Session, cursor: PostCursor | None = None
+) -> List[Post]:
     """
-    Get all posts.
+    Get all ready posts.
+
+    If cursor points after some post, offset is ignored and the page is
+    read by keyset.
 
     Args:
         limit (int):  Limit.
         offset (int):  Offset.
         db (Session):  The database session.
+        cursor (PostCursor, optional):  Ordering and position in feed.
     Returns:
         List[Post]:  List of Database objects Post.
     """    
-    # Query to get post id and its corresponding comment count
-    comments_count_subquery = db.query(
-        Comment.post_id,
-        func.count(Comment.id).label("comment_count")
-    ).group_by(Comment.post_id).subquery()
-    
-    # Query to join posts with the comment counts
-    posts_with_comments_count = db.query(
-        Post,
-        func.coalesce(comments_count_subquery.c.comment_count, 0).label("comment_count")
-    ).outerjoin(
-        comments_count_subquery, Post.id == comments_count_subquery.c.post_id
-    ).offset(offset).limit(limit).all()
-
-    for post, comments_count in posts_with_comments_count:
-        post.comments_count = comments_count
-    posts = [post for post, comments_count in posts_with_comments_count]
-
-    return posts
+    query = select(Post).options(*post_options(LoadProfile.feed)).where(Post.status == PostStatus.ready)
+    result = await maybe_await(db.execute(__paginate(query, limit, offset, cursor)))
+    return result.scalars().all()
 
 
-async def get_posts(limit: int, offset: int, user: User, db: Session) -> List[Post]:
+async def get_posts(
+    limit: int,
+    offset: int,
+    user: User,
+    db: Session,
+    cursor: PostCursor | None = None,
+) -> List[Post]:
     """
     Get posts of user.
 
+    If cursor points after some post, offset is ignored and the page is
+    read by keyset.
+
     Args:
         limit (int):  Limit.
         offset (int):  Offset.
         user (User):  Database object User.
         db (Session):  The database session.
+        cursor (PostCursor, optional):  Ordering and position in feed.
     Returns:
         List[Post]:  Posts of user.
     """    
-    # Query to get post id and its corresponding comment count
-    comments_count_subquery = db.query(
-        Comment.post_id,
-        func.count(Comment.id).label("comment_count")
-    ).group_by(Comment.post_id).subquery()
-    
-    # Query to join posts with the comment counts
-    posts_with_comments_count = db.query(
-        Post,
-        func.coalesce(comments_count_subquery.c.comment_count, 0).label("comment_count")
-    ).outerjoin(
-        comments_count_subquery, Post.id == comments_count_subquery.c.post_id
-    ).filter(Post.user == user).offset(offset).limit(limit).all()
-    
-    for post, comments_count in posts_with_comments_count:
-        post.comments_count = comments_count
-    posts = [post for post, comments_count in posts_with_comments_count]
+    query = select(Post).options(*post_options(LoadProfile.feed)).where(Post.user_id == user.id)
+    result = await maybe_await(db.execute(__paginate(query, limit, offset, cursor)))
+    return result.scalars().all()
+
+
+async def attach_latest_comments(
+    posts: List[Post], db: Session, limit: int | None = None
+) -> List[Post]:
+    """
+    Set latest_comments of posts of a feed page, for app.schemas.post.PostFeedItem.
+
+    Comments of all posts are read with one windowed query, at most limit
+    per post, so a busy post costs no more than a quiet one. Feed queries
+    leave Post.comments unloaded.
 
+    Args:
+        posts (List[Post]):  Database objects Post.
+        db (Session):  The database session.
+        limit (int | None, optional):  Comments per post, defaults to settings.feed_comments_preview.
+    Returns:
+        List[Post]:  posts, each with latest_comments, newest first.
+    """
+    limit = settings.feed_comments_preview if limit is None else limit
+    latest = {post.id: [] for post in posts}
+    if latest and limit > 0:
+        position = func.row_number().over(
+            partition_by=Comment.post_id,
+            order_by=(desc(Comment.created_at), desc(Comment.id)),
+        ).label("position")
+        ranked = select(Comment.id, position).where(Comment.post_id.in_(latest)).subquery()
+        result = await maybe_await(db.execute(
+            select(Comment)
+            .options(*COMMENT_OPTIONS)
+            .join(ranked, Comment.id == ranked.c.id)
+            .where(ranked.c.position <= limit)
+            .order_by(Comment.post_id, ranked.c.position)
+        ))
+        for comment in result.scalars().all():
+            latest[comment.post_id].append(comment)
+    for post in posts:
+        post.latest_comments = latest[post.id]
     return posts
 
 
+def __paginate(query: Select, limit: int, offset: int, cursor: PostCursor | None) -> Select:
+    """
+    Internal function for def get_all_posts, def get_posts and def search_posts_by_inputs
+
+    Apply cursor ordering and keyset position, or offset for the first page.
+
+    Args:
+        query (Select):  Query to database.
+        limit (int):  Limit.
+        offset (int):  Offset.
+        cursor (PostCursor | None):  Ordering and position in feed.
+    Returns:
+        Select:  Query to database.
+    """
+    if cursor is None:
+        return query.offset(offset).limit(limit)
+    query = cursor.apply(query)
+    if not cursor.is_started:
+        query = query.offset(offset)
+    return query.limit(limit)
+
+
 # return post by id for current user
-async def get_post_by_id(post_id: int, db: Session) -> Post | None:
+async def get_post_by_id(
+    post_id: int, db: Session, profile: LoadProfile = LoadProfile.detail
+) -> Post | None:
     """
     Get post by id.
 
     Args:
         post_id (int):  Database object Post.id to search.
         db (Session):  The database session.
+        profile (LoadProfile, optional):  Relationships to load with post.
     Returns:
         Post | None:  Database object Post.
     """    
-    post = db.query(Post).filter_by(id=post_id).first()
-    if post:
-        comments_count = db.query(Comment).filter(Comment.post_id == post_id).count()
-        post.comments_count = comments_count
-    return post
+    result = await maybe_await(db.execute(select(Post).options(*post_options(profile)).filter_by(id=post_id)))
+    return result.scalars().first()
+
+
+async def refresh_post(post: Post, db: Session, profile: LoadProfile) -> Post:
+    """
+    Reload post after commit, with columns set by the database and relationships of profile.
+
+    Args:
+        post (Post):  Database object Post.
+        db (Session):  The database session.
+        profile (LoadProfile):  Relationships to load with post.
+    Returns:
+        Post:  post.
+    """
+    result = await maybe_await(db.execute(
+        select(Post).options(*post_options(profile)).filter_by(id=post.id)
+        .execution_options(populate_existing=True)
+    ))
+    return result.scalar_one()
+
+
+async def get_similar_posts(post_id: int, limit: int, db: Session) -> List[Post] | None:
+    """
+    Ready posts with photos most similar to photo of post.
+
+    Args:
+        post_id (int):  Database object Post.id.
+        limit (int):  Number of posts.
+        db (Session):  The database session.
+    Returns:
+        List[Post] | None:  Database objects Post, most similar first,
+            None if photo of post has no feature vector.
+    """
+    similar = await similar_post_ids(post_id, limit)
+    if similar is None:
+        return None
+    if not similar:
+        return []
+    posts = await maybe_await(db.execute(
+        select(Post).options(*post_options(LoadProfile.feed))
+        .where(Post.id.in_([similar_id for similar_id, _ in similar]), Post.status == PostStatus.ready)
+    ))
+    by_id = {post.id: post for post in posts.scalars().all()}
+    return [by_id[similar_id] for similar_id, _ in similar if similar_id in by_id]
 
 
 async def find_posts(find_str: str, user: User, db: Session) -> List[Post]:
@@ -109,21 +215,26 @@ async def find_posts(find_str: str, user: User, db: Session) -> List[Post]:
     Returns:
         List[Post]:  Posts of user.
     """    
-    return (
-        db.query(Post)
-        .filter(and_(Post.description.like(f"%{find_str}%"), Post.user == user))
-        .all()
-    )
+    query = (select(Post).options(*post_options(LoadProfile.feed))
+             .where(and_(Post.description.like(f"%{find_str}%"), Post.user_id == user.id)))
+    result = await maybe_await(db.execute(query))
+    return result.scalars().all()
 
 
-async def search_posts_by_inputs(input: PostSearchSchema, db: Session) -> List[Post]:
+async def search_posts_by_inputs(
+    input: PostSearchSchema, db: Session, cursor: PostCursor | None = None, expression: Tuple | None = None
+) -> List[Post]:
     """
-    Search posts by inputs.
+    Search ready posts by inputs.
+
+    Returns one page of input.limit posts. If cursor points after some post,
+    input.offset is ignored and the page is read by keyset.
 
     PostSearchSchema schema {
                             query: Optional[str] = Field(None),
-                            limit: int = 20,
-                            offset: int = 0,
+                            limit: int = Field(20, ge=1, le=100),
+                            offset: int = Field(0, ge=0),
+                            cursor: Optional[str] = None,
                             order: Optional[OrderEnum] = OrderEnum.desc,
                             order_by: Optional[OrderByEnum] = OrderByEnum.created_at,
                             filter: Optional[PostFilterSchema]
@@ -131,6 +242,7 @@ async def search_posts_by_inputs(input: PostSearchSchema, db: Session) -> List[P
     OrderByEnum schema {
                         created_at = "created_at",
                         rating = "rating",
+                        relevance = "relevance",
                         }
     OrderEnum schema {
                       asc = "asc",
@@ -145,17 +257,87 @@ async def search_posts_by_inputs(input: PostSearchSchema, db: Session) -> List[P
     Args:
         input (PostSearchSchema):  Schema.
         db (Session):  The database session.
+        cursor (PostCursor, optional):  Ordering and position in results,
+            defaults to input.order_by and input.order.
+        expression (Tuple | None, optional):  Result of def build_search_expression
+            for input, built here if it is not given.
     Returns:
         List[Post]:  List of Database objects Post.
     """    
-    query = db.query(Post)
+    query = select(Post).options(*post_options(LoadProfile.feed)).where(Post.status == PostStatus.ready)
+
+    expr_post, rank = expression or await build_search_expression(input, db)
+    if expr_post is not None:
+        query = query.where(expr_post)
+
+    # Handle ordering and pagination
+    if cursor is None and input.order_by == OrderByEnum.relevance:
+        order_func = desc if input.order == OrderEnum.desc else asc
+        if rank is not None:
+            query = query.order_by(order_func(rank))
+        query = query.order_by(desc(Post.created_at), desc(Post.id))
+    elif cursor is None:
+        cursor = PostCursor(input.order_by, input.order)
+    query = __paginate(query, input.limit, input.offset, cursor)
 
+    result = await maybe_await(db.execute(query))
+    return result.scalars().all()
+
+
+async def count_posts_by_inputs(
+    input: PostSearchSchema, db: Session, limit: int = SEARCH_COUNT_LIMIT, expression: Tuple | None = None
+) -> int:
+    """
+    Count posts found by inputs.
+
+    Counting stops at limit, so for broad queries the result is an estimate
+    "limit or more" and the database reads no more than limit index entries.
+
+    Args:
+        input (PostSearchSchema):  Schema.
+        db (Session):  The database session.
+        limit (int, optional):  Maximum to count, defaults to SEARCH_COUNT_LIMIT.
+        expression (Tuple | None, optional):  Result of def build_search_expression
+            for input, built here if it is not given.
+    Returns:
+        int:  Number of posts, not greater than limit.
+    """
+    query = select(Post.id).where(Post.status == PostStatus.ready)
+
+    expr_post, _ = expression or await build_search_expression(input, db)
+    if expr_post is not None:
+        query = query.where(expr_post)
+
+    found = query.limit(limit).subquery()
+    result = await maybe_await(db.execute(select(func.count()).select_from(found)))
+    return result.scalar()
+
+
+async def build_search_expression(input: PostSearchSchema, db: Session) -> Tuple:
+    """
+    Build filter expression from query and filters.
+
+    Tags are looked up and the full text query is parsed here, so a request
+    which both searches and counts builds it once and passes it to
+    def search_posts_by_inputs and def count_posts_by_inputs.
+
+    Args:
+        input (PostSearchSchema):  Schema.
+        db (Session):  The database session.
+    Returns:
+        Tuple:  Filter expression or None if there is nothing to filter,
+            rank expression or None if there is no query.
+    """
     # Initialize expression holder
     expr_post = None
+    rank = None
 
     # Check if input.query is not empty
     if input.query and input.query.strip():
-        expr_post = await __build_query_expression(input.query, db)
+        expr_post, rank = await full_text_search(input.query, db)
+
+    if input.filter is None:
+        return expr_post, rank
 
     # Check if input.filter.tags is not empty or None and apply filtering
     if input.filter.tags and any(tag.strip() for tag in input.filter.tags):
@@ -169,39 +351,12 @@ async def search_posts_by_inputs(input: PostSearchSchema, db: Session) -> List[P
     if input.filter.show_date:
         expr_post = await __filter_by_show_date(input.filter.show_date, expr_post)
 
-    # Apply the built expression to the query if it exists
-    if expr_post is not None:
-        query = query.filter(expr_post)
-
-    # Handle ordering
-    query = apply_ordering(query, input.order, input.order_by)
-
-    return query.all()
-
-
-async def __build_query_expression(query: str, db: Session):
-    """
-    Internal function for def search_posts_by_inputs
-
-    Check if input.query is not empty
-
-    Args:
-        query (str): query
-        db (Session): The database session.
-
-    Returns:
-        Query: Query to database
-    """    
-    tags_queried = await search_tags_by_query(query, db)
-    expr_post = Post.description.ilike(f"%{query}%")
-    if tags_queried:
-        expr_post = or_(expr_post, Post.tags.any(Tag.id.in_([tag.id for tag in tags_queried])))
-    return expr_post
+    return expr_post, rank
 
 
 async def __filter_by_tags(tag_names: List[str], expr_post, db: Session):
     """
-    Internal function for def search_posts_by_inputs
+    Internal function for def build_search_expression
 
     Check if input.filter.tags is not empty or None and apply filtering
 
@@ -219,7 +374,7 @@ async def __filter_by_tags(tag_names: List[str], expr_post, db: Session):
 
 async def __filter_by_rating(rating: int, expr_post):
     """
-    Internal function for def search_posts_by_inputs
+    Internal function for def build_search_expression
 
     Check if input.filter.rating is not None and apply filtering
 
@@ -236,7 +391,7 @@ async def __filter_by_rating(rating: int, expr_post):
 
 async def __filter_by_show_date(show_date: date, expr_post):
     """
-    Internal function for def search_posts_by_inputs
+    Internal function for def build_search_expression
 
     Filter by show_date if provided
 
@@ -250,56 +405,326 @@ async def __filter_by_show_date(show_date: date, expr_post):
     return and_(expr_post, expr_show_date) if expr_post is not None else expr_show_date
 
 
-def apply_ordering(query: Query, order: OrderEnum, order_by: OrderByEnum) -> Query:
-
-    """
-    Internal function for def search_posts_by_inputs
-
-    Handle ordering
-
-    Returns:
-        Query:  Query to database.
-    """
-    order_func = desc if order == OrderEnum.desc else asc
-    if order_by == OrderByEnum.rating:
-        query = query.order_by(order_func(Post.rating))
-    elif order_by == OrderByEnum.created_at:
-        query = query.order_by(order_func(Post.created_at))
-    return query
-
-
 async def create_post(
     description: str, tags: str, file: UploadFile, user: User, db: Session
 ) -> Post:
     """
     Create new post
 
+    Post is saved as pending and the photo is spooled and staged for the job
+    worker, which uploads it to storage and marks the post ready, see def
+    process_post_upload.
+    A near-duplicate of an uploaded photo is rejected or linked to it without
+    an upload, by settings.duplicate_mode.
+
     Args:
         description (str):  Description for Post.
         tags (str):  Tags for Post.
         file (UploadFile):  Photo for Post.
         user (User):  Owner.
         db (Session):  The database session.
+    Raises:
+        UploadTooLarge:  HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        UnsupportedMediaType:  HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        DuplicatePhoto:  HTTP_409_CONFLICT
+        UploadQueueFull:  HTTP_429_TOO_MANY_REQUESTS
+        JobQueueUnavailable:  HTTP_503_SERVICE_UNAVAILABLE
     Returns:
-        Post:  Database object Post.
+        Post:  Database object Post with status pending, or ready if its photo is linked.
     """    
+    # checked and hashed while streamed to the spool, before anything else
+    upload = await ingest_upload(file)
+    return await create_post_from_upload(description, tags, upload, user, db)
 
-    tags = await get_list_of_tags_by_string(tags, db)
 
-    new_post = Post(description=description, user=user, tags=tags)
-    db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
-    
-    new_post.photo_url, new_post.photo_public_id = upload_photo(file, new_post)
+async def create_post_from_upload(
+    description: str, tags: str, upload: SpooledUpload, user: User, db: Session
+) -> Post:
+    """
+    Create new post with photo already streamed to the spool, see def create_post.
 
+    Args:
+        description (str):  Description for Post.
+        tags (str):  Tags for Post.
+        upload (SpooledUpload):  Checked photo for Post, it is persisted or discarded here.
+        user (User):  Owner.
+        db (Session):  The database session.
+    Raises:
+        DuplicatePhoto:  HTTP_409_CONFLICT
+        UploadQueueFull:  HTTP_429_TOO_MANY_REQUESTS
+        JobQueueUnavailable:  HTTP_503_SERVICE_UNAVAILABLE
+    Returns:
+        Post:  Database object Post with status pending, or ready if its photo is linked.
+    """
+    path = await run_in_threadpool(upload.persist)
+    try:
+        tags = await get_list_of_tags_by_string(tags, db)
+        phash = await photo_phash(path)
+        original = await find_duplicate(phash, db)
+        if original is not None and settings.duplicate_mode == "reject":
+            raise DuplicatePhoto(original.id)
+    except BaseException:
+        discard_spooled(path)
+        raise
+
+    new_post = Post(description=description, user=user, tags=tags, photo_phash=phash)
+    if original is not None and original.photo_public_id:
+        discard_spooled(path)
+        link_post_photo(new_post, original)
+        new_post.status = PostStatus.ready
+        db.add(new_post)
+        await maybe_await(db.commit())
+        await refresh_post(new_post, db, LoadProfile.feed)
+        duplicate_index.add(new_post.id, phash)
+        await copy_photo_vector(new_post.id, original.id)
+        post_search_index.add(new_post)
+        await response_cache.invalidate(POSTS_TAG)
+        return new_post
+
+    try:
+        # the job may run on another host
+        staged = await stage_spooled(path)
+    except BaseException:
+        discard_spooled(path)
+        raise
+
+    new_post.status = PostStatus.pending
     db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
+    await maybe_await(db.commit())
+    await refresh_post(new_post, db, LoadProfile.feed)
+    duplicate_index.add(new_post.id, phash)
+
+    try:
+        await job_worker.enqueue(UPLOAD_POST_PHOTO_JOB, post_id=new_post.id, path=staged, digest=upload.sha256)
+    except JobQueueUnavailable:
+        await fail_post_upload(db, new_post.id, staged)
+        raise
 
     return new_post
 
 
+async def create_post_from_session(
+    upload_id: str, description: str, tags: str, user: User, db: Session
+) -> Post:
+    """
+    Create new post with photo of complete resumable upload session, see def create_post.
+
+    The session is removed whether the post is created or not.
+
+    Args:
+        upload_id (str):  Upload session id.
+        description (str):  Description for Post.
+        tags (str):  Tags for Post.
+        user (User):  Owner of session and Post.
+        db (Session):  The database session.
+    Raises:
+        UploadSessionNotFound:  HTTP_404_NOT_FOUND
+        UploadSessionConflict:  HTTP_409_CONFLICT if chunks are missing
+        DuplicatePhoto:  HTTP_409_CONFLICT
+        UploadTooLarge:  HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        UnsupportedMediaType:  HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        JobQueueUnavailable:  HTTP_503_SERVICE_UNAVAILABLE
+    Returns:
+        Post:  Database object Post with status pending, or ready if its photo is linked.
+    """
+    store = get_upload_sessions()
+    session = await run_in_threadpool(store.get, upload_id, user.id)
+    session = await run_in_threadpool(store.claim, session)
+    try:
+        upload = await ingest_session(session)
+    finally:
+        await run_in_threadpool(store.discard, session)
+    return await create_post_from_upload(description, tags, upload, user, db)
+
+
+async def find_duplicate(phash: str | None, db: Session, exclude: int | None = None) -> Post | None:
+    """
+    Nearest post with a near-duplicate photo.
+
+    Args:
+        phash (str | None):  Perceptual hash of photo.
+        db (Session):  The database session.
+        exclude (int | None, optional):  Post.id to skip.
+    Returns:
+        Post | None:  Database object Post, None if there is none or duplicate_mode is "off".
+    """
+    if phash is None or settings.duplicate_mode not in ("reject", "link"):
+        return None
+    index = await load_duplicate_index(db)
+    for post_id, _ in index.find(phash, settings.duplicate_max_distance, exclude):
+        post = await get_post_by_id(post_id, db, LoadProfile.existence)
+        if post is not None and post.status != PostStatus.failed:
+            return post
+    return None
+
+
+def link_post_photo(post: Post, original: Post) -> None:
+    """
+    Share uploaded photo of original with post, nothing is uploaded.
+
+    Photos are never deleted from storage with their posts, so the shared
+    photo outlives original.
+
+    Args:
+        post (Post):  Database object Post.
+        original (Post):  Database object Post with uploaded photo.
+    """
+    post.photo_url = original.photo_url
+    post.photo_public_id = original.photo_public_id
+    post.photo_hash = original.photo_hash
+    post.variants = original.variants
+    post.blurhash = original.blurhash
+    post.dominant_color = original.dominant_color
+    post.transform_url = None
+    post.duplicate_of_id = original.duplicate_of_id or original.id
+
+
+async def replace_post_photo(post: Post, file: UploadFile, db: Session) -> None:
+    """
+    Set new photo of existing post, a near-duplicate is handled like in def create_post.
+
+    The photo is checked and spooled like in def create_post, but uploaded
+    right away. The caller commits and updates duplicate_index.
+
+    Args:
+        post (Post):  Database object Post.
+        file (UploadFile):  Photo.
+        db (Session):  The database session.
+    Raises:
+        UploadTooLarge:  HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        UnsupportedMediaType:  HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        DuplicatePhoto:  HTTP_409_CONFLICT
+    """
+    upload = await ingest_upload(file)
+    path = await run_in_threadpool(upload.persist)
+    try:
+        phash = await photo_phash(path)
+        original = await find_duplicate(phash, db, exclude=post.id)
+        if original is not None and settings.duplicate_mode == "reject":
+            raise DuplicatePhoto(original.id)
+
+        post.photo_phash = phash
+        post.phash_changed_at = func.now()
+        if original is not None and original.photo_public_id:
+            link_post_photo(post, original)
+            await copy_photo_vector(post.id, original.id)
+        else:
+            post.duplicate_of_id = None
+            await store_post_photo(post, path, upload.sha256)
+    finally:
+        discard_spooled(path)
+
+
+async def process_post_upload(db: Session, post_id: int, path: str, digest: str | None = None) -> None:
+    """
+    Job of def create_post: upload spooled photo with its thumbnails and mark post ready.
+
+    Args:
+        db (Session):  The database session.
+        post_id (int):  Database object Post.id.
+        path (str):  Staged photo, see app.services.uploads.stage_spooled.
+        digest (str | None, optional):  SHA-256 of photo computed while it was spooled.
+    """
+    post = await get_post_by_id(post_id, db, LoadProfile.feed)
+    if post is None:
+        # deleted while pending
+        await discard_staged(path)
+        return
+
+    async with fetch_staged(path) as spooled:
+        await store_post_photo(post, spooled, digest)
+    post.status = PostStatus.ready
+    post.phash_changed_at = func.now()
+    await maybe_await(db.commit())
+    await refresh_post(post, db, LoadProfile.feed)
+    await discard_staged(path)
+
+    post_search_index.add(post)
+    await response_cache.invalidate(POSTS_TAG, POST_TAG.format(post_id=post_id))
+
+
+async def store_post_photo(post: Post, path: str, digest: str | None = None) -> None:
+    """
+    Upload photo of post with its thumbnails.
+
+    Sets Post.photo_url, Post.photo_public_id, Post.photo_hash,
+    Post.variants, Post.blurhash and Post.dominant_color, the caller
+    commits. Feature vector of photo is stored for def get_similar_posts.
+    The photo is analysed once, in a worker process which reads the path.
+
+    Args:
+        post (Post):  Database object Post.
+        path (str):  Spooled photo.
+        digest (str | None, optional):  SHA-256 of photo, computed here if not given.
+    """
+    with open(path, "rb") as photo:
+        post.photo_url, post.photo_public_id = await upload_photo_async(UploadFile(photo), post)
+        post.photo_hash = digest or await file_digest(photo)
+    analysis = await analyse_upload(path)
+    if analysis is None:
+        post.variants = post.blurhash = post.dominant_color = None
+        return
+    post.variants = await store_variants(analysis.variants, post.photo_public_id)
+    post.blurhash, post.dominant_color = analysis.blurhash, analysis.dominant_color
+    await index_photo(post.id, analysis.vector)
+
+
+async def fail_post_upload(db: Session, post_id: int, path: str, digest: str | None = None) -> None:
+    """
+    Mark post failed when its photo can't be uploaded.
+
+    Args:
+        db (Session):  The database session.
+        post_id (int):  Database object Post.id.
+        path (str):  Staged photo, see app.services.uploads.stage_spooled.
+        digest (str | None, optional):  SHA-256 of photo, unused, part of the job payload.
+    """
+    await discard_staged(path)
+    await maybe_await(db.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(status=PostStatus.failed, phash_changed_at=func.now())
+        .execution_options(synchronize_session=False)
+    ))
+    await maybe_await(db.commit())
+    duplicate_index.remove(post_id)
+    await remove_photo_vector(post_id)
+    await response_cache.invalidate(POST_TAG.format(post_id=post_id))
+
+
+async def fail_stale_uploads(db: Session, before: datetime) -> List[int]:
+    """
+    Mark failed posts still pending since before.
+
+    Jobs are taken off the queue before they run, so the job of a worker
+    which crashed mid-upload is lost and its post would stay pending.
+    Their staged photos are left to the cleanup of the spool or the
+    storage, the job payload with the path is gone.
+
+    Args:
+        db (Session):  The database session.
+        before (datetime):  Posts created earlier are stale, UTC like Post.created_at.
+    Returns:
+        List[int]:  Database objects Post.id marked failed.
+    """
+    stale = (Post.status == PostStatus.pending, Post.created_at < before)
+    post_ids = list((await maybe_await(db.execute(select(Post.id).where(*stale)))).scalars())
+    if not post_ids:
+        return []
+    await maybe_await(db.execute(
+        update(Post)
+        .where(Post.id.in_(post_ids), *stale)
+        .values(status=PostStatus.failed, phash_changed_at=func.now())
+        .execution_options(synchronize_session=False)
+    ))
+    await maybe_await(db.commit())
+    for post_id in post_ids:
+        duplicate_index.remove(post_id)
+        await remove_photo_vector(post_id)
+    await response_cache.invalidate(*(POST_TAG.format(post_id=post_id) for post_id in post_ids))
+    return post_ids
+
+
 async def update_post(
     post_id: int,
     user: User,
@@ -322,22 +747,34 @@ async def update_post(
         tags (str, optional):  New tag\'s for post.
         effect (str, optional):  New effect to picture in Post.
         file (UploadFile, optional):  New picture for post.
+    Raises:
+        DuplicatePhoto:  HTTP_409_CONFLICT
+        UploadTooLarge:  HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        UnsupportedMediaType:  HTTP_415_UNSUPPORTED_MEDIA_TYPE
     Returns:
         Post:  Updated database object Post.
     """
-    post = db.query(Post).filter_by(id=post_id).first()
+    if tags:
+        # new tags are committed, which expires a loaded post
+        tags = await get_list_of_tags_by_string(tags, db)
+    post = await get_post_by_id(post_id, db)
     if description:
         post.description = description
     if file:
-        post.photo_url, post.photo_public_id = upload_photo(file, post)
+        await replace_post_photo(post, file, db)
     if tags:
-        tags = await get_list_of_tags_by_string(tags, db)
         post.tags = tags
-    if effect:
+    if effect and settings.effects_engine == "local":
+        post.transform_url = await apply_effect(effect, post)
+    elif effect:
         post.transform_url = await transform_photo(effect, post)
     post.updated_at = datetime.now()
-    db.commit()
-    db.refresh(post)
+    await maybe_await(db.commit())
+    await refresh_post(post, db, LoadProfile.detail)
+    post_search_index.add(post)
+    if file:
+        duplicate_index.add(post.id, post.photo_phash)
+    await response_cache.invalidate(POSTS_TAG, POST_TAG.format(post_id=post_id))
     return post
 
 
@@ -352,7 +789,61 @@ async def delete_post(post_id: int, user: User, db: Session) -> Post:
     Returns:
         Post:  Database object Post.
     """    
-    post = db.query(Post).filter_by(id=post_id).first()
-    db.delete(post)
-    db.commit()
+    post = await get_post_by_id(post_id, db, LoadProfile.existence)
+    await maybe_await(db.delete(post))
+    db.add(PostDeletion(post_id=post_id))
+    await maybe_await(db.commit())
+    post_search_index.remove(post_id)
+    duplicate_index.remove(post_id)
+    await remove_photo_vector(post_id)
+    await response_cache.invalidate(POSTS_TAG, POST_TAG.format(post_id=post_id))
     return post
+
+
+async def prune_post_deletions(db: Session, before: datetime) -> int:
+    """
+    Delete tombstones of posts deleted before before.
+
+    An index of app.services.duplicates which has not caught up since is
+    built again, see settings.duplicate_deletions_ttl.
+
+    Args:
+        db (Session):  The database session.
+        before (datetime):  Older tombstones are deleted, UTC like PostDeletion.deleted_at.
+    Returns:
+        int:  Number of deleted tombstones.
+    """
+    result = await maybe_await(db.execute(
+        delete(PostDeletion)
+        .where(PostDeletion.deleted_at < before)
+        .execution_options(synchronize_session=False)
+    ))
+    await maybe_await(db.commit())
+    return result.rowcount
+
+
+async def reconcile_comments_count(db: Session) -> int:
+    """
+    Recalculate Post.comments_count for posts where it differs from comments table.
+
+    Args:
+        db (Session):  The database session.
+    Returns:
+        int:  Number of fixed posts.
+    """
+    actual = (
+        select(func.count(Comment.id))
+        .where(Comment.post_id == Post.id)
+        .scalar_subquery()
+    )
+    result = await maybe_await(db.execute(
+        update(Post)
+        .where(Post.comments_count != actual)
+        .values(comments_count=actual, updated_at=Post.updated_at)
+        .execution_options(synchronize_session=False)
+    ))
+    await maybe_await(db.commit())
+    return result.rowcount
+
+
+job_worker.register(UPLOAD_POST_PHOTO_JOB, process_post_upload, on_failure=fail_post_upload)
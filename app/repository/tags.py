@@ -1,10 +1,12 @@
 from typing import List
 
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, select
 
-from app.models import Tag, Post
+from app.models import Tag, Post, maybe_await
 from app.schemas.tags import TagModel
+from app.services.cache import TAGS_TAG, response_cache
+from app.services.tag_index import tag_suggest_index
 
 
 async def get_tags(db: Session, skip: int = 0, limit: int = 100) -> List[Tag]:
@@ -18,7 +20,8 @@ async def get_tags(db: Session, skip: int = 0, limit: int = 100) -> List[Tag]:
     Returns:
         List[Tag]:  List[Database objects Tag]
     """    
-    return db.query(Tag).offset(skip).limit(limit).all()
+    result = await maybe_await(db.execute(select(Tag).offset(skip).limit(limit)))
+    return result.scalars().all()
 
 
 async def create_tag_in_db(body: TagModel, db: Session) -> Tag:
@@ -35,8 +38,10 @@ async def create_tag_in_db(body: TagModel, db: Session) -> Tag:
     """    
     _tag = Tag(text=body.text)
     db.add(_tag)
-    db.commit()
-    db.refresh(_tag)
+    await maybe_await(db.commit())
+    await maybe_await(db.refresh(_tag))
+    tag_suggest_index.add(_tag)
+    await response_cache.invalidate(TAGS_TAG)
     return _tag
 
 
@@ -50,7 +55,8 @@ async def get_tag_by_id(tag_id: int, db: Session) -> Tag | None:
     Returns:
         Tag | None:  Database object Tag.
     """    
-    return db.query(Tag).filter(Tag.id == tag_id).first()
+    result = await maybe_await(db.execute(select(Tag).where(Tag.id == tag_id)))
+    return result.scalars().first()
 
 
 async def get_tag_by_text(text: str, db: Session) -> Tag | None:
@@ -63,7 +69,8 @@ async def get_tag_by_text(text: str, db: Session) -> Tag | None:
     Returns:
         Tag | None:  Database object Tag.
     """    
-    return db.query(Tag).filter(Tag.text == text).first()
+    result = await maybe_await(db.execute(select(Tag).where(Tag.text == text)))
+    return result.scalars().first()
 
 
 async def get_list_of_tags_by_string(string: str | None, db: Session) -> list[Tag]:
@@ -101,7 +108,7 @@ async def search_tags_by_query(query: str, db: Session) -> List[Tag]:
     """
     Search tags by query.
 
-    _extended_summary_
+    Substring search, on PostgreSQL it uses ix_tags_text_trgm (pg_trgm) index.
 
     Args:
         query (str):  Search query.
@@ -109,7 +116,8 @@ async def search_tags_by_query(query: str, db: Session) -> List[Tag]:
     Returns:
         List[Tag]:  List[Database objects Tag]
     """    
-    return db.query(Tag).filter(Tag.text.ilike(f"%{query}%")).all()
+    result = await maybe_await(db.execute(select(Tag).where(Tag.text.ilike(f"%{query}%"))))
+    return result.scalars().all()
 
 
 async def get_tags_by_name(tags: List[str], db: Session) -> List[Tag]:
@@ -122,4 +130,5 @@ async def get_tags_by_name(tags: List[str], db: Session) -> List[Tag]:
     Returns:
         List[Tag]:  List[Database objects Tag]
     """    
-    return db.query(Tag).filter(Tag.text.in_(tags)).all()
+    result = await maybe_await(db.execute(select(Tag).where(Tag.text.in_(tags))))
+    return result.scalars().all()
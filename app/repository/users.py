@@ -1,10 +1,16 @@
+import logging
+
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from libgravatar import Gravatar
 
-from app.models import User, Post, Comment
+from app.models import User, Post, Comment, maybe_await
 from app.schemas.user import UserModel, UserUpdateModel
+from app.services.cache import USERS_TAG, response_cache, user_cache
 from app.services.gravatar import get_gravatar
 
+logger = logging.getLogger(__name__)
+
 
 async def get_user_by_email(email: str, db: Session) -> User | None:
     """
@@ -16,7 +22,8 @@ async def get_user_by_email(email: str, db: Session) -> User | None:
     Returns:
         User | None:  The User, or None if the user does not exist.
     """
-    return db.query(User).filter(User.email == email).first()
+    result = await maybe_await(db.execute(select(User).where(User.email == email)))
+    return result.scalars().first()
 
 
 async def get_user_by_id(id: str, db: Session) -> User:
@@ -29,15 +36,16 @@ async def get_user_by_id(id: str, db: Session) -> User:
     Returns:
         User:  The user, or None if the user does not exist.
     """    
-    return db.query(User).filter(User.id == id).first()
+    result = await maybe_await(db.execute(select(User).where(User.id == id)))
+    return result.scalars().first()
 
 
 async def user_posts_comments_number(user: User, db: Session) -> int:
     """
     Get the number of posts and comments for a user.
     """
-    posts_number = db.query(Post).filter(Post.user_id == user.id).count()
-    comments_number = db.query(Comment).filter(Comment.user_id == user.id).count()
+    posts_number = await maybe_await(db.scalar(select(func.count(Post.id)).where(Post.user_id == user.id)))
+    comments_number = await maybe_await(db.scalar(select(func.count(Comment.id)).where(Comment.user_id == user.id)))
     return posts_number, comments_number
 
 
@@ -62,11 +70,11 @@ async def create_user(body: UserModel, db: Session) -> User:
     try:
         avatar = await get_gravatar(body.email)
     except Exception as e:
-        print(e)
+        logger.warning("Gravatar is not found: %s", e)
     new_user = User(**body.model_dump(), avatar=avatar)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await maybe_await(db.commit())
+    await maybe_await(db.refresh(new_user))
     return new_user
 
 
@@ -88,11 +96,15 @@ async def update_user(user_id: int, body: UserUpdateModel, db: Session) -> User:
     Returns:
         User:  Database object User.
     """    
-    user = db.query(User).filter_by(id=user_id).first()
+    user = await get_user_by_id(user_id, db)
+    old_email = user.email
     for key, value in body.model_dump(exclude_none=True).items():
         setattr(user, key, value)
-    db.commit()
-    db.refresh(user)
+    await maybe_await(db.commit())
+    await maybe_await(db.refresh(user))
+    await user_cache.invalidate(old_email)
+    await user_cache.invalidate(user.email)
+    await response_cache.invalidate(USERS_TAG)
     return user
 
 
@@ -106,7 +118,8 @@ async def update_token(user: User, token: str | None, db: Session) -> None:
         db (Session):  The database session.
     """    
     user.refresh_token = token
-    db.commit()
+    await maybe_await(db.commit())
+    await user_cache.invalidate(user.email)
 
 
 async def confirmed_email(email: str, db: Session) -> None:
@@ -119,7 +132,8 @@ async def confirmed_email(email: str, db: Session) -> None:
     """    
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
+    await maybe_await(db.commit())
+    await user_cache.invalidate(email)
 
 
 async def update_avatar(email: str, url: str, db: Session) -> User:
@@ -135,7 +149,9 @@ async def update_avatar(email: str, url: str, db: Session) -> User:
     """    
     user = await get_user_by_email(email, db)
     user.avatar = url
-    db.commit()
+    await maybe_await(db.commit())
+    await user_cache.invalidate(email)
+    await response_cache.invalidate(USERS_TAG)
     return user
 
 
@@ -150,8 +166,9 @@ async def update_password(user: User, password: str, db: Session) -> None:
 
     """    
     user.password = password
-    db.commit()
-    db.refresh(user)
+    await maybe_await(db.commit())
+    await maybe_await(db.refresh(user))
+    await user_cache.invalidate(user.email)
 
 
 async def ban_user(user_id: int, is_ban: bool, db: Session) -> None:
@@ -167,8 +184,9 @@ async def ban_user(user_id: int, is_ban: bool, db: Session) -> None:
         db (Session):  The database session.
         None: 
     """
-    user = db.query(User).filter_by(id=user_id).first()
+    user = await get_user_by_id(user_id, db)
     user.banned = is_ban
-    db.commit()
-    db.refresh(user)
+    await maybe_await(db.commit())
+    await maybe_await(db.refresh(user))
+    await user_cache.invalidate(user.email)
     return user
@@ -1,14 +1,16 @@
 from datetime import datetime
+from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, status
+from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, status
 from sqlalchemy.orm import Session
 
 from app.models import get_db
 from app.models.post import Post
-from app.schemas.post import PostDeleteSchema, PostResponse
+from app.conf.config import settings
+from app.schemas.post import DuplicateCluster, PostDeleteSchema, PostResponse
 from app.schemas.user import UserDb
 from app.services.role_checker import admin_required
-from app.repository.admin import delete_post_by_id, update_post_by_id
+from app.repository.admin import delete_post_by_id, get_duplicate_clusters, update_post_by_id
 from app.repository.users import get_user_by_id, ban_user
 
 router = APIRouter(prefix="/admin", tags=["admin"])
@@ -57,7 +59,7 @@ async def admin_update_post_by_id(post_id: int,
         photo (UploadFile , optional):  New photo for post.
         description (str, optional):  New description for post.
         tags (str, optional):  New tags for post
-        rating (int, optional):  New rating for post.
+        rating (int, optional):  New rating for post, kept over later rates.
     Raises:
         HTTPException:  HTTP_403_FORBIDDEN.
         HTTPException:  HTTP_404_NOT_FOUND.
@@ -77,6 +79,29 @@ async def admin_update_post_by_id(post_id: int,
     return post
 
 
+@router.get("/duplicates",
+            response_model=List[DuplicateCluster],
+            dependencies=[Depends(admin_required)])
+async def get_duplicate_photos(max_distance: int = Query(default=None, ge=0, le=64),
+                               db: Session = Depends(get_db)) -> List[dict]:
+    """
+    Groups of posts with near-duplicate photos, the function works only for users with administrator rights.
+
+    Args:
+        max_distance (int, optional):  Largest Hamming distance of perceptual hashes,
+            defaults to settings.duplicate_max_distance.
+        db (Session, optional):  The database session.
+    Raises:
+        HTTPException:  HTTP_403_FORBIDDEN
+    Returns:
+        List[dict]:  [{"post_ids": [int, ...]}, ...], largest group first.
+    """
+    if max_distance is None:
+        max_distance = settings.duplicate_max_distance
+    clusters = await get_duplicate_clusters(db, max_distance)
+    return [{"post_ids": post_ids} for post_ids in clusters]
+
+
 @router.post("/ban_user/{user_id}",
              response_model=UserDb,
              dependencies=[Depends(admin_required)])
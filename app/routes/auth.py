@@ -63,7 +63,6 @@ async def signup(
     Returns:
         json:  massage
     """
-    print(f"#b_R - body.email: {body.email}")
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(
@@ -91,7 +90,6 @@ async def login(
     Returns:
         json:  JWT Tokens
     """
-    print(f"#R_Login - verifying email: {body.username}")
     user = await repository_users.get_user_by_email(body.username, db)
     if user is None:
         raise HTTPException(
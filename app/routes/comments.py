@@ -2,8 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.models import get_db, User, Post, Role
+from app.models import get_db, User, Post, Role, maybe_await
 from app.services.auth import auth_service
+from app.services.cache import COMMENTS_TAG, USERS_TAG, response_cache
+from app.services.loading import LoadProfile, post_options
 from app.schemas.comments import CommentCreate, CommentUpdate, Comment
 from app.repository import comments as repository_comments
 
@@ -41,9 +43,8 @@ async def create_comment(
 
         Comment:  Database object Comment.
     """
-    print(f"api create comments {body=}")
-    query = select(Post).filter_by(id=body.post_id)
-    p = db.execute(query)
+    query = select(Post).options(*post_options(LoadProfile.existence)).filter_by(id=body.post_id)
+    p = await maybe_await(db.execute(query))
     db_post = p.scalar_one_or_none()
     if not body.text.strip():
         raise HTTPException(
@@ -76,6 +77,7 @@ async def get_comment_by_id(comment_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/post/{post_id}", response_model=list[Comment])
+@response_cache.cached(list[Comment], tags=(COMMENTS_TAG, USERS_TAG))
 async def get_comments_by_post(
     post_id: int,
     offset: int = Query(0),
@@ -0,0 +1,72 @@
+from fastapi import APIRouter, Depends
+from starlette.concurrency import run_in_threadpool
+
+from app.models import db as models_db
+from app.schemas.internal import DbPoolResponse, QueriesResponse, UploadsResponse
+from app.services.db_pool import pools_stats
+from app.services.metrics import collect, metrics
+from app.services.query_stats import queries_stats
+from app.services.role_checker import admin_required
+from app.services.uploads import upload_executor
+
+router = APIRouter(prefix="/internal", tags=["internal"])
+
+
+@router.get("/db-pool",
+            response_model=DbPoolResponse,
+            dependencies=[Depends(admin_required)])
+async def get_db_pool_stats() -> dict:
+    """
+    Connection pool stats of the worker which serves the request,
+    the function works only for users with administrator rights.
+
+    Counters grow from the worker start. Pool size is set by
+    settings.db_pool_size and settings.db_max_overflow per worker.
+
+    Raises:
+        HTTPException:  HTTP_403_FORBIDDEN
+    Returns:
+        dict:  {"pid": int, "pools": {"sync": PoolStats, "async": PoolStats}}
+    """
+    engines = {"sync": models_db.engine}
+    if models_db.async_engine is not None:
+        engines["async"] = models_db.async_engine.sync_engine
+    return pools_stats(engines)
+
+
+@router.get("/queries",
+            response_model=QueriesResponse,
+            dependencies=[Depends(admin_required)])
+async def get_queries_stats() -> dict:
+    """
+    Statements and database time per request by route, of all workers,
+    the function works only for users with administrator rights.
+
+    Read from the snapshots of app.services.metrics, like /metrics, so
+    other workers are up to settings.metrics_flush_interval behind.
+    Histograms are cumulative, "repeated" counts requests that ran one
+    statement at least settings.sql_repeat_threshold times, likely N+1 queries.
+
+    Raises:
+        HTTPException:  HTTP_403_FORBIDDEN
+    Returns:
+        dict:  {"routes": {"/api/posts/{post_id}": RouteQueryStats}}
+    """
+    await run_in_threadpool(metrics.flush)
+    return queries_stats(await run_in_threadpool(collect))
+
+
+@router.get("/uploads",
+            response_model=UploadsResponse,
+            dependencies=[Depends(admin_required)])
+async def get_uploads_stats() -> dict:
+    """
+    Upload executor stats of the worker which serves the request,
+    the function works only for users with administrator rights.
+
+    Raises:
+        HTTPException:  HTTP_403_FORBIDDEN
+    Returns:
+        dict:  Workers, queue size, pending uploads and timing per kind of upload.
+    """
+    return upload_executor.stats()
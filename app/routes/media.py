@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException, Request, Response, status
+
+from app.services.storage import LocalStorage, get_storage
+
+router = APIRouter(prefix="/media", tags=["media"])
+
+
+@router.api_route("/{public_id:path}", methods=["GET", "HEAD"], name="get_media")
+async def get_media(public_id: str, request: Request) -> Response:
+    """
+    Photo or avatar from local storage.
+
+    Supports Range, If-Range, If-None-Match and If-Modified-Since headers,
+    the file is streamed without loading it into memory.
+
+    Args:
+        public_id (str):  Public id of file.
+        request (Request):  Request.
+    Raises:
+        HTTPException:  HTTP_404_NOT_FOUND
+    Returns:
+        Response:  File.
+    """
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    return storage.response(public_id, request.headers)
@@ -3,26 +3,41 @@ from fastapi import (
     File,
     HTTPException,
     Depends,
+    Request,
+    Response,
     UploadFile,
     status,
     Query,
 )
 
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, select
+from starlette.concurrency import run_in_threadpool
 
-from app.models import User, Role, get_db, Rating, Post
+from app.models import User, Role, get_db, Rating, Post, maybe_await
 from app.schemas.post import (
     PostResponse,
     PostCreateResponse,
+    PostFeedItem,
     PostDeleteSchema,
-    PostSearchSchema
+    PostSearchSchema,
+    FeedOrderByEnum,
+    OrderByEnum,
+    OrderEnum,
+    UploadSessionCreate,
+    UploadSessionResponse,
 )
 from app.repository import posts as repository_posts
 from app.repository import users as repository_users
 from app.services.auth import auth_service
+from app.services.cache import POSTS_TAG, POST_TAG, USERS_TAG, response_cache
 from app.services.cloudinary import Effect
+from app.services.effects import effect_response
+from app.services.loading import LoadProfile
+from app.services.pagination import PostCursor
 from app.services.rating import add_rate_to_post
+from app.services.resumable import UploadSession, get_upload_sessions
+from app.services.uploads import UploadTooLarge
 from app.schemas.post import RatingResponce
 
 router = APIRouter(prefix="/posts", tags=["posts"])
@@ -30,48 +45,103 @@ router = APIRouter(prefix="/posts", tags=["posts"])
 
 @router.get(
     "/",
-    response_model=list[PostResponse] | None,
+    response_model=list[PostFeedItem] | None,
     name="get_posts",
 )
 async def get_posts(
+    response: Response,
     limit: int = Query(50),
     offset: int = Query(0),
+    cursor: str = Query(None),
+    order_by: FeedOrderByEnum = Query(FeedOrderByEnum.created_at),
+    order: OrderEnum = Query(OrderEnum.asc),
     db: Session = Depends(get_db),
     user: User = Depends(auth_service.get_current_user),
 ):
-    return await repository_posts.get_posts(limit, offset, user, db)
+    """
+    Get posts of current user.
+
+    Token of the next page is returned in X-Next-Cursor header.
+
+    Args:
+        response (Response):  Response.
+        limit (int, optional):  Limit, defaults to Query(50)
+        offset (int, optional):  Offset, used only for the first page.
+        cursor (str, optional):  X-Next-Cursor of previous page.
+        order_by (FeedOrderByEnum, optional):  created_at or rating, ignored with cursor.
+        order (OrderEnum, optional):  asc or desc, ignored with cursor.
+        db (Session, optional):  The database session.
+        user (User, optional):  Current user.
+    Raises:
+        HTTPException:  HTTP_400_BAD_REQUEST
+    Returns:
+        List[Post]:  List of Database objects Post.
+    """
+    page = PostCursor.from_token(cursor) if cursor else PostCursor(OrderByEnum(order_by.value), order)
+    posts = await repository_posts.get_posts(limit, offset, user, db, page)
+    await repository_posts.attach_latest_comments(posts, db)
+    __set_next_cursor(response, page.next_token(posts, limit))
+    return posts
 
 
 @router.get(
     "/all",
-    response_model=list[PostResponse],
+    response_model=list[PostFeedItem],
     name="get_all_posts",
 )
+@response_cache.cached(list[PostFeedItem], tags=(POSTS_TAG, USERS_TAG))
 async def get_all_posts(
+    response: Response,
     limit: int = Query(50),
     offset: int = Query(0),
+    cursor: str = Query(None),
+    order_by: FeedOrderByEnum = Query(FeedOrderByEnum.created_at),
+    order: OrderEnum = Query(OrderEnum.asc),
     db: Session = Depends(get_db),
 ):
     """
     Get all posts.
 
+    Token of the next page is returned in X-Next-Cursor header.
+
     Args:
+        response (Response):  Response.
         limit (int, optional):  Limit, defaults to Query(10)
-        offset (int, optional):  Offset, defaults to Query(0)
+        offset (int, optional):  Offset, used only for the first page.
+        cursor (str, optional):  X-Next-Cursor of previous page.
+        order_by (FeedOrderByEnum, optional):  created_at or rating, ignored with cursor.
+        order (OrderEnum, optional):  asc or desc, ignored with cursor.
         db (Session, optional):  The database session.
+    Raises:
+        HTTPException:  HTTP_400_BAD_REQUEST
     Returns:
         List[Post]:  List of Database objects Post.
     """    
-
-    posts = await repository_posts.get_all_posts(limit, offset, db)
+    page = PostCursor.from_token(cursor) if cursor else PostCursor(OrderByEnum(order_by.value), order)
+    posts = await repository_posts.get_all_posts(limit, offset, db, page)
+    await repository_posts.attach_latest_comments(posts, db)
+    __set_next_cursor(response, page.next_token(posts, limit))
     return posts
 
 
+def __set_next_cursor(response: Response, next_cursor: str | None) -> None:
+    """
+    Internal function for def get_posts, def get_all_posts and def search_posts
+
+    Args:
+        response (Response):  Response.
+        next_cursor (str | None):  Token of the next page.
+    """
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+
 @router.get(
     "/{post_id}",
     response_model=PostResponse,
     name="get_post_by_id",
 )
+@response_cache.cached(PostResponse, tags=(POST_TAG, USERS_TAG))
 async def get_post(
     post_id: int,
     db: Session = Depends(get_db),
@@ -95,22 +165,92 @@ async def get_post(
     return post
 
 
+@router.get(
+    "/{post_id}/effects/{effect}",
+    name="get_post_effect",
+)
+async def get_post_effect(
+    post_id: int,
+    effect: Effect,
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Photo of post with effect, rendered once and then served from cache.
+
+    Args:
+        post_id (int):  Database object Post.id.
+        effect (Effect):  Effect.
+        request (Request):  Request.
+        db (Session, optional):  The database session.
+    Raises:
+        HTTPException:  HTTP_404_NOT_FOUND
+    Returns:
+        Response:  JPEG image.
+    """
+    post = await repository_posts.get_post_by_id(post_id, db, LoadProfile.existence)
+    if post is None or post.photo_hash is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Post not found"
+        )
+    return await effect_response(post, effect, request.headers)
+
+
+@router.get(
+    "/{post_id}/similar",
+    response_model=list[PostFeedItem],
+    name="get_similar_posts",
+)
+@response_cache.cached(list[PostFeedItem], tags=(POSTS_TAG, USERS_TAG))
+async def get_similar_posts(
+    post_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+):
+    """
+    Posts with photos of similar colours and layout, "more like this".
+
+    Args:
+        post_id (int):  Database object Post.id.
+        limit (int, optional):  Number of posts, defaults to Query(10).
+        db (Session, optional):  The database session.
+    Raises:
+        HTTPException:  HTTP_404_NOT_FOUND if post or feature vector of its photo is not found.
+    Returns:
+        List[Post]:  Database objects Post, most similar first.
+    """
+    posts = await repository_posts.get_similar_posts(post_id, limit, db)
+    if posts is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Post not found"
+        )
+    return await repository_posts.attach_latest_comments(posts, db)
+
+
 @router.post(
     "/search",
     name="search_posts_by_query",
-    response_model=list[PostResponse],
+    response_model=list[PostFeedItem],
 )
 async def search_posts(
     search_schema: PostSearchSchema,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """
     Search posts by inputs.
 
+    Returns one page of posts. Token of the next page is returned in
+    X-Next-Cursor header, number of found posts in X-Total-Count header.
+    The count stops at SEARCH_COUNT_LIMIT, then X-Total-Count-Capped is "true".
+    Query is matched by full text search, results ordered by relevance
+    are paged by offset only.
+
     PostSearchSchema schema {
                             query: Optional[str] = Field(None)
-                            limit: int = 20
-                            offset: int = 0
+                            limit: int = Field(20, ge=1, le=100)
+                            offset: int = Field(0, ge=0)
+                            cursor: Optional[str] = None
                             order: Optional[OrderEnum] = OrderEnum.desc
                             order_by: Optional[OrderByEnum] = OrderByEnum.created_at
                             filter: Optional[PostFilterSchema]
@@ -118,6 +258,7 @@ async def search_posts(
     OrderByEnum schema {
                         created_at = "created_at"
                         rating = "rating"
+                        relevance = "relevance"
                         }
     OrderEnum schema {
                       asc = "asc"
@@ -131,18 +272,37 @@ async def search_posts(
 
     Args:
         input (PostSearchSchema):  Schema.
+        response (Response):  Response.
         db (Session):  The database session.
+    Raises:
+        HTTPException:  HTTP_400_BAD_REQUEST
     Returns:
         List[Post]:  List of Database objects Post.
     """    
-    return await repository_posts.search_posts_by_inputs(search_schema, db)
+    if search_schema.cursor:
+        page = PostCursor.from_token(search_schema.cursor)
+    elif search_schema.order_by == OrderByEnum.relevance:
+        page = None
+    else:
+        page = PostCursor(search_schema.order_by, search_schema.order)
+    expression = await repository_posts.build_search_expression(search_schema, db)
+    posts = await repository_posts.search_posts_by_inputs(search_schema, db, page, expression)
+    await repository_posts.attach_latest_comments(posts, db)
+    if page:
+        __set_next_cursor(response, page.next_token(posts, search_schema.limit))
+
+    total = await repository_posts.count_posts_by_inputs(search_schema, db, expression=expression)
+    response.headers["X-Total-Count"] = str(total)
+    if total >= repository_posts.SEARCH_COUNT_LIMIT:
+        response.headers["X-Total-Count-Capped"] = "true"
+    return posts
 
 
 @router.post(
     "/create",
     name="create_post",
     response_model=PostCreateResponse,
-    status_code=status.HTTP_201_CREATED,
+    status_code=status.HTTP_202_ACCEPTED,
 )
 async def create_post(
     description: str,
@@ -155,6 +315,9 @@ async def create_post(
     """
     Create new post
 
+    Post is returned with status pending, photo_url is set when the
+    background upload is done and status becomes ready.
+
     Args:
         description (str):  Description for Post.
         tags (str, optional):  Tags for Post.
@@ -163,7 +326,8 @@ async def create_post(
         db (Session, optional):  The database session.
         user (User, optional):  Current user.
     Raises:
-        HTTPException:  HTTP_403_FORBIDDEN
+        HTTPException:  HTTP_403_FORBIDDEN, HTTP_409_CONFLICT, HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            HTTP_415_UNSUPPORTED_MEDIA_TYPE, HTTP_503_SERVICE_UNAVAILABLE
     Returns:
         Post:  Database object Post.
     """    
@@ -179,6 +343,171 @@ async def create_post(
     return new_post
 
 
+@router.post(
+    "/uploads",
+    name="create_upload_session",
+    response_model=UploadSessionResponse,
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_upload_session(
+    body: UploadSessionCreate,
+    user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Start resumable upload of a photo for a new post.
+
+    The photo is sent in numbered chunks of chunk_size with def put_upload_chunk,
+    in any order and again after a failure, then turned into a post with
+    def finalize_upload_session.
+
+    Args:
+        body (UploadSessionCreate):  Size and name of the photo.
+        user (User, optional):  Current user.
+    Raises:
+        HTTPException:  HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    Returns:
+        UploadSessionResponse:  Session.
+    """
+    store = get_upload_sessions()
+    session = await run_in_threadpool(store.create, user.id, body.size, body.filename)
+    return await run_in_threadpool(__session_response, session)
+
+
+@router.get(
+    "/uploads/{upload_id}",
+    name="get_upload_session",
+    response_model=UploadSessionResponse,
+)
+async def get_upload_session(
+    upload_id: str,
+    user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Get resumable upload session, received tells which chunks to send after a failure.
+
+    Args:
+        upload_id (str):  Upload session id.
+        user (User, optional):  Current user.
+    Raises:
+        HTTPException:  HTTP_404_NOT_FOUND
+    Returns:
+        UploadSessionResponse:  Session.
+    """
+    session = await run_in_threadpool(get_upload_sessions().get, upload_id, user.id)
+    return await run_in_threadpool(__session_response, session)
+
+
+@router.put(
+    "/uploads/{upload_id}/chunks/{index}",
+    name="put_upload_chunk",
+    response_model=UploadSessionResponse,
+)
+async def put_upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    offset: int = Query(),
+    user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Store chunk of resumable upload, the request body is the chunk.
+
+    Args:
+        upload_id (str):  Upload session id.
+        index (int):  Chunk number, from 0.
+        request (Request):  Request.
+        offset (int):  Offset of chunk in the photo, index * chunk_size.
+        user (User, optional):  Current user.
+    Raises:
+        HTTPException:  HTTP_404_NOT_FOUND, HTTP_409_CONFLICT, HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    Returns:
+        UploadSessionResponse:  Session.
+    """
+    store = get_upload_sessions()
+    session = await run_in_threadpool(store.get, upload_id, user.id)
+    data = bytearray()
+    async for piece in request.stream():
+        data += piece
+        if len(data) > session.chunk_size:
+            raise UploadTooLarge(session.chunk_size)
+    await run_in_threadpool(store.write_chunk, session, index, offset, bytes(data))
+    return await run_in_threadpool(__session_response, session)
+
+
+@router.post(
+    "/uploads/{upload_id}/finalize",
+    name="finalize_upload_session",
+    response_model=PostCreateResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def finalize_upload_session(
+    upload_id: str,
+    description: str,
+    tags: str = None,
+    db: Session = Depends(get_db),
+    user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Create post with photo of complete resumable upload, like def create_post.
+
+    Args:
+        upload_id (str):  Upload session id.
+        description (str):  Description for Post.
+        tags (str, optional):  Tags for Post.
+        db (Session, optional):  The database session.
+        user (User, optional):  Current user.
+    Raises:
+        HTTPException:  HTTP_404_NOT_FOUND, HTTP_409_CONFLICT, HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            HTTP_415_UNSUPPORTED_MEDIA_TYPE, HTTP_503_SERVICE_UNAVAILABLE
+    Returns:
+        Post:  Database object Post.
+    """
+    return await repository_posts.create_post_from_session(upload_id, description, tags, user, db)
+
+
+@router.delete(
+    "/uploads/{upload_id}",
+    name="delete_upload_session",
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def delete_upload_session(
+    upload_id: str,
+    user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Abandon resumable upload and remove its chunks.
+
+    Args:
+        upload_id (str):  Upload session id.
+        user (User, optional):  Current user.
+    Raises:
+        HTTPException:  HTTP_404_NOT_FOUND
+    """
+    store = get_upload_sessions()
+    session = await run_in_threadpool(store.get, upload_id, user.id)
+    await run_in_threadpool(store.discard, session)
+
+
+def __session_response(session: UploadSession) -> UploadSessionResponse:
+    """
+    Internal function for the upload session routes, blocking.
+
+    Args:
+        session (UploadSession):  Session.
+    Returns:
+        UploadSessionResponse:  Session with received chunks and expiry.
+    """
+    return UploadSessionResponse(
+        upload_id=session.upload_id,
+        size=session.size,
+        chunk_size=session.chunk_size,
+        chunks=session.chunks,
+        received=session.received(),
+        expires_at=get_upload_sessions().expires_at(session),
+    )
+
+
 @router.put(
     "/{post_id}",
     response_model=PostResponse,
@@ -212,7 +541,7 @@ async def update_post(
     Returns:
         Post:  Updated database object Post.
     """
-    post = await repository_posts.get_post_by_id(post_id, db)
+    post = await repository_posts.get_post_by_id(post_id, db, LoadProfile.feed)
     if post is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Post not found"
@@ -258,7 +587,7 @@ async def delete_post(
     Returns:
         Post:  Database object Post.
     """    
-    post = await repository_posts.get_post_by_id(post_id, db)
+    post = await repository_posts.get_post_by_id(post_id, db, LoadProfile.existence)
     if post is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Post not found"
@@ -299,16 +628,19 @@ async def rate_post(post_id: int, rating: int, db: Session = Depends(get_db), us
             status_code=status.HTTP_406_NOT_ACCEPTABLE,
             detail="Rating values in range 1-5",
         )
-    post = db.query(Post).filter_by(id=post_id).first()
+    post = await repository_posts.get_post_by_id(post_id, db, LoadProfile.existence)
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Post not found"
         )
-    if post.user == user:
+    if post.user_id == user.id:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="Owner can't rate his post"
         )
-    if db.query(Rating).filter(Rating.post == post, Rating.user == user).first():
+    rated = await maybe_await(db.execute(
+        select(Rating.id).where(Rating.post_id == post.id, Rating.user_id == user.id).limit(1)
+    ))
+    if rated.first():
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="Post already rated"
         )
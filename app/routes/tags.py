@@ -1,6 +1,7 @@
 from fastapi import (APIRouter,
                      Depends,
                      HTTPException,
+                     Query,
                      status)
 from sqlalchemy.orm import Session
 
@@ -10,12 +11,15 @@ from app.repository.tags import (get_tags,
                                  create_tag_in_db,
                                  get_tag_by_id,
                                  get_list_of_tags_by_string)
-from app.schemas.tags import TagDB, TagModel
+from app.schemas.tags import TagDB, TagModel, TagSuggestResponse
+from app.services.cache import TAGS_TAG, response_cache
+from app.services.tag_index import TagSuggestion, suggest_tags
 
 router = APIRouter(prefix="/tags", tags=["tags"])
 
 
 @router.get("/all_tags/",response_model=list[TagDB])
+@response_cache.cached(list[TagDB], tags=(TAGS_TAG,))
 async def get_all_tags(db: Session = Depends(get_db)) -> list[Tag]:
     """
     Return all tags from db
@@ -28,6 +32,26 @@ async def get_all_tags(db: Session = Depends(get_db)) -> list[Tag]:
     return await get_tags(db=db)
 
 
+@router.get("/suggest", response_model=list[TagSuggestResponse])
+async def suggest_tags_by_query(q: str = Query(min_length=1, max_length=32),
+                                limit: int = Query(10, ge=1, le=50),
+                                db: Session = Depends(get_db)) -> list[TagSuggestion]:
+    """
+    Tags autocomplete.
+
+    Tags are ranked by trigram similarity to query, prefix match and
+    number of posts. Search runs in the in-process tag index.
+
+    Args:
+        q (str):  Beginning or part of tag.
+        limit (int, optional):  Number of tags, defaults to 10.
+        db (Session, optional):  The database session.
+    Returns:
+        list[TagSuggestion]:  Tags, best first.
+    """
+    return await suggest_tags(q, limit, db)
+
+
 @router.get("/tag_value/{text}",response_model=TagDB)
 async def search_tag_by_text(text:str, db: Session = Depends(get_db)) -> Tag | None:
     """
@@ -0,0 +1,56 @@
+from typing import Dict, Optional
+
+from pydantic import BaseModel
+
+
+class PoolStats(BaseModel):
+    pool: str
+    checkouts: int
+    checkins: int
+    connects: int
+    invalidations: int
+    timeouts: int
+    wait_avg_ms: float
+    wait_max_ms: float
+    size: Optional[int] = None
+    checked_in: Optional[int] = None
+    checked_out: Optional[int] = None
+    overflow: Optional[int] = None
+
+
+class DbPoolResponse(BaseModel):
+    pid: int
+    pools: Dict[str, PoolStats]
+
+
+class Histogram(BaseModel):
+    buckets: Dict[str, int]
+    sum: float
+    count: int
+
+
+class RouteQueryStats(BaseModel):
+    statements: Histogram
+    db_seconds: Histogram
+    repeated: int
+
+
+class QueriesResponse(BaseModel):
+    routes: Dict[str, RouteQueryStats]
+
+
+class UploadStats(BaseModel):
+    count: int
+    errors: int
+    rejected: int
+    wait_avg_ms: float
+    wait_max_ms: float
+    duration_avg_ms: float
+    duration_max_ms: float
+
+
+class UploadsResponse(BaseModel):
+    workers: int
+    queue_size: int
+    pending: int
+    uploads: Dict[str, UploadStats]
@@ -1,11 +1,11 @@
 from pydantic import BaseModel, Field, field_validator
 from datetime import datetime, date
-from typing import List, Optional
+from typing import Dict, List, Optional
 from enum import Enum
 
 
 from app.schemas.user import UserDb, PublicUserResponse
-from app.models import Tag
+from app.models import Tag, PostStatus
 
 from app.schemas.comments import Comment
 from app.schemas.tags import TagDB
@@ -27,20 +27,24 @@ class PostCreateResponse(BaseModel):
     user: UserDb
     description: str
     tags: List[TagDB]
+    status: PostStatus
+    duplicate_of_id: int | None = None
 
     class Config:
         from_attributes = True
 
 
-class PostResponse(PostCreateResponse):
+class PostSummary(PostCreateResponse):
     created_at: str
     updated_at: str | None
     comments_count: int
     tags: List[str]
-    comments: List[Comment]
     rating: int | None
     user_id: int
     user: PublicUserResponse
+    variants: Dict[str, Dict[str, str]] | None = None
+    blurhash: str | None = None
+    dominant_color: str | None = None
 
     @field_validator("created_at", mode="before")
     def parse_created_at(cls, value: datetime):
@@ -61,6 +65,33 @@ class PostResponse(PostCreateResponse):
         from_attributes = True
 
 
+class PostResponse(PostSummary):
+    comments: List[Comment]
+
+
+class PostFeedItem(PostSummary):
+    # newest first, see app.repository.posts.attach_latest_comments
+    latest_comments: List[Comment] = []
+
+
+class UploadSessionCreate(BaseModel):
+    size: int = Field(gt=0)
+    filename: str | None = Field(None, max_length=255)
+
+
+class UploadSessionResponse(BaseModel):
+    upload_id: str
+    size: int
+    chunk_size: int
+    chunks: int
+    received: List[int]
+    expires_at: datetime
+
+
+class DuplicateCluster(BaseModel):
+    post_ids: List[int]
+
+
 class RatingResponce(BaseModel):
     post_id: int
     rating: float
@@ -69,6 +100,13 @@ class RatingResponce(BaseModel):
 class OrderByEnum(str, Enum):
     created_at = "created_at"
     rating = "rating"
+    relevance = "relevance"
+
+
+class FeedOrderByEnum(str, Enum):
+    # feeds have no query to be relevant to, see OrderByEnum for search
+    created_at = "created_at"
+    rating = "rating"
 
 
 class OrderEnum(str, Enum):
@@ -84,8 +122,9 @@ class PostFilterSchema(BaseModel):
 
 class PostSearchSchema(BaseModel):
     query: Optional[str] = Field(None, min_length=3, max_length=255)
-    limit: int = 20
-    offset: int = 0
+    limit: int = Field(20, ge=1, le=100)
+    offset: int = Field(0, ge=0)
+    cursor: Optional[str] = None
     order: Optional[OrderEnum] = OrderEnum.desc
     order_by: Optional[OrderByEnum] = OrderByEnum.created_at
     filter: Optional[PostFilterSchema]
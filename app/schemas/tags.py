@@ -10,3 +10,8 @@ class TagDB(TagModel):
 
     class Config:
         from_attributes = True
+
+
+class TagSuggestResponse(TagDB):
+    posts_count: int
+    score: float
@@ -0,0 +1,95 @@
+import logging
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from app.conf.config import settings
+from app.services.duplicates import dhash
+from app.services.placeholders import blurhash, dominant_color
+from app.services.similarity import feature_vector
+from app.services.variants import VARIANT_FORMATS, VARIANT_WIDTHS, render_variants, variant_pool
+
+logger = logging.getLogger(__name__)
+
+# side of the thumbnail hashes, features and placeholders are computed from
+ANALYSIS_SIZE = 128
+
+
+@dataclass
+class PhotoAnalysis:
+    phash: str
+    vector: np.ndarray
+    blurhash: str
+    dominant_color: str
+    variants: Dict[Tuple[int, str], bytes] = field(default_factory=dict)
+
+
+def analyse_photo(source: bytes | str,
+                  widths: Iterable[int] = (),
+                  formats: Iterable[str] = VARIANT_FORMATS,
+                  quality: int = 80) -> PhotoAnalysis:
+    """
+    Decode photo once and compute everything the app keeps of it.
+
+    Runs in a worker process of app.services.variants.VariantPool. JPEG is
+    decoded at reduced scale when the widest variant allows it, the
+    perceptual hash, feature vector and placeholder are computed from one
+    small thumbnail of the decoded photo.
+
+    Args:
+        source (bytes | str):  Photo or its path, the worker process opens it itself.
+        widths (Iterable[int], optional):  Widths of variants, photos are never upscaled.
+        formats (Iterable[str], optional):  "webp" and/or "jpeg".
+        quality (int, optional):  Encoder quality of variants.
+    Raises:
+        PIL.UnidentifiedImageError:  source is not an image.
+    Returns:
+        PhotoAnalysis:  Hash, vector, placeholder and (width, format) -> encoded variant.
+    """
+    with Image.open(BytesIO(source) if isinstance(source, bytes) else source) as original:
+        widths = [width for width in set(widths) if width < original.width]
+        size = max(widths + [ANALYSIS_SIZE])
+        original.draft("RGB", (size, round(size * original.height / original.width)))
+        image = ImageOps.exif_transpose(original).convert("RGB")
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE), Image.Resampling.BOX)
+    return PhotoAnalysis(phash=dhash(thumbnail),
+                         vector=feature_vector(thumbnail),
+                         blurhash=blurhash(thumbnail),
+                         dominant_color=dominant_color(thumbnail),
+                         variants=render_variants(image, widths, formats, quality))
+
+
+async def analyse_upload(path: str, variants: bool = True) -> PhotoAnalysis | None:
+    """
+    Analyse spooled photo in a worker process, see def analyse_photo.
+
+    Args:
+        path (str):  Spooled photo.
+        variants (bool, optional):  False skips variants, e.g. for a duplicate check.
+    Returns:
+        PhotoAnalysis | None:  Analysis, None if file is not an image.
+    """
+    widths = VARIANT_WIDTHS if variants else ()
+    try:
+        return await variant_pool.run(analyse_photo, path, widths, VARIANT_FORMATS, settings.variant_quality)
+    except (OSError, ValueError, Image.DecompressionBombError) as err:
+        logger.warning("Photo %s is not analysed: %s", path, err)
+        return None
+
+
+async def photo_phash(path: str) -> str | None:
+    """
+    Perceptual hash of spooled photo, computed in a worker process.
+
+    Args:
+        path (str):  Spooled photo.
+    Returns:
+        str | None:  Hash as hex, None if file is not an image.
+    """
+    analysis = await analyse_upload(path, variants=False)
+    return analysis.phash if analysis is not None else None
@@ -1,3 +1,4 @@
+import logging
 from typing import Optional
 
 from jose import JWTError, jwt
@@ -5,11 +6,14 @@ from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, UTC
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
 
-from app.models import get_db
+from app.models import User, Role, get_db, maybe_await
 from app.repository import users as repository_users
 from app.conf.config import settings
+from app.services.cache import user_cache
+
+logger = logging.getLogger(__name__)
 
 
 class Auth:
@@ -142,6 +146,9 @@ class Auth:
         """
         Get the current user from token
 
+        User is looked up by email in user_cache first and read from
+        the database only on a miss.
+
         Args:
             token (str, optional): The JWT token. Defaults to Depends(oauth2_scheme).
             db (Session, optional): The database session. Defaults to Depends(get_db).
@@ -160,7 +167,6 @@ class Auth:
 
         try:
             # Decode JWT
-            print(f"#S get_current_user --- start decode token")
             payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             if payload["scope"] == "access_token":
                 email = payload["sub"]
@@ -171,19 +177,42 @@ class Auth:
         except JWTError:
             raise credentials_exception
 
-        print("#S get_current_user --- start get_user_by_email")
+        snapshot = await user_cache.get(email)
+        if snapshot is not None:
+            if snapshot["banned"]:
+                raise self.__banned_exception()
+            return await self.__user_from_snapshot(snapshot, db)
+
         user = await repository_users.get_user_by_email(email, db)
-        print(f"#S get_current_user --- user: {user.email}")
         if user is None:
             raise credentials_exception
+        await user_cache.set(user)
         if user.banned:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You are banned from the system",
-            )
+            raise self.__banned_exception()
 
         return user
 
+    @staticmethod
+    def __banned_exception() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are banned from the system",
+        )
+
+    @staticmethod
+    async def __user_from_snapshot(snapshot: dict, db: Session) -> User:
+        """
+        Attach cached snapshot to session as persistent User without a query.
+
+        Fields missing in snapshot are loaded from the database on first access
+        with Session, AsyncSession can't load them.
+        """
+        user = User(**{**snapshot,
+                       "role": Role(snapshot["role"]),
+                       "created_at": datetime.fromisoformat(snapshot["created_at"])})
+        make_transient_to_detached(user)
+        return await maybe_await(db.merge(user, load=False))
+
     async def get_email_from_token(self, token: str) -> str:
         """
         Get email from token
@@ -202,7 +231,7 @@ class Auth:
             email = payload["sub"]
             return email
         except JWTError as e:
-            print(e)
+            logger.info("Invalid email token: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                 detail="Invalid token for email verification",
@@ -0,0 +1,388 @@
+import functools
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from datetime import date
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, Set, Tuple
+
+import redis.asyncio as redis
+from fastapi import Response
+from pydantic import TypeAdapter
+from redis.exceptions import RedisError
+
+from app.conf.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# invalidation tags, formatted with keyword arguments of cached route
+POSTS_TAG = "posts"
+POST_TAG = "post:{post_id}"
+COMMENTS_TAG = "comments:{post_id}"
+TAGS_TAG = "tags"
+USERS_TAG = "users"
+
+# headers of a cached response which are not replayed
+_SKIP_HEADERS = {"content-length", "content-type"}
+
+
+class CacheBackend:
+    """
+    Storage of serialized responses with invalidation by tags.
+    """
+
+    async def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: int, tags: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    async def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process LRU cache, for tests and single node setups.
+
+    Keeps at most max_entries responses, the least recently used one is
+    evicted first.
+    """
+
+    def __init__(self, max_entries: int = settings.cache_max_entries):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, Tuple[float, bytes, Tuple[str, ...]]] = OrderedDict()
+        self._tags: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: int, tags: Iterable[str]) -> None:
+        self._drop(key)
+        tags = tuple(tags)
+        self._entries[key] = (time.monotonic() + ttl, value, tags)
+        for tag in tags:
+            self._tags[tag].add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    async def delete(self, key: str) -> None:
+        self._drop(key)
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            for key in self._tags.pop(tag, ()):
+                self._drop(key)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self._tags.clear()
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Redis cache shared by all workers.
+
+    Every tag is a Redis set of keys cached with it. Redis errors are logged
+    and treated as cache misses, so requests still work without Redis.
+    """
+
+    def __init__(self, client: redis.Redis, prefix: str = "cache"):
+        self.client = client
+        self.prefix = prefix
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}:tag:{tag}"
+
+    async def get(self, key: str) -> bytes | None:
+        try:
+            return await self.client.get(key)
+        except RedisError as err:
+            logger.warning("Cache get failed: %s", err)
+            return None
+
+    async def set(self, key: str, value: bytes, ttl: int, tags: Iterable[str]) -> None:
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.set(key, value, ex=ttl)
+                for tag in tags:
+                    pipe.sadd(self._tag_key(tag), key)
+                    pipe.expire(self._tag_key(tag), ttl)
+                await pipe.execute()
+        except RedisError as err:
+            logger.warning("Cache set failed: %s", err)
+
+    async def delete(self, key: str) -> None:
+        try:
+            await self.client.delete(key)
+        except RedisError as err:
+            logger.warning("Cache delete failed: %s", err)
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        tag_keys = [self._tag_key(tag) for tag in tags]
+        if not tag_keys:
+            return
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                for tag_key in tag_keys:
+                    pipe.smembers(tag_key)
+                members = await pipe.execute()
+            keys = set().union(*members)
+            await self.client.delete(*keys, *tag_keys)
+        except RedisError as err:
+            logger.warning("Cache invalidation failed: %s", err)
+
+    async def clear(self) -> None:
+        try:
+            keys = [key async for key in self.client.scan_iter(f"{self.prefix}:*")]
+            if keys:
+                await self.client.delete(*keys)
+        except RedisError as err:
+            logger.warning("Cache clear failed: %s", err)
+
+
+def create_backend(prefix: str = "cache", max_entries: int = settings.cache_max_entries) -> CacheBackend:
+    """
+    Cache backend selected by settings.cache_backend.
+
+    Args:
+        prefix (str, optional):  Prefix of Redis keys.
+        max_entries (int, optional):  Size of MemoryCacheBackend.
+    Returns:
+        CacheBackend:  RedisCacheBackend for "redis", MemoryCacheBackend otherwise.
+    """
+    if settings.cache_backend == "redis":
+        client = redis.Redis(host=settings.redis_host,
+                             port=settings.redis_port,
+                             socket_timeout=1,
+                             socket_connect_timeout=1)
+        return RedisCacheBackend(client, prefix)
+    return MemoryCacheBackend(max_entries)
+
+
+def _key_value(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+class ResponseCache:
+    """
+    Cache of serialized JSON responses of read endpoints.
+
+    Responses are stored for settings.redis_cache_time seconds and dropped
+    earlier when one of their tags is invalidated by the repository.
+    """
+
+    def __init__(self, backend: CacheBackend | None = None,
+                 ttl: int = settings.redis_cache_time,
+                 prefix: str = "cache"):
+        self._backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @property
+    def backend(self) -> CacheBackend:
+        if self._backend is None:
+            self._backend = create_backend(self.prefix)
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend: CacheBackend) -> None:
+        self._backend = backend
+
+    def key(self, name: str, params: Dict[str, Any]) -> str:
+        """
+        Cache key of endpoint call.
+
+        Args:
+            name (str):  Endpoint name.
+            params (Dict[str, Any]):  Scalar arguments of endpoint.
+        Returns:
+            str:  Key.
+        """
+        raw = json.dumps(params, sort_keys=True, default=str)
+        digest = hashlib.sha1(raw.encode()).hexdigest()
+        return f"{self.prefix}:{name}:{digest}"
+
+    async def invalidate(self, *tags: str) -> None:
+        """
+        Drop cached responses with any of tags.
+
+        Args:
+            tags (str):  Tags.
+        """
+        await self.backend.invalidate(tags)
+
+    async def clear(self) -> None:
+        """
+        Drop all cached responses.
+        """
+        await self.backend.clear()
+
+    def cached(self, response_model: Any, tags: Iterable[str] = (), ttl: int | None = None) -> Callable:
+        """
+        Decorator of route to cache its response.
+
+        Key is built from scalar arguments of route (path and query
+        parameters), so the response must not depend on the current user.
+        Tags are formatted with the same arguments, e.g. POST_TAG.
+        Headers set on injected Response are cached with body.
+
+        Args:
+            response_model (Any):  Response model of route, used to serialize result.
+            tags (Iterable[str], optional):  Invalidation tags.
+            ttl (int | None, optional):  Seconds, defaults to ResponseCache.ttl.
+        Returns:
+            Callable:  Decorator.
+        """
+        adapter = TypeAdapter(response_model)
+        tags = tuple(tags)
+
+        def decorator(func: Callable) -> Callable:
+            name = f"{func.__module__}.{func.__name__}"
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                params = {arg: _key_value(value) for arg, value in kwargs.items()
+                          if isinstance(value, (str, int, float, bool, Enum, date)) or value is None}
+                key = self.key(name, params)
+
+                cached = await self.backend.get(key)
+                metrics.inc("cache_requests_total", cache=self.prefix, result="miss" if cached is None else "hit")
+                if cached is not None:
+                    entry = json.loads(cached)
+                    return self.__response(entry["body"].encode(), entry["headers"], "HIT")
+
+                result = await func(*args, **kwargs)
+                if isinstance(result, Response):
+                    return result
+                body = adapter.dump_json(adapter.validate_python(result, from_attributes=True), by_alias=True)
+                headers = {}
+                for value in kwargs.values():
+                    if isinstance(value, Response):
+                        headers.update((header, header_value) for header, header_value in value.headers.items()
+                                       if header not in _SKIP_HEADERS)
+                entry = {"body": body.decode(), "headers": headers}
+                await self.backend.set(key,
+                                       json.dumps(entry).encode(),
+                                       ttl or self.ttl,
+                                       [tag.format(**params) for tag in tags])
+                return self.__response(body, headers, "MISS")
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def __response(body: bytes, headers: Dict[str, str], status: str) -> Response:
+        response = Response(content=body, media_type="application/json", headers=headers)
+        response.headers["X-Cache"] = status
+        return response
+
+
+response_cache = ResponseCache()
+
+
+class UserCache:
+    """
+    Short lived snapshots of authenticated users, keyed by email.
+
+    Snapshot keeps the fields checked on every request (id, email, role,
+    banned, confirmed) and the public profile, but no password or tokens.
+    The repository drops it at once when one of them may change, so bans
+    take effect on the next request.
+    """
+
+    FIELDS = ("id", "email", "role", "banned", "confirmed",
+              "first_name", "last_name", "avatar", "created_at")
+
+    def __init__(self, backend: CacheBackend | None = None,
+                 ttl: int = settings.user_cache_ttl,
+                 prefix: str = "user"):
+        self._backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @property
+    def backend(self) -> CacheBackend:
+        if self._backend is None:
+            self._backend = create_backend(self.prefix)
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend: CacheBackend) -> None:
+        self._backend = backend
+
+    def key(self, email: str) -> str:
+        return f"{self.prefix}:{email}"
+
+    async def get(self, email: str) -> Dict[str, Any] | None:
+        """
+        Snapshot of user.
+
+        Args:
+            email (str):  User.email.
+        Returns:
+            Dict[str, Any] | None:  Snapshot or None if it is not cached.
+        """
+        cached = await self.backend.get(self.key(email))
+        metrics.inc("cache_requests_total", cache=self.prefix, result="miss" if cached is None else "hit")
+        if cached is None:
+            return None
+        return json.loads(cached)
+
+    async def set(self, user: Any) -> None:
+        """
+        Store snapshot of user.
+
+        Args:
+            user (User):  Database object User.
+        """
+        snapshot = {field: _key_value(getattr(user, field)) for field in self.FIELDS}
+        await self.backend.set(self.key(user.email), json.dumps(snapshot).encode(), self.ttl, ())
+
+    async def invalidate(self, email: str) -> None:
+        """
+        Drop snapshot of user.
+
+        Args:
+            email (str):  User.email.
+        """
+        await self.backend.delete(self.key(email))
+
+
+user_cache = UserCache()
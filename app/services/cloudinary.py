@@ -4,11 +4,14 @@ from pathlib import Path
 
 import cloudinary
 import cloudinary.uploader
+import requests
 from fastapi import UploadFile
 
 from app.models import Post
 from app.models import User
 from app.services.gravatar import get_gravatar
+from app.services.storage import StorageBackend, StoredFile, get_storage
+from app.services.uploads import UploadQueueFull, upload_executor
 # from app.conf import config
 from app.conf.config import settings
 
@@ -28,6 +31,10 @@ cloudinary.config(
 class Effect(enum.Enum):
     sepia = "sepia"
     grayscale = "grayscale"
+    blur = "blur"
+    sharpen = "sharpen"
+    contrast = "contrast"
+    vignette = "vignette"
 
 
 CLOUDINARY_FOLDER = "project_web21"
@@ -36,50 +43,88 @@ CLOUDINARY_FOLDER = "project_web21"
 # photo: project_web21/user_id/photos/post_id - name phone post_id
 
 
+class CloudinaryStorage(StorageBackend):
+    """
+    Photos in Cloudinary, public id is the Cloudinary public id.
+    """
+
+    def upload(self, file, public_id: str) -> StoredFile:
+        res = cloudinary.uploader.upload(file, public_id=public_id, overwrite=True)
+        return StoredFile(public_id=res.get("public_id", public_id),
+                          url=res.get("secure_url", None),
+                          version=res.get("version"))
+
+    def delete(self, public_id: str) -> None:
+        cloudinary.uploader.destroy(public_id)
+
+    def read(self, public_id: str) -> bytes:
+        response = requests.get(self.url(public_id, secure=True), timeout=30)
+        response.raise_for_status()
+        return response.content
+
+    def url(self, public_id: str, **options) -> str:
+        return cloudinary.CloudinaryImage(public_id).build_url(**options)
+
+    def transform(self, public_id: str, effect: str) -> str:
+        return self.url(public_id, transformation=[{"effect": effect}])
+
+
 async def upload_avatar(
     img_file: UploadFile,
     user: User,
 ):
     """
-    Upload user avatar.
+    Upload user avatar to storage.
+
+    Upload runs in upload_executor.
 
     Args:
         img_file (UploadFile):  New picture.
         user (User):  Database object User
+    Raises:
+        UploadQueueFull:  HTTP_429_TOO_MANY_REQUESTS
     Returns:
         str:  Cloudinary URL
     """    
     public_id = f"{CLOUDINARY_FOLDER}/{user.id}/avatar"
 
     try:
-        res = cloudinary.uploader.upload(
-            img_file.file, public_id=public_id, overwrite=True
-        )
-        gravatar_url = cloudinary.CloudinaryImage(public_id).build_url(
-            width=250, height=250, crop="fill", version=res.get("version")
-        )
+        gravatar_url = await upload_executor.run("upload_avatar", __upload_avatar, img_file, public_id)
+    except UploadQueueFull:
+        raise
     except Exception as err:
         gravatar_url = await get_gravatar(user.email)
 
     return gravatar_url
 
 
+def __upload_avatar(img_file: UploadFile, public_id: str) -> str:
+    """
+    Internal function for def upload_avatar
+
+    Args:
+        img_file (UploadFile):  New picture.
+        public_id (str):  Storage public id.
+    Returns:
+        str:  URL
+    """
+    storage = get_storage()
+    stored = storage.upload(img_file.file, public_id)
+    return storage.url(public_id, width=250, height=250, crop="fill", version=stored.version)
+
+
 async def delete_avatar(public_id: str):
     """
     Delete avatar
 
-    Delete pictute in Cloudinary
+    Delete pictute in storage
 
     Args:
         public_id (str):  User id
     Returns:
         None:  None
     """    
-    try:
-        res = await cloudinary.uploader.destroy(public_id)
-    except Exception as err:
-        raise err
-    return res
+    await upload_executor.run("delete_avatar", get_storage().delete, public_id)
 
 
 def upload_photo(
@@ -87,31 +132,39 @@ def upload_photo(
     post: Post,
 ):
     """
-    Upload photo to Cloudinary
+    Upload photo to storage
 
     Args:
         img_file (UploadFile):  Picture.
         post (Post):  Database object Post.
     Returns:
-        str, str:  Cloudinary URL, public id
+        str, str:  URL, public id
     """    
     public_id = f"{CLOUDINARY_FOLDER}/{post.user_id}/photos/{post.id}"
 
-    try:
-        res = cloudinary.uploader.upload(
-            img_file.file, public_id=public_id, overwrite=True
-        )
-    except Exception as err:
-        raise err
+    stored = get_storage().upload(img_file.file, public_id)
+    return stored.url, stored.public_id
+
+
+async def upload_photo_async(
+    img_file: UploadFile,
+    post: Post,
+):
+    """
+    Upload photo to storage in upload_executor.
 
-    # post.photo_public_id = res.get("public_id")
-    # post.photo = res.get("secure_url", None)
-    photo_public_id = res.get("public_id")
-    photo_url = res.get("secure_url", None)
-    return photo_url, photo_public_id
+    Args:
+        img_file (UploadFile):  Picture.
+        post (Post):  Database object Post.
+    Raises:
+        UploadQueueFull:  HTTP_429_TOO_MANY_REQUESTS
+    Returns:
+        str, str:  URL, public id
+    """
+    return await upload_executor.run("upload_photo", upload_photo, img_file, post)
 
 
-async def delete_photo(public_id: str) -> dict:
+async def delete_photo(public_id: str) -> None:
     """
     Delete photo by public id
 
@@ -120,11 +173,7 @@ async def delete_photo(public_id: str) -> dict:
     Returns:
         None:  None
     """    
-    try:
-        res = await cloudinary.uploader.destroy(public_id)
-    except Exception as err:
-        raise err
-    return res
+    await upload_executor.run("delete_photo", get_storage().delete, public_id)
 
 
 async def transform_photo(effect: Effect, post: Post) -> str:
@@ -137,11 +186,7 @@ async def transform_photo(effect: Effect, post: Post) -> str:
     Returns:
         str:  URL
     """    
-    transformation = [{"effect": effect.value}]
-    transform_url = cloudinary.CloudinaryImage(post.photo_public_id).build_url(
-        transformation=transformation
-    )
-    return transform_url
+    return await upload_executor.run("transform_photo", get_storage().transform, post.photo_public_id, effect.value)
 
 
 # res = {
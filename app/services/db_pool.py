@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+from app.services.metrics import Metrics, metrics as process_metrics
+
+
+class PoolMetrics:
+    """
+    Counters of one connection pool.
+
+    Wait time is the time spent in the pool to get a connection, including
+    opening a new one when the pool is not full.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Set all counters to zero.
+        """
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.timeouts = 0
+            self.waits = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def on_checkout(self, *args) -> None:
+        with self._lock:
+            self.checkouts += 1
+
+    def on_checkin(self, *args) -> None:
+        with self._lock:
+            self.checkins += 1
+
+    def on_connect(self, *args) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def on_invalidate(self, *args) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self, pool: Pool) -> dict:
+        """
+        Pool state and counters.
+
+        Args:
+            pool (Pool):  Connection pool.
+        Returns:
+            dict:  Stats, wait times in milliseconds.
+        """
+        with self._lock:
+            result = {
+                "pool": type(pool).__name__,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / self.waits * 1000, 3) if self.waits else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+        if isinstance(pool, QueuePool):
+            result.update(size=pool.size(),
+                          checked_in=pool.checkedin(),
+                          checked_out=pool.checkedout(),
+                          overflow=pool.overflow())
+        return result
+
+
+class _InstrumentedPoolMixin:
+    metrics: PoolMetrics | None = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.record_timeout()
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    """
+    QueuePool which measures time to get a connection.
+    """
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool which measures time to get a connection.
+    """
+
+
+pool_metrics: Dict[str, PoolMetrics] = {}
+_engines: Dict[str, Engine] = {}
+
+
+def instrument_engine(engine: Engine, name: str) -> PoolMetrics:
+    """
+    Collect metrics of engine pool under name.
+
+    Checkouts, checkins, new and invalidated connections are counted by pool
+    events, wait time only by InstrumentedQueuePool and InstrumentedAsyncQueuePool.
+
+    Args:
+        engine (Engine):  Engine, sync_engine of AsyncEngine.
+        name (str):  Name in pool_metrics.
+    Returns:
+        PoolMetrics:  Metrics of pool.
+    """
+    metrics = PoolMetrics()
+    engine.pool.metrics = metrics
+    event.listen(engine, "checkout", metrics.on_checkout)
+    event.listen(engine, "checkin", metrics.on_checkin)
+    event.listen(engine, "connect", metrics.on_connect)
+    event.listen(engine, "invalidate", metrics.on_invalidate)
+    pool_metrics[name] = metrics
+    _engines[name] = engine
+    return metrics
+
+
+def pools_stats(engines: Dict[str, Engine]) -> dict:
+    """
+    Stats of instrumented pools of this worker.
+
+    Args:
+        engines (Dict[str, Engine]):  Name in pool_metrics -> engine.
+    Returns:
+        dict:  {"pid": int, "pools": {name: stats}}
+    """
+    pools = {name: pool_metrics[name].stats(engine.pool)
+             for name, engine in engines.items()
+             if name in pool_metrics}
+    return {"pid": os.getpid(), "pools": pools}
+
+
+def collect_pool_metrics(registry: Metrics) -> None:
+    """
+    Set gauges of instrumented pools, see app.services.metrics.Metrics.add_collector.
+
+    Args:
+        registry (Metrics):  Metrics of this process.
+    """
+    for name, engine in _engines.items():
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            registry.set_gauge("db_pool_size", pool.size(), pool=name)
+            registry.set_gauge("db_pool_connections", pool.checkedout(), pool=name, state="checked_out")
+            registry.set_gauge("db_pool_connections", pool.checkedin(), pool=name, state="checked_in")
+
+
+process_metrics.add_collector(collect_pool_metrics)
@@ -0,0 +1,344 @@
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Set, Tuple
+
+from fastapi import HTTPException, status
+from PIL import Image
+from sqlalchemy import func, select, true
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.conf.config import settings
+from app.models import Post, PostDeletion, PostStatus, maybe_await
+from app.models import db as models_db
+
+logger = logging.getLogger(__name__)
+
+# dHash of HASH_SIZE x HASH_SIZE bits, stored as hex in Post.photo_phash
+HASH_SIZE = 8
+
+
+class DuplicatePhoto(HTTPException):
+    """
+    Photo is a near-duplicate of a photo of another post.
+    """
+
+    def __init__(self, post_id: int):
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Photo is a duplicate of post {post_id}",
+        )
+
+
+def dhash(image: Image.Image, size: int = HASH_SIZE) -> str:
+    """
+    Difference hash of image.
+
+    Runs in a worker process of app.services.variants.VariantPool, see
+    app.services.analysis.analyse_photo. The image is reduced to
+    (size + 1) x size grey pixels and every bit tells whether a pixel is
+    brighter than its right neighbour, so resizing, recompression and small
+    colour changes keep the hash within a few bits.
+
+    Args:
+        image (Image.Image):  Upright photo.
+        size (int, optional):  Bits per row and rows.
+    Returns:
+        str:  Hash as hex, size * size / 4 characters.
+    """
+    pixels = list(image.convert("L").resize((size + 1, size), Image.Resampling.LANCZOS).getdata())
+    value = 0
+    for row in range(size):
+        for column in range(size):
+            left = pixels[row * (size + 1) + column]
+            value = (value << 1) | int(left > pixels[row * (size + 1) + column + 1])
+    return f"{value:0{size * size // 4}x}"
+
+
+def hamming(first: int, second: int) -> int:
+    """
+    Number of different bits.
+
+    Args:
+        first (int):  Hash.
+        second (int):  Hash.
+    Returns:
+        int:  Distance.
+    """
+    return (first ^ second).bit_count()
+
+
+class _Node:
+    __slots__ = ("value", "items", "children")
+
+    def __init__(self, value: int):
+        self.value = value
+        self.items: Set[int] = set()
+        self.children: Dict[int, "_Node"] = {}
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree of hashes in Hamming space.
+
+    Every child of a node is keyed by its distance to the node, so a search
+    within radius r descends only into children keyed d - r .. d + r, where
+    d is the distance of the query to the node. That skips most of the tree
+    for small radii. Items removed from a node leave the node in place, it
+    still routes searches, and is reused when its hash is added again.
+    """
+
+    def __init__(self):
+        self._root: _Node | None = None
+
+    def add(self, value: int, item: int) -> None:
+        """
+        Add item with hash.
+
+        Args:
+            value (int):  Hash.
+            item (int):  Item, e.g. Post.id.
+        """
+        if self._root is None:
+            self._root = _Node(value)
+        node = self._root
+        while (distance := hamming(value, node.value)) != 0:
+            child = node.children.get(distance)
+            if child is None:
+                child = node.children[distance] = _Node(value)
+            node = child
+        node.items.add(item)
+
+    def remove(self, value: int, item: int) -> None:
+        """
+        Remove item with hash, if it is there.
+
+        Args:
+            value (int):  Hash the item was added with.
+            item (int):  Item.
+        """
+        node = self._root
+        while node is not None:
+            distance = hamming(value, node.value)
+            if distance == 0:
+                node.items.discard(item)
+                return
+            node = node.children.get(distance)
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """
+        Items with hash within max_distance.
+
+        Args:
+            value (int):  Hash.
+            max_distance (int):  Largest Hamming distance.
+        Returns:
+            List[Tuple[int, int]]:  (item, distance), nearest first.
+        """
+        result = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node.value)
+            if distance <= max_distance:
+                result.extend((item, distance) for item in node.items)
+            for key, child in node.children.items():
+                if distance - max_distance <= key <= distance + max_distance:
+                    stack.append(child)
+        return sorted(result, key=lambda found: (found[1], found[0]))
+
+
+class DuplicateIndex:
+    """
+    In-process index of perceptual hashes of post photos.
+
+    Index is built from the database at startup or on first lookup. Every
+    API process keeps its own copy, updated at once by writes of the process
+    itself and caught up with writes of the others before every lookup, see
+    def load_duplicate_index. last_changed and last_deleted mark how far
+    posts and their tombstones have been read, synced is the
+    time.monotonic() of the last catch up.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        """
+        Drop index, it will be rebuilt on next lookup.
+        """
+        self.built = False
+        self.last_changed: datetime | None = None
+        self.last_deleted: datetime | None = None
+        self.synced = 0.0
+        self._tree = BKTree()
+        self._hashes: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def build(self, hashes: Iterable[Tuple[int, str]]) -> None:
+        """
+        Build index.
+
+        Args:
+            hashes (Iterable[Tuple[int, str]]):  (Post.id, Post.photo_phash).
+        """
+        self.clear()
+        for post_id, phash in hashes:
+            self._add(post_id, phash)
+        self.built = True
+
+    def add(self, post_id: int, phash: str | None) -> None:
+        """
+        Add or rehash post. Does nothing until index is built.
+
+        Args:
+            post_id (int):  Database object Post.id.
+            phash (str | None):  Post.photo_phash, None only removes the post.
+        """
+        if not self.built:
+            return
+        self._remove(post_id)
+        if phash is not None:
+            self._add(post_id, phash)
+
+    def remove(self, post_id: int) -> None:
+        """
+        Remove post from index.
+
+        Args:
+            post_id (int):  Database object Post.id.
+        """
+        if self.built:
+            self._remove(post_id)
+
+    def find(self, phash: str, max_distance: int, exclude: int | None = None) -> List[Tuple[int, int]]:
+        """
+        Posts with photos within max_distance bits of phash.
+
+        Args:
+            phash (str):  Perceptual hash as hex.
+            max_distance (int):  Largest Hamming distance.
+            exclude (int | None, optional):  Post.id to skip, e.g. the post being updated.
+        Returns:
+            List[Tuple[int, int]]:  (Post.id, distance), nearest first.
+        """
+        return [(post_id, distance)
+                for post_id, distance in self._tree.search(int(phash, 16), max_distance)
+                if post_id != exclude]
+
+    def clusters(self, max_distance: int) -> List[List[int]]:
+        """
+        Groups of posts linked by near-duplicate photos.
+
+        Two posts are in one group when a chain of photos, each within
+        max_distance of the next, connects them.
+
+        Args:
+            max_distance (int):  Largest Hamming distance.
+        Returns:
+            List[List[int]]:  Sorted Post.id lists of two or more posts, largest group first.
+        """
+        parents = {post_id: post_id for post_id in self._hashes}
+
+        def root(post_id: int) -> int:
+            while parents[post_id] != post_id:
+                parents[post_id] = parents[parents[post_id]]
+                post_id = parents[post_id]
+            return post_id
+
+        for post_id, value in self._hashes.items():
+            for other, _ in self._tree.search(value, max_distance):
+                parents[root(other)] = root(post_id)
+
+        groups: Dict[int, List[int]] = {}
+        for post_id in sorted(self._hashes):
+            groups.setdefault(root(post_id), []).append(post_id)
+        return sorted((group for group in groups.values() if len(group) > 1),
+                      key=lambda group: (-len(group), group[0]))
+
+    def _add(self, post_id: int, phash: str) -> None:
+        value = int(phash, 16)
+        self._hashes[post_id] = value
+        self._tree.add(value, post_id)
+
+    def _remove(self, post_id: int) -> None:
+        value = self._hashes.pop(post_id, None)
+        if value is not None:
+            self._tree.remove(value, post_id)
+
+
+duplicate_index = DuplicateIndex()
+
+
+async def load_duplicate_index(db: Session, index: DuplicateIndex | None = None) -> DuplicateIndex:
+    """
+    Build index from the database, or catch it up with posts written by other processes.
+
+    Posts with failed uploads are left out. A built index reads only the
+    posts whose Post.phash_changed_at and the PostDeletion tombstones whose
+    deleted_at are later than index.last_changed and index.last_deleted,
+    both are indexed. The last settings.duplicate_sync_overlap seconds are
+    read again, as a transaction may commit after later ones. An index not
+    caught up for settings.duplicate_deletions_ttl seconds may have missed
+    pruned tombstones, it is built again.
+
+    Args:
+        db (Session):  The database session.
+        index (DuplicateIndex | None, optional):  Index, defaults to duplicate_index.
+    Returns:
+        DuplicateIndex:  Index.
+    """
+    index = index if index is not None else duplicate_index
+    synced = time.monotonic()
+    if index.built and synced - index.synced < settings.duplicate_deletions_ttl:
+        overlap = timedelta(seconds=settings.duplicate_sync_overlap)
+        deleted = (PostDeletion.deleted_at >= index.last_deleted - overlap if index.last_deleted is not None
+                   else true())
+        deletions = (await maybe_await(db.execute(
+            select(PostDeletion.post_id, PostDeletion.deleted_at).where(deleted)
+        ))).all()
+        changed = (Post.phash_changed_at >= index.last_changed - overlap if index.last_changed is not None
+                   else true())
+        rows = (await maybe_await(db.execute(
+            select(Post.id, Post.photo_phash, Post.status, Post.phash_changed_at).where(changed)
+        ))).all()
+        # a post still in the database was created after any tombstone of its id
+        for post_id, _ in deletions:
+            index.remove(post_id)
+        for post_id, phash, post_status, _ in rows:
+            index.add(post_id, phash if post_status != PostStatus.failed else None)
+        # a mark never moves back, e.g. when its own post was deleted
+        index.last_changed = max(filter(None, [index.last_changed, *(row[3] for row in rows)]), default=None)
+        index.last_deleted = max(filter(None, [index.last_deleted, *(row[1] for row in deletions)]), default=None)
+    else:
+        # marks first, a change committed meanwhile is read again by the next catch up
+        last_changed = await maybe_await(db.scalar(select(func.max(Post.phash_changed_at))))
+        last_deleted = await maybe_await(db.scalar(select(func.max(PostDeletion.deleted_at))))
+        rows = (await maybe_await(db.execute(
+            select(Post.id, Post.photo_phash)
+            .where(Post.photo_phash.isnot(None), Post.status != PostStatus.failed)
+        ))).all()
+        index.build(rows)
+        index.last_changed, index.last_deleted = last_changed, last_deleted
+    index.synced = synced
+    return index
+
+
+async def rebuild_duplicate_index() -> None:
+    """
+    Rebuild duplicate_index at startup, so the first upload does not wait for it.
+
+    A database error is logged, the index is then built on first lookup.
+    """
+    db = models_db.AsyncSessionLocal() if settings.database_async else models_db.SessionLocal()
+    try:
+        duplicate_index.clear()
+        await load_duplicate_index(db)
+        logger.info("Duplicate index built with %s photos", len(duplicate_index))
+    except SQLAlchemyError as err:
+        logger.warning("Duplicate index is not built: %s", err)
+    finally:
+        await maybe_await(db.close())
@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import logging
+from io import BytesIO
+from typing import Callable, Dict, Mapping
+
+import numpy as np
+from fastapi import HTTPException, Response, status
+from PIL import Image, ImageOps
+
+from app.conf.config import settings
+from app.models import Post
+from app.services.cache import CacheBackend, create_backend
+from app.services.cloudinary import Effect
+from app.services.metrics import metrics
+from app.services.storage import get_storage
+from app.services.uploads import upload_executor
+from app.services.variants import variant_pool
+
+logger = logging.getLogger(__name__)
+
+# part of cache keys, change it when rendering of effects changes
+EFFECTS_VERSION = 1
+
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+_SEPIA = np.array([[0.393, 0.769, 0.189],
+                   [0.349, 0.686, 0.168],
+                   [0.272, 0.534, 0.131]], dtype=np.float32)
+
+
+def _box_blur(pixels: np.ndarray, radius: int, axis: int) -> np.ndarray:
+    """
+    Mean of 2 * radius + 1 neighbours along axis, from cumulative sums,
+    so the cost does not depend on radius.
+    """
+    padding = [(0, 0)] * pixels.ndim
+    padding[axis] = (radius + 1, radius)
+    sums = np.cumsum(np.pad(pixels, padding, mode="edge"), axis=axis, dtype=np.float32)
+    width = 2 * radius + 1
+    upper = [slice(None)] * pixels.ndim
+    lower = [slice(None)] * pixels.ndim
+    upper[axis] = slice(width, None)
+    lower[axis] = slice(None, -width)
+    return (sums[tuple(upper)] - sums[tuple(lower)]) / width
+
+
+def _gaussian_blur(pixels: np.ndarray, radius: int) -> np.ndarray:
+    # three box passes are close to a gaussian
+    for _ in range(3):
+        pixels = _box_blur(_box_blur(pixels, radius, 0), radius, 1)
+    return pixels
+
+
+def grayscale(pixels: np.ndarray) -> np.ndarray:
+    luma = pixels @ _LUMA
+    return np.repeat(luma[..., np.newaxis], 3, axis=2)
+
+
+def sepia(pixels: np.ndarray) -> np.ndarray:
+    return pixels @ _SEPIA.T
+
+
+def blur(pixels: np.ndarray) -> np.ndarray:
+    return _gaussian_blur(pixels, max(1, pixels.shape[1] // 200))
+
+
+def sharpen(pixels: np.ndarray) -> np.ndarray:
+    # unsharp mask
+    return pixels + (pixels - _gaussian_blur(pixels, 1))
+
+
+def contrast(pixels: np.ndarray) -> np.ndarray:
+    mean = float((pixels @ _LUMA).mean())
+    return (pixels - mean) * 1.4 + mean
+
+
+def vignette(pixels: np.ndarray) -> np.ndarray:
+    height, width = pixels.shape[:2]
+    y, x = np.ogrid[-1:1:height * 1j, -1:1:width * 1j]
+    mask = 1 - 0.6 * np.clip((x ** 2 + y ** 2) / 2, 0, 1).astype(np.float32)
+    return pixels * mask[..., np.newaxis]
+
+
+EFFECTS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    Effect.grayscale.value: grayscale,
+    Effect.sepia.value: sepia,
+    Effect.blur.value: blur,
+    Effect.sharpen.value: sharpen,
+    Effect.contrast.value: contrast,
+    Effect.vignette.value: vignette,
+}
+
+
+def render_effect(data: bytes, effect: str, max_width: int = 1600, quality: int = 80) -> bytes:
+    """
+    Apply effect to image.
+
+    Runs in a worker process of app.services.variants.VariantPool. Pixels
+    are float32 arrays, every effect is a few vectorised NumPy operations.
+
+    Args:
+        data (bytes):  Original image.
+        effect (str):  Name in EFFECTS.
+        max_width (int, optional):  Wider images are scaled down first.
+        quality (int, optional):  JPEG quality.
+    Raises:
+        PIL.UnidentifiedImageError:  data is not an image.
+    Returns:
+        bytes:  JPEG image.
+    """
+    with Image.open(BytesIO(data)) as original:
+        original.draft("RGB", (max_width, max_width * original.height // original.width))
+        image = ImageOps.exif_transpose(original).convert("RGB")
+    if image.width > max_width:
+        image = image.resize((max_width, max(1, image.height * max_width // image.width)), Image.Resampling.LANCZOS)
+
+    pixels = EFFECTS[effect](np.asarray(image, dtype=np.float32))
+    result = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+    buffer = BytesIO()
+    result.save(buffer, "JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+class EffectCache:
+    """
+    Rendered effects, addressed by SHA-256 of the photo and effect name.
+
+    The same photo with the same effect is rendered once, whoever asks for
+    it. Entries live in a cache backend, the in-memory one evicts the least
+    recently used entry, Redis should run with an LRU maxmemory-policy.
+    A render of a missing entry is shared by concurrent requests, when
+    the request which renders it is cancelled, a waiting one takes over.
+    """
+
+    def __init__(self, backend: CacheBackend | None = None,
+                 ttl: int = settings.effect_cache_ttl,
+                 prefix: str = "effect"):
+        self._backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self._renders: Dict[str, asyncio.Future] = {}
+
+    @property
+    def backend(self) -> CacheBackend:
+        if self._backend is None:
+            self._backend = create_backend(self.prefix, settings.effect_cache_max_entries)
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend: CacheBackend) -> None:
+        self._backend = backend
+
+    def key(self, photo_hash: str, effect: Effect) -> str:
+        return f"{self.prefix}:{EFFECTS_VERSION}:{photo_hash}:{effect.value}"
+
+    async def get(self, post: Post, effect: Effect, data: bytes | None = None) -> bytes:
+        """
+        Rendered effect of post photo, rendered and cached on miss.
+
+        Args:
+            post (Post):  Database object Post with photo_hash.
+            effect (Effect):  Effect.
+            data (bytes | None, optional):  Photo, read from storage if it is needed and not given.
+        Returns:
+            bytes:  JPEG image.
+        """
+        key = self.key(post.photo_hash, effect)
+        cached = await self.backend.get(key)
+        metrics.inc("cache_requests_total", cache=self.prefix, result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+
+        render = self._renders.get(key)
+        if render is not None:
+            try:
+                return await asyncio.shield(render)
+            except asyncio.CancelledError:
+                if not render.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                # the request which rendered it was cancelled, not this one
+                return await self.get(post, effect, data)
+        render = asyncio.get_running_loop().create_future()
+        self._renders[key] = render
+        try:
+            if data is None:
+                data = await upload_executor.run("read_photo", get_storage().read, post.photo_public_id)
+            rendered = await variant_pool.run(render_effect, data, effect.value,
+                                              settings.effect_max_width, settings.variant_quality)
+            render.set_result(rendered)
+        except Exception as err:
+            render.set_exception(err)
+            # nobody else may wait for it
+            render.exception()
+            raise
+        finally:
+            # e.g. CancelledError of a disconnected client, waiters must not hang
+            if not render.done():
+                render.cancel()
+            del self._renders[key]
+
+        try:
+            await self.backend.set(key, rendered, self.ttl, ())
+        except Exception as err:
+            logger.warning("Effect %s is not cached: %s", key, err)
+        return rendered
+
+
+effect_cache = EffectCache()
+
+
+def effect_url(post: Post, effect: Effect) -> str:
+    """
+    URL of effect endpoint of post.
+
+    Args:
+        post (Post):  Database object Post.
+        effect (Effect):  Effect.
+    Returns:
+        str:  URL, it serves the effect of the current photo of post.
+    """
+    return f"/api/posts/{post.id}/effects/{effect.value}"
+
+
+async def apply_effect(effect: Effect, post: Post) -> str:
+    """
+    Render effect of post photo at once, so the first view is a cache hit.
+
+    Post.photo_hash is filled for photos uploaded before it existed.
+
+    Args:
+        effect (Effect):  Effect.
+        post (Post):  Database object Post.
+    Raises:
+        HTTPException:  HTTP_400_BAD_REQUEST if photo is not an image.
+    Returns:
+        str:  Transform URL.
+    """
+    data = None
+    if post.photo_hash is None:
+        data = await upload_executor.run("read_photo", get_storage().read, post.photo_public_id)
+        post.photo_hash = hashlib.sha256(data).hexdigest()
+    try:
+        await effect_cache.get(post, effect, data)
+    except (OSError, ValueError) as err:
+        logger.warning("Effect %s of post %s failed: %s", effect.value, post.id, err)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Effect can't be applied to this photo")
+    return effect_url(post, effect)
+
+
+async def effect_response(post: Post, effect: Effect, headers: Mapping[str, str]) -> Response:
+    """
+    Response with rendered effect of post photo.
+
+    Content never changes for a key, so ETag is derived from the key and
+    a client with a copy gets 304 without a cache lookup.
+
+    Args:
+        post (Post):  Database object Post with photo_hash.
+        effect (Effect):  Effect.
+        headers (Mapping[str, str]):  Request headers.
+    Returns:
+        Response:  JPEG image or 304.
+    """
+    key = effect_cache.key(post.photo_hash, effect)
+    etag = f'"{hashlib.sha1(key.encode()).hexdigest()}"'
+    response_headers = {"etag": etag, "cache-control": "public, max-age=3600"}
+    if etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=response_headers)
+    content = await effect_cache.get(post, effect)
+    return Response(content=content, media_type="image/jpeg", headers=response_headers)
@@ -1,3 +1,4 @@
+import logging
 from pathlib import Path
 
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
@@ -6,6 +7,9 @@ from pydantic import EmailStr
 
 from app.services.auth import auth_service
 from app.conf.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 conf = ConnectionConfig(
     MAIL_USERNAME=settings.mail_username,
@@ -30,25 +34,28 @@ async def send_email(email: EmailStr, host: str):
         email (EmailStr): The email of the user to send the email to.
         host (str): The host of the application.
     """
-    try:
-        token_verification = await auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email address",
-            recipients=[email],
-            template_body={
-                "subject": "Email confirmation",
-                "host": host,
-                "username": email,
-                "token": token_verification,
-            },
-            subtype=MessageType.html,
-        )
+    with metrics.in_progress("emails_in_progress"):
+        try:
+            token_verification = await auth_service.create_email_token({"sub": email})
+            message = MessageSchema(
+                subject="Confirm your email address",
+                recipients=[email],
+                template_body={
+                    "subject": "Email confirmation",
+                    "host": host,
+                    "username": email,
+                    "token": token_verification,
+                },
+                subtype=MessageType.html,
+            )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
-        raise ConnectionErrors(err)
+            fm = FastMail(conf)
+            await fm.send_message(message, template_name="email_template.html")
+        except ConnectionErrors as err:
+            metrics.inc("emails_sent_total", result="failed")
+            logger.error("Email is not sent: %s", err)
+            raise ConnectionErrors(err)
+    metrics.inc("emails_sent_total", result="sent")
 
 
 async def send_reset_password_email(email: EmailStr, host: str):
@@ -59,22 +66,25 @@ async def send_reset_password_email(email: EmailStr, host: str):
         email (EmailStr): The email of the user to send the email to.
         host (str): The host of the application.
     """
-    try:
-        token_verification = await auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Reset your password",
-            recipients=[email],
-            template_body={
-                "subject": "Reset password",
-                "host": host,
-                "username": email,
-                "token": token_verification,
-            },
-            subtype=MessageType.html,
-        )
+    with metrics.in_progress("emails_in_progress"):
+        try:
+            token_verification = await auth_service.create_email_token({"sub": email})
+            message = MessageSchema(
+                subject="Reset your password",
+                recipients=[email],
+                template_body={
+                    "subject": "Reset password",
+                    "host": host,
+                    "username": email,
+                    "token": token_verification,
+                },
+                subtype=MessageType.html,
+            )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_reset_passwd_template.html")
-    except ConnectionErrors as err:
-        print(err)
-        raise ConnectionErrors(err)
\ No newline at end of file
+            fm = FastMail(conf)
+            await fm.send_message(message, template_name="email_reset_passwd_template.html")
+        except ConnectionErrors as err:
+            metrics.inc("emails_sent_total", result="failed")
+            logger.error("Email is not sent: %s", err)
+            raise ConnectionErrors(err)
+    metrics.inc("emails_sent_total", result="sent")
\ No newline at end of file
@@ -0,0 +1,334 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+import redis.asyncio as redis
+from fastapi import HTTPException, status
+from redis.exceptions import RedisError
+
+from app.conf.config import settings
+from app.models import db as models_db
+from app.models.db import maybe_await
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+class JobQueueUnavailable(HTTPException):
+    """
+    Job can't be put to the queue.
+    """
+
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Job queue is unavailable, try again later",
+        )
+
+
+class JobQueue:
+    """
+    FIFO queue of jobs, a job is a JSON serializable dict.
+
+    A job put with a delay is held back and joins the queue once the delay
+    has passed.
+    """
+
+    async def put(self, job: dict, delay: float = 0) -> None:
+        raise NotImplementedError
+
+    async def get(self, timeout: float) -> dict | None:
+        raise NotImplementedError
+
+    async def size(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryJobQueue(JobQueue):
+    """
+    In-process queue, for tests and single process setups.
+
+    Jobs are seen only by workers of the same process.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self):
+        self._jobs: deque[dict] = deque()
+        # (due, sequence, job), sequence keeps jobs with the same due time in order
+        self._delayed: List[Tuple[float, int, dict]] = []
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._jobs) + len(self._delayed)
+
+    async def put(self, job: dict, delay: float = 0) -> None:
+        if delay > 0:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), job))
+        else:
+            self._jobs.append(job)
+
+    async def get(self, timeout: float) -> dict | None:
+        deadline = time.monotonic() + timeout
+        while not self._promote():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(self.poll_interval, remaining))
+        return self._jobs.popleft()
+
+    async def size(self) -> int:
+        return len(self)
+
+    def _promote(self) -> int:
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._jobs.append(heapq.heappop(self._delayed)[2])
+        return len(self._jobs)
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Redis list shared by all workers.
+
+    Jobs are pushed to the head and popped from the tail with BRPOP, so
+    idle workers wait in Redis instead of polling. Delayed jobs wait in a
+    sorted set scored by due time, every get moves the due ones to the
+    list, so they are late by at most the poll timeout of a worker.
+    """
+
+    # moves due jobs from the sorted set to the list, atomically
+    PROMOTE_SCRIPT = """
+local jobs = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, job in ipairs(jobs) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('LPUSH', KEYS[2], job)
+end
+return #jobs
+"""
+
+    def __init__(self, client: redis.Redis, key: str = "jobs"):
+        self.client = client
+        self.key = key
+        self.delayed_key = f"{key}:delayed"
+        self._promote = client.register_script(self.PROMOTE_SCRIPT)
+
+    async def put(self, job: dict, delay: float = 0) -> None:
+        if delay > 0:
+            await self.client.zadd(self.delayed_key, {json.dumps(job): time.time() + delay})
+        else:
+            await self.client.lpush(self.key, json.dumps(job))
+
+    async def get(self, timeout: float) -> dict | None:
+        await self._promote(keys=[self.delayed_key, self.key], args=[time.time()])
+        if timeout <= 0:
+            item = await self.client.rpop(self.key)
+            return json.loads(item) if item is not None else None
+        item = await self.client.brpop([self.key], timeout=timeout)
+        return json.loads(item[1]) if item is not None else None
+
+    async def size(self) -> int:
+        return await self.client.llen(self.key) + await self.client.zcard(self.delayed_key)
+
+
+def create_queue(key: str = "jobs") -> JobQueue:
+    """
+    Job queue selected by settings.job_queue.
+
+    Args:
+        key (str, optional):  Redis key of the list.
+    Returns:
+        JobQueue:  RedisJobQueue for "redis", MemoryJobQueue otherwise.
+    """
+    if settings.job_queue == "redis":
+        # no socket_timeout, BRPOP blocks for the whole poll timeout
+        client = redis.Redis(host=settings.redis_host,
+                             port=settings.redis_port,
+                             socket_connect_timeout=1)
+        return RedisJobQueue(client, key)
+    return MemoryJobQueue()
+
+
+class JobWorker:
+    """
+    Runs background jobs from the queue.
+
+    Handlers are registered by name and called with their own database
+    session and the payload of the job. A failed job is put back to the
+    queue until max_attempts, then its on_failure handler is called. The
+    n-th retry waits retry_delay * 2 ** (n - 1) seconds, so a storage
+    outage is not hammered by the same jobs over and over. A retry that
+    can't be queued fails the job at once, and errors of on_failure are
+    only logged, so consumers never die with a job.
+
+    Jobs are taken off the queue before they run, a job of a crashed
+    worker is lost, see app.commands.fail_stale_uploads for its post.
+    """
+
+    poll_timeout = 1.0
+
+    def __init__(self, queue: JobQueue | None = None,
+                 concurrency: int = settings.job_concurrency,
+                 max_attempts: int = settings.job_max_attempts,
+                 retry_delay: float = settings.job_retry_delay,
+                 session_factory: Callable | None = None):
+        self._queue = queue
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.session_factory = session_factory
+        self._handlers: Dict[str, Tuple[Handler, Handler | None]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._running = False
+
+    @property
+    def queue(self) -> JobQueue:
+        if self._queue is None:
+            self._queue = create_queue()
+        return self._queue
+
+    @queue.setter
+    def queue(self, queue: JobQueue) -> None:
+        self._queue = queue
+
+    def register(self, name: str, handler: Handler, on_failure: Handler | None = None) -> None:
+        """
+        Register handler of jobs.
+
+        Args:
+            name (str):  Name of job.
+            handler (Handler):  async def handler(db, **payload).
+            on_failure (Handler | None, optional):  async def on_failure(db, **payload),
+                called when all attempts failed.
+        """
+        self._handlers[name] = (handler, on_failure)
+
+    async def enqueue(self, name: str, **payload) -> None:
+        """
+        Put job to the queue.
+
+        Args:
+            name (str):  Name of registered job.
+            payload:  JSON serializable arguments of handler.
+        Raises:
+            JobQueueUnavailable:  HTTP_503_SERVICE_UNAVAILABLE
+        """
+        try:
+            await self.queue.put({"name": name, "payload": payload, "attempts": 0})
+        except RedisError as err:
+            logger.error("Enqueue of %s failed: %s", name, err)
+            raise JobQueueUnavailable()
+
+    async def run_job(self, job: dict) -> bool:
+        """
+        Run one job.
+
+        Args:
+            job (dict):  Job from the queue.
+        Returns:
+            bool:  True if handler succeeded.
+        """
+        name = job["name"]
+        if name not in self._handlers:
+            logger.error("No handler for job %s", name)
+            return False
+        handler, on_failure = self._handlers[name]
+
+        db = self.__session()
+        try:
+            await handler(db, **job["payload"])
+            return True
+        except Exception:
+            await maybe_await(db.rollback())
+            attempts = job.get("attempts", 0) + 1
+            if attempts < self.max_attempts:
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                logger.warning("Job %s failed, attempt %s of %s, retry in %s s",
+                               name, attempts, self.max_attempts, delay, exc_info=True)
+                try:
+                    await self.queue.put({**job, "attempts": attempts}, delay=delay)
+                    return False
+                except Exception:
+                    logger.exception("Retry of job %s is not queued, giving up", name)
+            else:
+                logger.exception("Job %s failed after %s attempts", name, attempts)
+            if on_failure is not None:
+                try:
+                    await on_failure(db, **job["payload"])
+                except Exception:
+                    await maybe_await(db.rollback())
+                    logger.exception("on_failure of job %s failed", name)
+            return False
+        finally:
+            await maybe_await(db.close())
+
+    async def run_pending(self) -> int:
+        """
+        Run jobs until the queue is empty, delayed retries which are not due yet are left.
+
+        Returns:
+            int:  Number of processed jobs.
+        """
+        processed = 0
+        while (job := await self.queue.get(timeout=0)) is not None:
+            await self.run_job(job)
+            processed += 1
+        return processed
+
+    async def start(self) -> None:
+        """
+        Start concurrency consumers in the running event loop.
+        """
+        if self._running:
+            return
+        self._running = True
+        self._tasks = [asyncio.create_task(self.__consume()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        """
+        Let consumers finish their current jobs and stop them.
+        """
+        self._running = False
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def run_forever(self) -> None:
+        """
+        Consume jobs until cancelled, for a standalone worker process.
+        """
+        await self.start()
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.stop()
+
+    async def __consume(self) -> None:
+        while self._running:
+            try:
+                job = await self.queue.get(timeout=self.poll_timeout)
+            except RedisError as err:
+                logger.warning("Job queue get failed: %s", err)
+                await asyncio.sleep(self.poll_timeout)
+                continue
+            if job is not None:
+                try:
+                    await self.run_job(job)
+                except Exception:
+                    # e.g. the session can't be closed, the consumer must outlive any job
+                    logger.exception("Job %s crashed", job.get("name"))
+
+    def __session(self):
+        if self.session_factory is not None:
+            return self.session_factory()
+        if settings.database_async:
+            return models_db.AsyncSessionLocal()
+        return models_db.SessionLocal()
+
+
+job_worker = JobWorker()
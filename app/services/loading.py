@@ -0,0 +1,70 @@
+from enum import Enum
+from typing import Dict, Tuple
+
+from sqlalchemy.orm import joinedload, raiseload, selectinload
+from sqlalchemy.orm.interfaces import LoaderOption
+
+from app.models import Comment, Post
+
+
+class LoadProfile(str, Enum):
+    """
+    What a query loads with its posts.
+
+    Relationships of models are declared lazy="raise", so every query
+    names what it needs and a missing profile fails loudly in tests
+    instead of adding one SELECT per row in production.
+
+    feed:       tags and owner, no comments, see app.repository.posts.attach_latest_comments
+    detail:     tags, owner and all comments with their authors
+    existence:  columns only, for checks and updates of columns
+    admin:      detail and ratings, for moderation
+    """
+
+    feed = "feed"
+    detail = "detail"
+    existence = "existence"
+    admin = "admin"
+
+
+# many-to-one are joined into the query, collections are read with one SELECT ... IN per query
+POST_PROFILES: Dict[LoadProfile, Tuple[LoaderOption, ...]] = {
+    LoadProfile.feed: (
+        joinedload(Post.user),
+        selectinload(Post.tags),
+        raiseload("*"),
+    ),
+    LoadProfile.detail: (
+        joinedload(Post.user),
+        selectinload(Post.tags),
+        selectinload(Post.comments).joinedload(Comment.user),
+        raiseload("*"),
+    ),
+    LoadProfile.existence: (
+        raiseload("*"),
+    ),
+    LoadProfile.admin: (
+        joinedload(Post.user),
+        selectinload(Post.tags),
+        selectinload(Post.comments).joinedload(Comment.user),
+        selectinload(Post.ratings),
+        raiseload("*"),
+    ),
+}
+
+COMMENT_OPTIONS: Tuple[LoaderOption, ...] = (
+    joinedload(Comment.user),
+    raiseload("*"),
+)
+
+
+def post_options(profile: LoadProfile) -> Tuple[LoaderOption, ...]:
+    """
+    Loader options of profile for ``select(Post).options(*post_options(profile))``.
+
+    Args:
+        profile (LoadProfile):  Profile.
+    Returns:
+        Tuple[LoaderOption, ...]:  Loader options.
+    """
+    return POST_PROFILES[profile]
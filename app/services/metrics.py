@@ -0,0 +1,406 @@
+import asyncio
+import bisect
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+DB_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# name: (type, help, histogram buckets), gauges are summed over live workers
+METRICS: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {
+    "http_requests_total": ("counter", "Requests by route and status.", ()),
+    "http_request_duration_seconds": ("histogram", "Time to the end of the response.", LATENCY_BUCKETS),
+    "http_requests_in_flight": ("gauge", "Requests being served.", ()),
+    "db_statements_per_request": ("histogram", "SQL statements run by a request.", STATEMENT_BUCKETS),
+    "db_seconds_per_request": ("histogram", "Time of SQL statements of a request.", DB_TIME_BUCKETS),
+    "db_repeated_statements_total": ("counter", "Requests which ran one statement at least "
+                                                "SQL_REPEAT_THRESHOLD times, likely N+1 queries.", ()),
+    "db_pool_size": ("gauge", "Connections kept by the pools.", ()),
+    "db_pool_connections": ("gauge", "Open connections of the pools by state.", ()),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result.", ()),
+    "upload_executor_pending": ("gauge", "Blocking uploads running or waiting for a thread.", ()),
+    "upload_executor_capacity": ("gauge", "Uploads accepted before 429, threads and queue.", ()),
+    "job_queue_depth": ("gauge", "Jobs, e.g. photos of new posts, waiting for the job worker.", ()),
+    "emails_in_progress": ("gauge", "Emails being sent by background tasks.", ()),
+    "emails_sent_total": ("counter", "Emails by result.", ()),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# counters and histograms of exited processes, merged by def collect
+EXITED_FILE = "exited.json"
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Metrics:
+    """
+    Metrics of this process, shared with the other workers through files.
+
+    Every process writes a snapshot to settings.metrics_dir every
+    settings.metrics_flush_interval seconds and at exit, in a file of its
+    own. /metrics reads all snapshots: counters and histograms are summed
+    over all files, so counts of exited workers are kept, gauges only over
+    live processes. Other workers are therefore up to one interval behind.
+    Snapshots of exited workers are merged into one file by def collect.
+    Empty the directory when the app is deployed, like the
+    PROMETHEUS_MULTIPROC_DIR of prometheus_client.
+
+    Gauges of a process are set by collectors right before its snapshot.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collectors: List[Callable[["Metrics"], None]] = []
+        self._task: asyncio.Task | None = None
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Set all metrics of this process to zero and start a new snapshot file.
+        """
+        with self._lock:
+            self._counters: Dict[Tuple[str, Labels], float] = {}
+            self._gauges: Dict[Tuple[str, Labels], float] = {}
+            self._histograms: Dict[Tuple[str, Labels], list] = {}
+            # a new process with the pid of an exited one must not overwrite its counts
+            self._file = f"{os.getpid()}-{time.time_ns()}.json"
+
+    def add_collector(self, collector: Callable[["Metrics"], None]) -> None:
+        """
+        Register function which sets gauges of this process.
+
+        Args:
+            collector (Callable[[Metrics], None]):  collector(metrics), called before every snapshot.
+        """
+        self._collectors.append(collector)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Add value to counter, or to gauge.
+
+        Args:
+            name (str):  Name in METRICS.
+            value (float, optional):  Increment, negative only for gauges.
+            **labels:  Labels.
+        """
+        target = self._gauges if METRICS[name][0] == "gauge" else self._counters
+        key = (name, _labels(labels))
+        with self._lock:
+            target[key] = target.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        Add value to histogram.
+
+        Args:
+            name (str):  Name in METRICS.
+            value (float):  Value.
+            **labels:  Labels.
+        """
+        buckets = METRICS[name][2]
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def in_progress(self, name: str, **labels) -> Iterator[None]:
+        """
+        Raise gauge by one while the block runs.
+
+        Args:
+            name (str):  Gauge name in METRICS.
+            **labels:  Labels.
+        """
+        self.inc(name, 1, **labels)
+        try:
+            yield
+        finally:
+            self.inc(name, -1, **labels)
+
+    def snapshot(self, live: bool = True) -> dict:
+        """
+        Metrics of this process, gauges collected now.
+
+        Args:
+            live (bool, optional):  False leaves gauges out, for the last snapshot before exit.
+        Returns:
+            dict:  JSON-serialisable snapshot.
+        """
+        if live:
+            for collector in self._collectors:
+                try:
+                    collector(self)
+                except Exception as err:
+                    logger.warning("Metrics collector %s failed: %s", collector, err)
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "counters": [[name, labels, value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, labels, value] for (name, labels), value in self._gauges.items()] if live else [],
+                "histograms": [[name, labels, *histogram] for (name, labels), histogram in self._histograms.items()],
+            }
+
+    def flush(self, live: bool = True) -> None:
+        """
+        Write snapshot of this process to settings.metrics_dir, blocking.
+
+        Args:
+            live (bool, optional):  False leaves gauges out, for the last snapshot before exit.
+        """
+        directory = Path(settings.metrics_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as temporary:
+            json.dump(self.snapshot(live), temporary)
+        os.replace(temporary.name, directory / self._file)
+
+    async def start(self) -> None:
+        """
+        Flush every settings.metrics_flush_interval seconds in the running event loop.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self.__flush_forever())
+
+    async def stop(self) -> None:
+        """
+        Stop flushing and write counters without gauges, this process is no longer live.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await run_in_threadpool(self.flush, False)
+
+    async def __flush_forever(self) -> None:
+        while True:
+            await asyncio.sleep(settings.metrics_flush_interval)
+            try:
+                await run_in_threadpool(self.flush)
+            except OSError as err:
+                logger.warning("Metrics are not flushed: %s", err)
+
+
+metrics = Metrics()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect(directory: str | None = None) -> dict:
+    """
+    Metrics of all processes, from their snapshots, blocking.
+
+    Snapshots of exited processes are merged into EXITED_FILE and
+    removed, so the directory does not grow with every restart of a
+    worker. Workers collect one at a time, under a lock of the directory.
+
+    Args:
+        directory (str | None, optional):  Snapshot directory, defaults to settings.metrics_dir.
+    Returns:
+        dict:  {"counters": {(name, labels): value}, "gauges": {...}, "histograms": {(name, labels): [counts, sum, count]}}
+    """
+    directory = Path(directory or settings.metrics_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    result = {"counters": {}, "gauges": {}, "histograms": {}}
+    exited = {"counters": {}, "gauges": {}, "histograms": {}}
+    merged = []
+    with open(directory / ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            for path in sorted(directory.glob("*.json")):
+                try:
+                    snapshot = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    continue
+                alive = path.name != EXITED_FILE and _alive(snapshot["pid"])
+                __add(result, snapshot, alive)
+                if not alive:
+                    __add(exited, snapshot, False)
+                    if path.name != EXITED_FILE:
+                        merged.append(path)
+            if merged:
+                __write_exited(directory, exited)
+                for path in merged:
+                    path.unlink(missing_ok=True)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return result
+
+
+def __add(result: dict, snapshot: dict, alive: bool) -> None:
+    """
+    Internal function for def collect
+
+    Args:
+        result (dict):  Metrics so far, changed in place.
+        snapshot (dict):  Snapshot of one process, see Metrics.snapshot.
+        alive (bool):  Process is running, only then its gauges are added.
+    """
+    for name, labels, value in snapshot["counters"]:
+        key = (name, tuple(map(tuple, labels)))
+        result["counters"][key] = result["counters"].get(key, 0) + value
+    if alive:
+        for name, labels, value in snapshot["gauges"]:
+            key = (name, tuple(map(tuple, labels)))
+            result["gauges"][key] = result["gauges"].get(key, 0) + value
+    for name, labels, counts, total, count in snapshot["histograms"]:
+        key = (name, tuple(map(tuple, labels)))
+        histogram = result["histograms"].setdefault(key, [[0] * len(counts), 0.0, 0])
+        histogram[0] = [mine + theirs for mine, theirs in zip(histogram[0], counts)]
+        histogram[1] += total
+        histogram[2] += count
+
+
+def __write_exited(directory: Path, exited: dict) -> None:
+    """
+    Internal function for def collect
+
+    Args:
+        directory (Path):  Snapshot directory.
+        exited (dict):  Counters and histograms of exited processes.
+    """
+    snapshot = {
+        "pid": None,
+        "counters": [[name, labels, value] for (name, labels), value in exited["counters"].items()],
+        "gauges": [],
+        "histograms": [[name, labels, *histogram] for (name, labels), histogram in exited["histograms"].items()],
+    }
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as temporary:
+        json.dump(snapshot, temporary)
+    os.replace(temporary.name, directory / EXITED_FILE)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name: str, labels: Labels, value: float) -> str:
+    text = ",".join(f'{label}="{_escape(label_value)}"' for label, label_value in labels)
+    return f"{name}{{{text}}} {value:g}" if text else f"{name} {value:g}"
+
+
+def cumulative(buckets: Tuple[float, ...], counts: List[int]) -> Dict[str, int]:
+    """
+    Counts of histogram in buckets with fixed upper bounds, cumulative
+    like Prometheus histograms.
+
+    Args:
+        buckets (Tuple[float, ...]):  Upper bounds, from METRICS.
+        counts (List[int]):  Count of every bucket and of the last one, +Inf.
+    Returns:
+        Dict[str, int]:  {"le": count, ..., "+Inf": count}
+    """
+    total, result = 0, {}
+    for bound, count in zip([*map(str, buckets), "+Inf"], counts):
+        total += count
+        result[bound] = total
+    return result
+
+
+def render(collected: dict) -> str:
+    """
+    Metrics in the Prometheus text exposition format, version 0.0.4.
+
+    Args:
+        collected (dict):  Result of def collect.
+    Returns:
+        str:  Text with HELP, TYPE and samples of every metric in METRICS.
+    """
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        if kind == "histogram":
+            for (metric, labels), (counts, total, count) in sorted(collected["histograms"].items()):
+                if metric != name:
+                    continue
+                for bound, bucket_count in cumulative(buckets, counts).items():
+                    lines.append(_sample(f"{name}_bucket", labels + (("le", bound),), bucket_count))
+                lines.append(_sample(f"{name}_sum", labels, total))
+                lines.append(_sample(f"{name}_count", labels, count))
+        else:
+            values = collected["counters" if kind == "counter" else "gauges"]
+            lines += [_sample(name, labels, value)
+                      for (metric, labels), value in sorted(values.items()) if metric == name]
+    return "\n".join(lines) + "\n"
+
+
+def route_template(scope: Scope) -> str:
+    """
+    Path template of the route which served the request.
+
+    Args:
+        scope (Scope):  ASGI scope after routing.
+    Returns:
+        str:  E.g. "/api/posts/{post_id}", "other" when no route matched.
+    """
+    return getattr(scope.get("route"), "path", None) or "other"
+
+
+class MetricsMiddleware:
+    """
+    Count requests by route and status, time them and track requests in flight.
+
+    Routes are labelled by method and path template, so the number of
+    series is bounded by the number of routes. An exception is counted
+    as status 500.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started_at = time.perf_counter()
+
+        async def counted_send(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            with metrics.in_progress("http_requests_in_flight"):
+                await self.app(scope, receive, counted_send)
+        finally:
+            route = route_template(scope)
+            metrics.inc("http_requests_total", method=scope["method"], route=route, status=status_code)
+            metrics.observe("http_request_duration_seconds", time.perf_counter() - started_at,
+                            method=scope["method"], route=route)
@@ -0,0 +1,142 @@
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List
+
+from fastapi import HTTPException, status
+from sqlalchemy import asc, desc, func, tuple_
+from sqlalchemy.sql import Select
+
+from app.models import Post
+from app.schemas.post import OrderByEnum, OrderEnum
+
+
+@dataclass
+class PostCursor:
+    """
+    Keyset (cursor) position in a list of posts.
+
+    Posts are ordered by (created_at, id) or by (rating, id). The cursor keeps
+    the sort key of the last post on a page, so the next page is read with
+    ``WHERE (key, id) > (last_key, last_id)`` instead of OFFSET and costs the
+    same as the first one.
+
+    Cursor is passed to clients as an opaque urlsafe base64 token.
+    """
+
+    order_by: OrderByEnum = OrderByEnum.created_at
+    order: OrderEnum = OrderEnum.asc
+    last_value: datetime | float | None = None
+    last_id: int | None = None
+
+    @classmethod
+    def from_token(cls, token: str) -> "PostCursor":
+        """
+        Decode cursor from token.
+
+        Args:
+            token (str):  Token from PostCursor.to_token().
+        Raises:
+            HTTPException:  HTTP_400_BAD_REQUEST
+        Returns:
+            PostCursor:  Cursor.
+        """
+        try:
+            padding = "=" * (-len(token) % 4)
+            data = json.loads(base64.urlsafe_b64decode(token + padding))
+            order_by = OrderByEnum(data["k"])
+            if order_by not in (OrderByEnum.created_at, OrderByEnum.rating):
+                raise ValueError(order_by)
+            last_value = data["v"]
+            if order_by == OrderByEnum.created_at:
+                last_value = datetime.fromisoformat(last_value)
+            else:
+                last_value = float(last_value)
+            return cls(order_by=order_by,
+                       order=OrderEnum(data["o"]),
+                       last_value=last_value,
+                       last_id=int(data["i"]))
+        except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+            )
+
+    def to_token(self) -> str:
+        """
+        Encode cursor to opaque token.
+
+        Returns:
+            str:  Token.
+        """
+        last_value = self.last_value
+        if isinstance(last_value, datetime):
+            last_value = last_value.isoformat()
+        data = {"k": self.order_by.value,
+                "o": self.order.value,
+                "v": last_value,
+                "i": self.last_id}
+        raw = json.dumps(data, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @property
+    def is_started(self) -> bool:
+        """
+        Cursor points after some post, not to the first page.
+        """
+        return self.last_id is not None
+
+    def sort_key(self):
+        """
+        Column expression posts are ordered by.
+        """
+        if self.order_by == OrderByEnum.rating:
+            return func.coalesce(Post.rating, 0)
+        return Post.created_at
+
+    def value_of(self, post: Post) -> datetime | float:
+        """
+        Sort key value of post.
+        """
+        if self.order_by == OrderByEnum.rating:
+            return float(post.rating or 0)
+        return post.created_at
+
+    def apply(self, query: Select) -> Select:
+        """
+        Apply keyset filter and ordering to query.
+
+        Args:
+            query (Select):  Query to database.
+        Returns:
+            Select:  Query to database.
+        """
+        key = self.sort_key()
+        if self.is_started:
+            position = tuple_(key, Post.id)
+            after = (self.last_value, self.last_id)
+            if self.order == OrderEnum.desc:
+                query = query.where(position < after)
+            else:
+                query = query.where(position > after)
+        order_func = desc if self.order == OrderEnum.desc else asc
+        return query.order_by(order_func(key), order_func(Post.id))
+
+    def next_token(self, posts: List[Post], limit: int) -> str | None:
+        """
+        Token of the page after posts.
+
+        Args:
+            posts (List[Post]):  Posts of current page.
+            limit (int):  Page size.
+        Returns:
+            str | None:  Token or None if it was the last page.
+        """
+        if not posts or len(posts) < limit:
+            return None
+        last = posts[-1]
+        return PostCursor(order_by=self.order_by,
+                          order=self.order,
+                          last_value=self.value_of(last),
+                          last_id=last.id).to_token()
@@ -0,0 +1,89 @@
+import numpy as np
+from PIL import Image
+
+# components of BlurHash, 4 x 3 keeps the string at 28 characters
+COMPONENTS_X, COMPONENTS_Y = 4, 3
+
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _base83(value: int, length: int) -> str:
+    return "".join(_BASE83[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+
+def _to_linear(srgb: np.ndarray) -> np.ndarray:
+    srgb = srgb / 255
+    return np.where(srgb <= 0.04045, srgb / 12.92, ((srgb + 0.055) / 1.055) ** 2.4)
+
+
+def _to_srgb(linear: float) -> int:
+    linear = min(max(linear, 0.0), 1.0)
+    if linear <= 0.0031308:
+        return int(linear * 12.92 * 255 + 0.5)
+    return int((1.055 * linear ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(image: Image.Image, components_x: int = COMPONENTS_X, components_y: int = COMPONENTS_Y) -> str:
+    """
+    BlurHash of image, see https://blurha.sh.
+
+    The DCT of the image in linear RGB is computed for all components at once
+    with NumPy, on a 32 px thumbnail, which is enough for a few components.
+
+    Args:
+        image (Image.Image):  RGB image.
+        components_x (int, optional):  Horizontal components, 1 to 9.
+        components_y (int, optional):  Vertical components, 1 to 9.
+    Returns:
+        str:  BlurHash.
+    """
+    image = image.copy()
+    image.thumbnail((32, 32), Image.Resampling.BOX)
+    pixels = _to_linear(np.asarray(image, dtype=np.float64))
+    height, width = pixels.shape[:2]
+    basis_x = np.cos(np.pi * np.outer(np.arange(components_x), np.arange(width)) / width)
+    basis_y = np.cos(np.pi * np.outer(np.arange(components_y), np.arange(height)) / height)
+    # factors[j, i] is the colour of component i horizontally and j vertically
+    factors = np.einsum("jy,ix,yxc->jic", basis_y, basis_x, pixels) / (width * height)
+    factors[1:] *= 2
+    factors[0, 1:] *= 2
+    factors = factors.reshape(-1, 3)
+    dc, ac = factors[0], factors[1:]
+
+    result = _base83(components_x - 1 + (components_y - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(max(0, min(82, np.floor(np.abs(ac).max() * 166 - 0.5))))
+        maximum = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        maximum = 1.0
+        result += _base83(0, 1)
+
+    red, green, blue = (_to_srgb(value) for value in dc)
+    result += _base83((red << 16) + (green << 8) + blue, 4)
+    quantised = np.clip(np.floor(np.sign(ac) * np.sqrt(np.abs(ac / maximum)) * 9 + 9.5), 0, 18).astype(int)
+    for red, green, blue in quantised:
+        result += _base83(red * 19 * 19 + green * 19 + blue, 2)
+    return result
+
+
+def dominant_color(image: Image.Image, colors: int = 5) -> str:
+    """
+    Colour of the largest area of image.
+
+    The image is reduced to a palette of a few colours by median cut, the
+    most frequent palette colour wins, so a small bright object does not
+    tint it like an average would.
+
+    Args:
+        image (Image.Image):  RGB image.
+        colors (int, optional):  Palette size.
+    Returns:
+        str:  Colour as "#rrggbb".
+    """
+    image = image.copy()
+    image.thumbnail((64, 64), Image.Resampling.BOX)
+    quantized = image.quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+    _, index = max(quantized.getcolors())
+    red, green, blue = quantized.getpalette()[index * 3:index * 3 + 3]
+    return f"#{red:02x}{green:02x}{blue:02x}"
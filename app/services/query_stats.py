@@ -0,0 +1,215 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.conf.config import settings
+from app.services.metrics import METRICS, cumulative, metrics, route_template
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class RequestQueries:
+    """
+    Statements of one request.
+
+    Statements are counted by shape, the SQL text with placeholders, so
+    the same SELECT run for every row of a list shows up as one shape with
+    a high count.
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.statements += 1
+        self.db_time += seconds
+        self.shapes[_WHITESPACE.sub(" ", statement).strip()] += 1
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """
+        Shapes run at least threshold times.
+
+        Args:
+            threshold (int):  Smallest count.
+        Returns:
+            List[Tuple[str, int]]:  (statement, count), most frequent first.
+        """
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+_current: ContextVar[RequestQueries | None] = ContextVar("request_queries", default=None)
+
+
+def current_queries() -> RequestQueries | None:
+    """
+    Statements of the request being served, None outside of QueryStatsMiddleware.
+
+    Returns:
+        RequestQueries | None:  Statements so far.
+    """
+    return _current.get()
+
+
+def instrument_queries(engine: Engine) -> None:
+    """
+    Count statements of engine and their time for the current request.
+
+    Failed statements are counted too. Statements run outside of a
+    request, e.g. by the job worker, are not counted. Instrumenting an
+    engine twice has no effect.
+
+    Args:
+        engine (Engine):  Engine, sync_engine of AsyncEngine.
+    """
+    if event.contains(engine, "before_cursor_execute", __before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", __before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", __after_cursor_execute)
+    event.listen(engine, "handle_error", __handle_error)
+
+
+def __before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    """
+    Internal function for def instrument_queries
+    """
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def __after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    """
+    Internal function for def instrument_queries
+    """
+    __record(conn, statement)
+
+
+def __handle_error(exception_context) -> None:
+    """
+    Internal function for def instrument_queries
+    """
+    if exception_context.connection is not None and exception_context.statement is not None:
+        __record(exception_context.connection, exception_context.statement)
+
+
+def __record(conn: Connection, statement: str) -> None:
+    """
+    Internal function for def instrument_queries
+
+    Args:
+        conn (Connection):  Connection which ran statement.
+        statement (str):  SQL with placeholders.
+    """
+    started = conn.info.get("query_started_at")
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    queries = _current.get()
+    if queries is not None:
+        queries.record(statement, seconds)
+
+
+def queries_stats(collected: dict) -> dict:
+    """
+    Statements and database time per request by route, from app.services.metrics.
+
+    Args:
+        collected (dict):  Result of app.services.metrics.collect.
+    Returns:
+        dict:  {"routes": {"/api/posts/{post_id}": {"statements": histogram, "db_seconds": histogram, "repeated": int}}}
+    """
+    routes: Dict[str, dict] = {}
+    for (name, labels), (counts, total, count) in collected["histograms"].items():
+        if name not in ("db_statements_per_request", "db_seconds_per_request"):
+            continue
+        route = routes.setdefault(dict(labels)["route"], {"repeated": 0})
+        key = "statements" if name == "db_statements_per_request" else "db_seconds"
+        route[key] = {"buckets": cumulative(METRICS[name][2], counts), "sum": round(total, 6), "count": count}
+    for (name, labels), value in collected["counters"].items():
+        route = dict(labels).get("route")
+        if name == "db_repeated_statements_total" and route in routes:
+            routes[route]["repeated"] = int(value)
+    return {"routes": dict(sorted(routes.items()))}
+
+
+def route_name(scope: Scope) -> str:
+    """
+    Method and path template of the route which served the request.
+
+    Args:
+        scope (Scope):  ASGI scope after routing.
+    Returns:
+        str:  E.g. "GET /api/posts/{post_id}", "other" when no route matched.
+    """
+    path = route_template(scope)
+    if path == "other":
+        return path
+    return f"{scope['method']} {path}"
+
+
+def server_timing(queries: RequestQueries, seconds: float) -> str:
+    """
+    Server-Timing header value.
+
+    Args:
+        queries (RequestQueries):  Statements of the request.
+        seconds (float):  Time of the request until its response starts.
+    Returns:
+        str:  E.g. 'db;dur=4.2;desc="3 statements", app;dur=12.5'
+    """
+    return (f'db;dur={queries.db_time * 1000:.1f};desc="{queries.statements} statements", '
+            f'app;dur={seconds * 1000:.1f}')
+
+
+class QueryStatsMiddleware:
+    """
+    Count statements and database time of every request.
+
+    Counts go to the Server-Timing header, when settings.server_timing is
+    on, and to app.services.metrics. A statement shape run at least
+    settings.sql_repeat_threshold times in one request is logged as a
+    likely N+1 query. Statements run after the response has started, e.g.
+    by a streaming body, are not in the header but are in the histograms.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries()
+        token = _current.set(queries)
+        started_at = time.perf_counter()
+
+        async def timed_send(message: Message) -> None:
+            if message["type"] == "http.response.start" and settings.server_timing:
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", server_timing(queries, time.perf_counter() - started_at))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            _current.reset(token)
+            route = route_name(scope)
+            repeated = queries.repeated(settings.sql_repeat_threshold)
+            for statement, count in repeated:
+                logger.warning("Possible N+1 query in %s: statement run %s times: %.500s", route, count, statement)
+            template = route_template(scope)
+            metrics.observe("db_statements_per_request", queries.statements, route=template)
+            metrics.observe("db_seconds_per_request", queries.db_time, route=template)
+            if repeated:
+                metrics.inc("db_repeated_statements_total", route=template)
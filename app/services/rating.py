@@ -1,11 +1,26 @@
 from datetime import datetime
 
-from sqlalchemy import func
+from sqlalchemy import Numeric, cast, func, select, update
 from sqlalchemy.orm import Session
 
+from app.models.db import maybe_await
 from app.models.post import Post
 from app.models.user import User
 from app.models.rating import Rating
+from app.services.cache import POSTS_TAG, POST_TAG, response_cache
+
+
+def rating_expression(rating_sum, rating_count):
+    """
+    SQL expression of average rating rounded to 2 digits.
+
+    Args:
+        rating_sum:  Sum of rates, column or expression.
+        rating_count:  Number of rates, column or expression.
+    Returns:
+        Average rating expression.
+    """
+    return cast(func.round(cast(rating_sum, Numeric) / rating_count, 2), Post.rating.type)
 
 
 async def add_rate_to_post(user: User,
@@ -15,6 +30,11 @@ async def add_rate_to_post(user: User,
     """
     Add rate to post
 
+    Post.rating_sum, Post.rating_count and Post.rating are changed by one
+    UPDATE in the same transaction as the new Rating, so the cost does not
+    depend on the number of rates. Post.rating_override of an admin stays
+    the rating.
+
     Args:
         user (User):  Appraiser.
         post (Post):  Database object Post to rate.
@@ -22,34 +42,62 @@ async def add_rate_to_post(user: User,
         db (Session):  The database session.
     Returns:
         dict:  {"post_id": int, "rating": float}
-    """    
-    
+    """
+
     result = Rating(post_id=post.id,
                     user_id=user.id,
                     rate=rating,
                     create_at=datetime.now())
     db.add(result)
-    db.commit()
-    db.refresh(result)
-    rating = await calculate_avarage_rating(post, db)
-    return {"post_id": post.id, "rating": rating}
+    updated = await maybe_await(db.execute(
+        update(Post)
+        .where(Post.id == post.id)
+        .values(
+            rating_sum=Post.rating_sum + rating,
+            rating_count=Post.rating_count + 1,
+            rating=func.coalesce(Post.rating_override,
+                                 rating_expression(Post.rating_sum + rating, Post.rating_count + 1)),
+            updated_at=Post.updated_at,
+        )
+        .returning(Post.rating)
+        .execution_options(synchronize_session=False)
+    ))
+    post_rating = updated.scalar_one()
+    await maybe_await(db.commit())
+    await response_cache.invalidate(POSTS_TAG, POST_TAG.format(post_id=post.id))
+    return {"post_id": post.id, "rating": post_rating}
 
 
-async def calculate_avarage_rating(post: Post, db: Session):
+async def reconcile_ratings(db: Session) -> int:
     """
-    Calculate avarage rating for Post
+    Recalculate Post.rating_sum, Post.rating_count and Post.rating
+    for posts where they differ from ratings table.
 
     Args:
-        post (Post):  Database object Post to calculate.
         db (Session):  The database session.
     Returns:
-        float:  Post.rating
-    """    
-    average_rate_query = db.query(func.avg(Rating.rate).label('average_rate')).filter(Rating.post_id == post.id).first()
-    average_rate = average_rate_query.average_rate
-    post.rating = float(round(average_rate, 2))
-    db.add(post)
-    db.commit()
-    db.refresh(post)
-    return post.rating
-     
\ No newline at end of file
+        int:  Number of fixed posts.
+    """
+    actual_sum = (
+        select(func.coalesce(func.sum(Rating.rate), 0))
+        .where(Rating.post_id == Post.id)
+        .scalar_subquery()
+    )
+    actual_count = (
+        select(func.count(Rating.id))
+        .where(Rating.post_id == Post.id)
+        .scalar_subquery()
+    )
+    result = await maybe_await(db.execute(
+        update(Post)
+        .where((Post.rating_sum != actual_sum) | (Post.rating_count != actual_count))
+        .values(
+            rating_sum=actual_sum,
+            rating_count=actual_count,
+            rating=func.coalesce(Post.rating_override, rating_expression(actual_sum, func.nullif(actual_count, 0))),
+            updated_at=Post.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    ))
+    await maybe_await(db.commit())
+    return result.rowcount
@@ -0,0 +1,335 @@
+import json
+import logging
+import os
+import re
+import secrets
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, List
+
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+
+from app.conf.config import settings
+from app.services.storage import SNIFF_SIZE, sniff_media_type
+from app.services.uploads import (CHUNK_SIZE, SpooledUpload, UnsupportedMediaType, UploadTooLarge,
+                                  ingest_stream)
+
+logger = logging.getLogger(__name__)
+
+_UPLOAD_ID = re.compile(r"[A-Za-z0-9_-]{16,64}")
+
+
+class UploadSessionNotFound(HTTPException):
+    """
+    Upload session does not exist, expired, is finalized or belongs to another user.
+    """
+
+    def __init__(self):
+        super().__init__(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+
+
+class UploadSessionConflict(HTTPException):
+    """
+    Chunk does not fit the session, or the session is not complete.
+    """
+
+    def __init__(self, detail: str):
+        super().__init__(status_code=status.HTTP_409_CONFLICT, detail=detail)
+
+
+class UploadSession:
+    """
+    Resumable upload of one photo, split into numbered chunks of chunk_size.
+
+    Chunk i starts at offset i * chunk_size, every chunk but the last is
+    exactly chunk_size. Chunks may arrive in any order and be sent again,
+    a chunk is stored in one file, so a received chunk is always complete.
+    """
+
+    def __init__(self, directory: Path, upload_id: str, user_id: int, size: int,
+                 chunk_size: int, filename: str | None = None, created_at: float | None = None):
+        self.directory = directory
+        self.upload_id = upload_id
+        self.user_id = user_id
+        self.size = size
+        self.chunk_size = chunk_size
+        self.filename = filename
+        self.created_at = created_at if created_at is not None else time.time()
+
+    @property
+    def chunks(self) -> int:
+        return max(1, -(-self.size // self.chunk_size))
+
+    def chunk_length(self, index: int) -> int:
+        """
+        Expected length of chunk.
+
+        Args:
+            index (int):  Chunk number, from 0.
+        Returns:
+            int:  Bytes.
+        """
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def chunk_path(self, index: int) -> Path:
+        return self.directory / f"{index:06d}.part"
+
+    def received(self) -> List[int]:
+        """
+        Numbers of stored chunks, blocking.
+
+        Returns:
+            List[int]:  Sorted chunk numbers.
+        """
+        return sorted(int(path.stem) for path in self.directory.glob("*.part"))
+
+    def updated_at(self) -> float:
+        """
+        Time of the last stored chunk, or of creation, blocking.
+
+        Returns:
+            float:  Unix time.
+        """
+        return max([self.created_at] + [path.stat().st_mtime for path in self.directory.glob("*.part")])
+
+    def to_dict(self) -> Dict:
+        return {"upload_id": self.upload_id, "user_id": self.user_id, "size": self.size,
+                "chunk_size": self.chunk_size, "filename": self.filename, "created_at": self.created_at}
+
+
+class UploadSessionStore:
+    """
+    Resumable upload sessions, one directory each, with session.json and
+    one file per received chunk.
+
+    Sessions live on the local disk of the API, so with several API hosts
+    requests of a session must reach the same host, or directory must be
+    shared. Sessions idle for longer than ttl are removed by def collect,
+    which runs at startup and at most every ttl / 24 seconds when a session
+    is created.
+    """
+
+    def __init__(self, directory: str | None = None, ttl: int | None = None, chunk_size: int | None = None):
+        self.directory = Path(directory or settings.upload_session_dir)
+        self.ttl = ttl or settings.upload_session_ttl
+        self.chunk_size = chunk_size or settings.upload_chunk_size
+        self._collected_at = 0.0
+
+    def create(self, user_id: int, size: int, filename: str | None = None) -> UploadSession:
+        """
+        Start upload session, blocking.
+
+        Args:
+            user_id (int):  Owner, database object User.id.
+            size (int):  Size of the photo.
+            filename (str | None, optional):  Name of the photo.
+        Raises:
+            UploadTooLarge:  HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        Returns:
+            UploadSession:  New session.
+        """
+        if size > settings.upload_max_size:
+            raise UploadTooLarge(settings.upload_max_size)
+        if time.time() - self._collected_at > self.ttl / 24:
+            self.collect()
+
+        upload_id = secrets.token_urlsafe(24)
+        session = UploadSession(self.directory / upload_id, upload_id, user_id, size, self.chunk_size, filename)
+        session.directory.mkdir(parents=True)
+        (session.directory / "session.json").write_text(json.dumps(session.to_dict()))
+        return session
+
+    def get(self, upload_id: str, user_id: int) -> UploadSession:
+        """
+        Session of user, blocking.
+
+        Args:
+            upload_id (str):  Session id.
+            user_id (int):  Current user, database object User.id.
+        Raises:
+            UploadSessionNotFound:  HTTP_404_NOT_FOUND
+        Returns:
+            UploadSession:  Session.
+        """
+        if not _UPLOAD_ID.fullmatch(upload_id):
+            raise UploadSessionNotFound()
+        directory = self.directory / upload_id
+        try:
+            meta = json.loads((directory / "session.json").read_text())
+        except (OSError, ValueError):
+            raise UploadSessionNotFound()
+        if meta["user_id"] != user_id:
+            raise UploadSessionNotFound()
+        return UploadSession(directory, **meta)
+
+    def write_chunk(self, session: UploadSession, index: int, offset: int, data: bytes) -> None:
+        """
+        Store chunk, a chunk sent again replaces the stored one, blocking.
+
+        Args:
+            session (UploadSession):  Session.
+            index (int):  Chunk number, from 0.
+            offset (int):  Offset of chunk in the photo, checked against index.
+            data (bytes):  Content of chunk.
+        Raises:
+            UploadSessionNotFound:  HTTP_404_NOT_FOUND
+            UploadSessionConflict:  HTTP_409_CONFLICT
+            UnsupportedMediaType:  HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        """
+        if not 0 <= index < session.chunks or offset != index * session.chunk_size:
+            raise UploadSessionConflict(f"Chunk {index} starts at offset {index * session.chunk_size} "
+                                        f"and the upload has {session.chunks} chunks")
+        if len(data) != session.chunk_length(index):
+            raise UploadSessionConflict(f"Chunk {index} must have {session.chunk_length(index)} bytes")
+        # reject a wrong file with the first chunk, not after all of them
+        if index == 0 and sniff_media_type(data[:SNIFF_SIZE]) is None:
+            raise UnsupportedMediaType()
+
+        try:
+            with tempfile.NamedTemporaryFile(dir=session.directory, suffix=".tmp", delete=False) as temporary:
+                temporary.write(data)
+            os.replace(temporary.name, session.chunk_path(index))
+        except FileNotFoundError:
+            # finalized or collected meanwhile
+            raise UploadSessionNotFound()
+
+    def claim(self, session: UploadSession) -> UploadSession:
+        """
+        Take complete session out of the store for finalisation, blocking.
+
+        The directory is renamed, so of concurrent finalisations only one
+        gets the session and later requests don't find it.
+
+        Args:
+            session (UploadSession):  Session.
+        Raises:
+            UploadSessionNotFound:  HTTP_404_NOT_FOUND
+            UploadSessionConflict:  HTTP_409_CONFLICT
+        Returns:
+            UploadSession:  Session in its new directory, remove it with def discard.
+        """
+        missing = sorted(set(range(session.chunks)) - set(session.received()))
+        if missing:
+            raise UploadSessionConflict(f"Chunks {missing} are missing")
+        directory = self.directory / f".{session.upload_id}.final"
+        try:
+            os.rename(session.directory, directory)
+        except FileNotFoundError:
+            raise UploadSessionNotFound()
+        session.directory = directory
+        return session
+
+    def discard(self, session: UploadSession) -> None:
+        """
+        Remove session with its chunks, blocking.
+
+        Args:
+            session (UploadSession):  Session.
+        """
+        shutil.rmtree(session.directory, ignore_errors=True)
+
+    def collect(self) -> int:
+        """
+        Remove sessions idle for longer than ttl, blocking.
+
+        Returns:
+            int:  Number of removed sessions.
+        """
+        self._collected_at = time.time()
+        if not self.directory.is_dir():
+            return 0
+        removed = 0
+        for directory in self.directory.iterdir():
+            try:
+                meta = json.loads((directory / "session.json").read_text())
+                updated_at = UploadSession(directory, **meta).updated_at()
+            except (OSError, ValueError, TypeError):
+                # broken session, judged by its directory
+                updated_at = directory.stat().st_mtime
+            if self._collected_at - updated_at > self.ttl:
+                shutil.rmtree(directory, ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info("Removed %s expired upload sessions", removed)
+        return removed
+
+    def expires_at(self, session: UploadSession) -> datetime:
+        """
+        When idle session will be removed, blocking.
+
+        Args:
+            session (UploadSession):  Session.
+        Returns:
+            datetime:  Time in UTC.
+        """
+        return datetime.fromtimestamp(session.updated_at() + self.ttl, tz=timezone.utc)
+
+
+_upload_sessions: UploadSessionStore | None = None
+
+
+def get_upload_sessions() -> UploadSessionStore:
+    """
+    Session store of settings, created on first use.
+
+    Returns:
+        UploadSessionStore:  Store.
+    """
+    global _upload_sessions
+    if _upload_sessions is None:
+        _upload_sessions = UploadSessionStore()
+    return _upload_sessions
+
+
+def set_upload_sessions(store: UploadSessionStore | None) -> None:
+    """
+    Replace session store, e.g. in tests. None recreates it from settings.
+
+    Args:
+        store (UploadSessionStore | None):  Store.
+    """
+    global _upload_sessions
+    _upload_sessions = store
+
+
+async def ingest_session(session: UploadSession) -> SpooledUpload:
+    """
+    Stream chunks of claimed session to a SpooledUpload, see
+    app.services.uploads.ingest_stream, so a finalised upload is checked
+    and hashed like one sent in a single request.
+
+    Args:
+        session (UploadSession):  Claimed session.
+    Raises:
+        UploadTooLarge:  HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        UnsupportedMediaType:  HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    Returns:
+        SpooledUpload:  Upload with size, SHA-256 and media type.
+    """
+    return await ingest_stream(__chunks(session))
+
+
+async def __chunks(session: UploadSession) -> AsyncIterator[bytes]:
+    """
+    Internal function for def ingest_session
+
+    Args:
+        session (UploadSession):  Claimed session.
+    Returns:
+        AsyncIterator[bytes]:  Content of chunks in order, in pieces of CHUNK_SIZE.
+    """
+    for index in range(session.chunks):
+        with open(session.chunk_path(index), "rb") as chunk:
+            while piece := await run_in_threadpool(chunk.read, CHUNK_SIZE):
+                yield piece
+
+
+async def collect_upload_sessions() -> None:
+    """
+    Remove expired upload sessions at startup.
+    """
+    await run_in_threadpool(get_upload_sessions().collect)
@@ -0,0 +1,218 @@
+import math
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import case, false, func, select
+from sqlalchemy.orm import Session, raiseload, selectinload
+
+from app.models import Post, maybe_await
+
+# text search configuration of posts.search_vector, see migration 5c2e8a41d9b3
+TS_CONFIG = "simple"
+
+TAG_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+_token_re = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str | None) -> List[str]:
+    """
+    Split text to lower case words.
+
+    Args:
+        text (str | None):  Text.
+    Returns:
+        List[str]:  Words.
+    """
+    if not text:
+        return []
+    return _token_re.findall(text.lower())
+
+
+def is_postgres(db: Session) -> bool:
+    """
+    Database session is bound to PostgreSQL.
+
+    Args:
+        db (Session):  The database session.
+    Returns:
+        bool:  True for PostgreSQL.
+    """
+    bind = db.get_bind()
+    return getattr(bind.dialect, "name", None) == "postgresql"
+
+
+class PostSearchIndex:
+    """
+    In-process inverted index of post descriptions and tags.
+
+    Fallback of PostgreSQL full text search for engines without tsvector
+    (SQLite in tests and local runs). Index is built from the database on
+    first search and then kept up to date by the posts repository.
+    It lives in one process, so it is not used with PostgreSQL.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        """
+        Drop index, it will be rebuilt on next search.
+        """
+        self.built = False
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self._documents: Dict[int, Dict[str, float]] = {}
+        self._terms: List[str] = []
+        self._terms_dirty = False
+
+    def build(self, posts: Iterable[Post]) -> None:
+        """
+        Build index from posts.
+
+        Args:
+            posts (Iterable[Post]):  Database objects Post.
+        """
+        self.clear()
+        for post in posts:
+            self._add(post)
+        self.built = True
+
+    def add(self, post: Post) -> None:
+        """
+        Add or reindex post. Does nothing until index is built.
+
+        Args:
+            post (Post):  Database object Post.
+        """
+        if not self.built or post.id is None:
+            return
+        self._remove(post.id)
+        self._add(post)
+
+    def remove(self, post_id: int) -> None:
+        """
+        Remove post from index.
+
+        Args:
+            post_id (int):  Database object Post.id.
+        """
+        if self.built:
+            self._remove(post_id)
+
+    def search(self, query: str) -> Dict[int, float]:
+        """
+        Find posts with all words of query, every word is a prefix.
+
+        Args:
+            query (str):  Search query.
+        Returns:
+            Dict[int, float]:  Post.id -> tf-idf score.
+        """
+        words = tokenize(query)
+        if not words:
+            return {}
+        scores = None
+        for word in words:
+            word_scores = self._word_scores(word)
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {post_id: score + word_scores[post_id]
+                          for post_id, score in scores.items()
+                          if post_id in word_scores}
+            if not scores:
+                return {}
+        return scores
+
+    def _word_scores(self, word: str) -> Dict[int, float]:
+        total = len(self._documents) or 1
+        scores: Dict[int, float] = defaultdict(float)
+        for term in self._prefixed(word):
+            postings = self._postings[term]
+            idf = math.log(1 + total / len(postings))
+            for post_id, weight in postings.items():
+                scores[post_id] += weight * idf
+        return scores
+
+    def _prefixed(self, prefix: str) -> List[str]:
+        if self._terms_dirty:
+            self._terms = sorted(term for term, postings in self._postings.items() if postings)
+            self._terms_dirty = False
+        result = []
+        for i in range(bisect_left(self._terms, prefix), len(self._terms)):
+            if not self._terms[i].startswith(prefix):
+                break
+            result.append(self._terms[i])
+        return result
+
+    def _add(self, post: Post) -> None:
+        document: Dict[str, float] = defaultdict(float)
+        for word in tokenize(post.description):
+            document[word] += DESCRIPTION_WEIGHT
+        for tag in post.tags or []:
+            for word in tokenize(tag.text):
+                document[word] += TAG_WEIGHT
+        for word, weight in document.items():
+            self._postings[word][post.id] = weight
+        self._documents[post.id] = document
+        self._terms_dirty = True
+
+    def _remove(self, post_id: int) -> None:
+        document = self._documents.pop(post_id, None)
+        if not document:
+            return
+        for word in document:
+            self._postings[word].pop(post_id, None)
+        self._terms_dirty = True
+
+
+post_search_index = PostSearchIndex()
+
+
+def ts_query(query: str) -> str | None:
+    """
+    Build to_tsquery() text from search query.
+
+    Every word is a prefix and all words are required.
+
+    Args:
+        query (str):  Search query.
+    Returns:
+        str | None:  tsquery text or None if query has no words.
+    """
+    words = tokenize(query)
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+
+async def full_text_search(query: str, db: Session) -> Tuple:
+    """
+    Full text search expressions for posts.
+
+    PostgreSQL uses GIN indexed posts.search_vector, other engines
+    use post_search_index.
+
+    Args:
+        query (str):  Search query.
+        db (Session):  The database session.
+    Returns:
+        Tuple:  Filter expression, rank expression.
+    """
+    if is_postgres(db):
+        text = ts_query(query)
+        if text is None:
+            return false(), None
+        tsquery = func.to_tsquery(TS_CONFIG, text)
+        return Post.search_vector.op("@@")(tsquery), func.ts_rank(Post.search_vector, tsquery)
+
+    if not post_search_index.built:
+        posts = await maybe_await(db.execute(select(Post).options(selectinload(Post.tags), raiseload("*"))))
+        post_search_index.build(posts.scalars().all())
+    scores = post_search_index.search(query)
+    if not scores:
+        return false(), None
+    return Post.id.in_(list(scores)), case(scores, value=Post.id, else_=0.0)
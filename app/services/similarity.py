@@ -0,0 +1,412 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import numpy as np
+from PIL import Image
+from starlette.concurrency import run_in_threadpool
+
+from app.conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+# HSV histogram bins: hue, saturation, value
+HUE_BINS, SATURATION_BINS, VALUE_BINS = 8, 3, 3
+# side of luminance grid
+GRID_SIZE = 8
+FEATURE_SIZE = HUE_BINS * SATURATION_BINS * VALUE_BINS + GRID_SIZE * GRID_SIZE
+# share of colour in cosine similarity, the rest is layout
+COLOUR_WEIGHT = 0.7
+
+
+def feature_vector(image: Image.Image) -> np.ndarray:
+    """
+    Colour and layout features of image.
+
+    Runs in a worker process of app.services.variants.VariantPool, see
+    app.services.analysis.analyse_photo. The vector is the square root of the normalised HSV histogram (cosine of
+    two of them is the Bhattacharyya coefficient) joined with a mean-centred
+    8 x 8 luminance grid, both weighted to unit length in total.
+
+    Args:
+        image (Image.Image):  Upright RGB photo.
+    Returns:
+        np.ndarray:  float32 vector of FEATURE_SIZE, unit length or zeros.
+    """
+    image = image.resize((64, 64), Image.Resampling.BILINEAR)
+
+    hsv = np.asarray(image.convert("HSV"), dtype=np.int32)
+    bins = ((hsv[..., 0] * HUE_BINS // 256) * SATURATION_BINS
+            + hsv[..., 1] * SATURATION_BINS // 256) * VALUE_BINS + hsv[..., 2] * VALUE_BINS // 256
+    histogram = np.bincount(bins.ravel(), minlength=HUE_BINS * SATURATION_BINS * VALUE_BINS).astype(np.float32)
+    histogram = np.sqrt(histogram / histogram.sum())
+
+    grid = np.asarray(image.convert("L").resize((GRID_SIZE, GRID_SIZE), Image.Resampling.BOX), dtype=np.float32).ravel()
+    grid -= grid.mean()
+    grid_norm = np.linalg.norm(grid)
+    if grid_norm > 0:
+        grid /= grid_norm
+
+    vector = np.concatenate([histogram * np.sqrt(COLOUR_WEIGHT), grid * np.sqrt(1 - COLOUR_WEIGHT)])
+    return _normalize(vector)
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class VectorStore:
+    """
+    Feature vectors of post photos in a matrix memory-mapped from disk.
+
+    Files in directory:
+        vectors.f32  rows of float32 vectors, capacity doubles when full
+        ids.i64      Post.id of every row, 0 for a removed row
+        meta.json    used rows and version, replaced atomically on change
+        ivf_*.npy    coarse quantiser written by def train
+
+    Writers (API processes and job workers) take an exclusive flock, readers
+    remap when the version in meta.json changes, so every process sees rows
+    added by others. Search scans the whole matrix with one matrix-vector
+    product, or with a trained quantiser only the rows of the nprobe nearest
+    lists plus the rows added after training.
+    """
+
+    def __init__(self, directory: str = settings.similarity_dir, dim: int = FEATURE_SIZE):
+        self.directory = Path(directory)
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._version: int | None = None
+        self._ivf_version: int | None = None
+        self._rows = 0
+        self._vectors: np.memmap | None = None
+        self._ids: np.memmap | None = None
+        self._ivf: Tuple[np.ndarray, np.ndarray, np.ndarray, int] | None = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return int(np.count_nonzero(self._ids[:self._rows])) if self._rows else 0
+
+    def add(self, post_id: int, vector: np.ndarray) -> None:
+        """
+        Add or replace vector of post.
+
+        Args:
+            post_id (int):  Database object Post.id.
+            vector (np.ndarray):  Vector of dim, normalised here.
+        """
+        vector = _normalize(vector)
+        with self._locked():
+            row = self._row(post_id)
+            if row is None:
+                row = self._rows
+                self._ensure_capacity(row + 1)
+                self._rows += 1
+            self._vectors[row] = vector
+            self._ids[row] = post_id
+            self._commit()
+
+    def remove(self, post_id: int) -> None:
+        """
+        Remove vector of post, its row stays unused.
+
+        Args:
+            post_id (int):  Database object Post.id.
+        """
+        with self._locked():
+            row = self._row(post_id)
+            if row is not None:
+                self._ids[row] = 0
+                self._vectors[row] = 0
+                self._commit()
+
+    def get(self, post_id: int) -> np.ndarray | None:
+        """
+        Vector of post.
+
+        Args:
+            post_id (int):  Database object Post.id.
+        Returns:
+            np.ndarray | None:  Copy of vector, None if post has none.
+        """
+        with self._lock:
+            self._refresh()
+            row = self._row(post_id)
+            return None if row is None else np.array(self._vectors[row])
+
+    def search(self, vector: np.ndarray, limit: int, exclude: int | None = None,
+               nprobe: int = settings.similarity_nprobe) -> List[Tuple[int, float]]:
+        """
+        Posts with the most similar vectors.
+
+        Args:
+            vector (np.ndarray):  Query vector, unit length.
+            limit (int):  Number of posts.
+            exclude (int | None, optional):  Post.id to skip, e.g. the post of vector.
+            nprobe (int, optional):  Lists of quantiser to scan, if it is trained.
+        Returns:
+            List[Tuple[int, float]]:  (Post.id, cosine similarity), most similar first.
+        """
+        with self._lock:
+            self._refresh()
+            if not self._rows or limit <= 0:
+                return []
+            vector = _normalize(vector)
+            rows = self._candidates(vector, nprobe)
+            if rows is None:
+                ids = np.array(self._ids[:self._rows])
+                scores = self._vectors[:self._rows] @ vector
+            else:
+                ids = self._ids[rows]
+                scores = self._vectors[rows] @ vector
+
+        scores[(ids == 0) | (ids == (exclude or 0))] = -np.inf
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def train(self, lists: int = settings.similarity_ivf_lists, iterations: int = 10,
+              sample_size: int = 100_000, seed: int = 0) -> int:
+        """
+        Train coarse quantiser (IVF): k-means of vectors into lists.
+
+        Every row goes to the list of its nearest centroid. Rows added later
+        are scanned by every search until the next training, run it again
+        when many photos were added, see app.commands.train_similarity.
+
+        Args:
+            lists (int, optional):  Number of lists, about sqrt of rows is a good choice.
+            iterations (int, optional):  Iterations of k-means.
+            sample_size (int, optional):  Rows k-means runs on.
+            seed (int, optional):  Seed of sampling.
+        Returns:
+            int:  Number of trained rows.
+        """
+        with self._lock:
+            self._refresh()
+            rows = self._rows
+            vectors = self._vectors[:rows] if rows else None
+            live = np.flatnonzero(self._ids[:rows]) if rows else np.array([], dtype=np.int64)
+        if len(live) < lists:
+            return 0
+
+        generator = np.random.default_rng(seed)
+        sample = np.asarray(vectors[np.sort(generator.choice(live, min(sample_size, len(live)), replace=False))])
+        centroids = sample[generator.choice(len(sample), lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            filled = norms[:, 0] > 0
+            # an empty list keeps its centroid
+            centroids[filled] = sums[filled] / norms[filled]
+
+        assignment = np.empty(rows, dtype=np.int32)
+        for start in range(0, rows, 65536):
+            assignment[start:start + 65536] = np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable").astype(np.int64)
+        offsets = np.searchsorted(assignment[order], np.arange(lists + 1)).astype(np.int64)
+
+        with self._locked():
+            for name, array in (("centroids", centroids), ("order", order), ("offsets", offsets)):
+                temporary = self.directory / f".ivf_{name}.npy"
+                np.save(temporary, array)
+                os.replace(temporary, self.directory / f"ivf_{name}.npy")
+            self._commit(ivf_rows=rows)
+        logger.info("Similarity quantiser trained with %s lists on %s rows", lists, rows)
+        return rows
+
+    def close(self) -> None:
+        """
+        Unmap files, they are mapped again on next use.
+        """
+        with self._lock:
+            self._vectors = self._ids = self._ivf = None
+            self._version = self._ivf_version = None
+            self._rows = 0
+
+    def _candidates(self, vector: np.ndarray, nprobe: int) -> np.ndarray | None:
+        if self._ivf is None:
+            return None
+        centroids, order, offsets, trained_rows = self._ivf
+        nprobe = min(nprobe, len(centroids))
+        nearest = np.argpartition(-(centroids @ vector), nprobe - 1)[:nprobe]
+        parts = [order[offsets[i]:offsets[i + 1]] for i in nearest]
+        parts.append(np.arange(trained_rows, self._rows, dtype=np.int64))
+        return np.concatenate(parts)
+
+    def _row(self, post_id: int) -> int | None:
+        if not self._rows:
+            return None
+        rows = np.flatnonzero(self._ids[:self._rows] == post_id)
+        return int(rows[0]) if len(rows) else None
+
+    def _meta(self) -> dict:
+        try:
+            return json.loads((self.directory / "meta.json").read_text())
+        except FileNotFoundError:
+            return {"dim": self.dim, "rows": 0, "version": 0, "ivf_rows": None}
+
+    def _refresh(self, force: bool = False) -> None:
+        meta = self._meta()
+        if not force and meta["version"] == self._version:
+            return
+        if meta["dim"] != self.dim:
+            raise ValueError(f"Vectors in {self.directory} have {meta['dim']} dimensions, not {self.dim}")
+        self._rows = meta["rows"]
+        self._map()
+        if meta.get("ivf_rows") is None:
+            self._ivf = None
+        elif meta.get("ivf_version") != self._ivf_version or self._ivf is None:
+            self._ivf = (np.load(self.directory / "ivf_centroids.npy"),
+                         np.load(self.directory / "ivf_order.npy", mmap_mode="r"),
+                         np.load(self.directory / "ivf_offsets.npy"),
+                         meta["ivf_rows"])
+        self._ivf_version = meta.get("ivf_version")
+        self._version = meta["version"]
+
+    def _capacity(self) -> int:
+        try:
+            return (self.directory / "ids.i64").stat().st_size // 8
+        except FileNotFoundError:
+            return 0
+
+    def _map(self) -> None:
+        capacity = self._capacity()
+        if self._ids is not None and len(self._ids) == capacity:
+            return
+        if capacity == 0:
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self._ids = np.zeros(0, dtype=np.int64)
+            return
+        self._vectors = np.memmap(self.directory / "vectors.f32", dtype=np.float32, mode="r+",
+                                  shape=(capacity, self.dim))
+        self._ids = np.memmap(self.directory / "ids.i64", dtype=np.int64, mode="r+", shape=(capacity,))
+
+    def _ensure_capacity(self, rows: int) -> None:
+        capacity = self._capacity()
+        if rows <= capacity:
+            return
+        capacity = max(rows, capacity * 2, 1024)
+        for name, row_size in (("vectors.f32", self.dim * 4), ("ids.i64", 8)):
+            with open(self.directory / name, "ab") as file:
+                file.truncate(capacity * row_size)
+        self._map()
+
+    def _commit(self, **changes) -> None:
+        self._vectors.flush()
+        self._ids.flush()
+        meta = self._meta()
+        meta.update(dim=self.dim, rows=self._rows, version=meta["version"] + 1, **changes)
+        if "ivf_rows" in changes:
+            meta["ivf_version"] = meta["version"]
+        temporary = self.directory / ".meta.json"
+        temporary.write_text(json.dumps(meta))
+        os.replace(temporary, self.directory / "meta.json")
+        self._version = meta["version"]
+        self._ivf_version = meta.get("ivf_version")
+        if "ivf_rows" in changes:
+            self._ivf = None
+            self._refresh(force=True)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / ".lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+_vector_store: VectorStore | None = None
+
+
+def get_vector_store() -> VectorStore:
+    """
+    Vector store of the app, created on first use.
+
+    Returns:
+        VectorStore:  Store in settings.similarity_dir.
+    """
+    global _vector_store
+    if _vector_store is None:
+        _vector_store = VectorStore()
+    return _vector_store
+
+
+def set_vector_store(store: VectorStore | None) -> None:
+    """
+    Replace vector store, None recreates it from settings on next use.
+
+    Args:
+        store (VectorStore | None):  Store.
+    """
+    global _vector_store
+    _vector_store = store
+
+
+async def index_photo(post_id: int, vector: np.ndarray) -> None:
+    """
+    Store feature vector of photo of post.
+
+    Args:
+        post_id (int):  Database object Post.id.
+        vector (np.ndarray):  PhotoAnalysis.vector of app.services.analysis.
+    """
+    await run_in_threadpool(get_vector_store().add, post_id, vector)
+
+
+async def copy_photo_vector(post_id: int, original_id: int) -> None:
+    """
+    Give post the vector of a post whose photo it shares.
+
+    Args:
+        post_id (int):  Database object Post.id.
+        original_id (int):  Database object Post.id with vector.
+    """
+    store = get_vector_store()
+    vector = await run_in_threadpool(store.get, original_id)
+    if vector is not None:
+        await run_in_threadpool(store.add, post_id, vector)
+
+
+async def remove_photo_vector(post_id: int) -> None:
+    """
+    Remove vector of deleted post.
+
+    Args:
+        post_id (int):  Database object Post.id.
+    """
+    await run_in_threadpool(get_vector_store().remove, post_id)
+
+
+async def similar_post_ids(post_id: int, limit: int) -> List[Tuple[int, float]] | None:
+    """
+    Posts with photos most similar to photo of post.
+
+    Args:
+        post_id (int):  Database object Post.id.
+        limit (int):  Number of posts.
+    Returns:
+        List[Tuple[int, float]] | None:  (Post.id, similarity), most similar first,
+            None if post has no vector.
+    """
+    store = get_vector_store()
+    vector = await run_in_threadpool(store.get, post_id)
+    if vector is None:
+        return None
+    return await run_in_threadpool(store.search, vector, limit, post_id)
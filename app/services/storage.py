@@ -0,0 +1,329 @@
+import email.utils
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Mapping, Tuple
+
+import anyio
+from fastapi import HTTPException, Response, status
+from starlette.types import Receive, Scope, Send
+
+from app.conf.config import settings
+
+# signatures of image formats served by LocalStorage
+_MEDIA_TYPES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+# bytes needed by def sniff_media_type
+SNIFF_SIZE = 12
+
+
+@dataclass
+class StoredFile:
+    public_id: str
+    url: str
+    version: int | None = None
+
+
+class StorageBackend:
+    """
+    Storage of photos and avatars.
+
+    Methods are blocking, services run them in app.services.uploads.upload_executor.
+    """
+
+    def upload(self, file: BinaryIO, public_id: str) -> StoredFile:
+        raise NotImplementedError
+
+    def delete(self, public_id: str) -> None:
+        raise NotImplementedError
+
+    def read(self, public_id: str) -> bytes:
+        raise NotImplementedError
+
+    def url(self, public_id: str, **options) -> str:
+        raise NotImplementedError
+
+    def transform(self, public_id: str, effect: str) -> str:
+        raise NotImplementedError
+
+
+class LocalStorage(StorageBackend):
+    """
+    Files on local disk under root, served by app.routes.media.
+
+    Public id is the path of file relative to root. Uploads are written to
+    a temporary file and renamed, so readers never see a partial file.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, root: str = settings.storage_local_dir, base_url: str = settings.storage_local_url):
+        self.root = Path(root).resolve()
+        self.base_url = base_url.rstrip("/")
+
+    def path(self, public_id: str) -> Path:
+        """
+        Path of file.
+
+        Args:
+            public_id (str):  Public id.
+        Raises:
+            HTTPException:  HTTP_404_NOT_FOUND if public id points outside of root.
+        Returns:
+            Path:  Path under root.
+        """
+        path = (self.root / public_id).resolve()
+        if not path.is_relative_to(self.root) or path == self.root:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+        return path
+
+    def upload(self, file: BinaryIO, public_id: str) -> StoredFile:
+        path = self.path(public_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        file.seek(0)
+        with tempfile.NamedTemporaryFile(dir=path.parent, prefix=".upload-", delete=False) as stored:
+            while chunk := file.read(self.chunk_size):
+                stored.write(chunk)
+        os.replace(stored.name, path)
+        version = path.stat().st_mtime_ns // 1_000_000
+        return StoredFile(public_id=public_id, url=self.url(public_id, version=version), version=version)
+
+    def delete(self, public_id: str) -> None:
+        self.path(public_id).unlink(missing_ok=True)
+
+    def read(self, public_id: str) -> bytes:
+        return self.path(public_id).read_bytes()
+
+    def url(self, public_id: str, **options) -> str:
+        # resizing options of Cloudinary are ignored, version busts browser caches
+        version = options.get("version")
+        url = f"{self.base_url}/{public_id}"
+        return f"{url}?v={version}" if version else url
+
+    def transform(self, public_id: str, effect: str) -> str:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Effects are not supported by local storage",
+        )
+
+    def response(self, public_id: str, headers: Mapping[str, str]) -> Response:
+        """
+        Response with file, honouring conditional and Range request headers.
+
+        Args:
+            public_id (str):  Public id.
+            headers (Mapping[str, str]):  Request headers.
+        Raises:
+            HTTPException:  HTTP_404_NOT_FOUND
+        Returns:
+            Response:  200, 206, 304 or 416 response.
+        """
+        path = self.path(public_id)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+        if not path.is_file():
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        validators = {"etag": etag, "last-modified": last_modified, "cache-control": "public, max-age=3600"}
+
+        if _not_modified(headers, etag, int(stat.st_mtime)):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators)
+
+        size = stat.st_size
+        byte_range = None
+        if_range = headers.get("if-range")
+        range_header = headers.get("range", "")
+        # other units and multiple ranges are ignored, the whole file is sent
+        if (range_header.startswith("bytes=") and "," not in range_header
+                and (if_range is None or if_range in (etag, last_modified))):
+            byte_range = _parse_range(range_header, size)
+            if byte_range is None:
+                return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                                headers={"content-range": f"bytes */{size}"})
+
+        response_headers = {**validators, "accept-ranges": "bytes"}
+        if byte_range is None:
+            start, end, status_code = 0, size - 1, status.HTTP_200_OK
+        else:
+            (start, end), status_code = byte_range, status.HTTP_206_PARTIAL_CONTENT
+            response_headers["content-range"] = f"bytes {start}-{end}/{size}"
+        return SendfileResponse(path, start, end - start + 1, status_code, response_headers, _media_type(path))
+
+
+def _not_modified(headers: Mapping[str, str], etag: str, mtime: int) -> bool:
+    """
+    Internal function for def LocalStorage.response
+
+    If-None-Match wins over If-Modified-Since, as RFC 9110 requires.
+
+    Args:
+        headers (Mapping[str, str]):  Request headers.
+        etag (str):  ETag of file.
+        mtime (int):  Modification time of file, seconds.
+    Returns:
+        bool:  True if client copy is still valid.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return mtime <= since.timestamp()
+    return False
+
+
+def _parse_range(header: str, size: int) -> Tuple[int, int] | None:
+    """
+    Internal function for def LocalStorage.response
+
+    Only one range is served, a multipart response is not worth it for photos.
+
+    Args:
+        header (str):  Range header, e.g. "bytes=0-1023", "bytes=1024-", "bytes=-512".
+        size (int):  File size.
+    Returns:
+        Tuple[int, int] | None:  First and last byte, None if range is not satisfiable.
+    """
+    first, _, last = header.removeprefix("bytes=").strip().partition("-")
+    try:
+        if not first:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def _media_type(path: Path) -> str:
+    """
+    Internal function for def LocalStorage.response
+
+    Args:
+        path (Path):  File.
+    Returns:
+        str:  Media type by file signature.
+    """
+    with path.open("rb") as file:
+        head = file.read(SNIFF_SIZE)
+    return sniff_media_type(head) or "application/octet-stream"
+
+
+def sniff_media_type(head: bytes) -> str | None:
+    """
+    Media type of image by its signature, whatever the client claims.
+
+    Args:
+        head (bytes):  First SNIFF_SIZE bytes of file, or the whole file if it is shorter.
+    Returns:
+        str | None:  "image/jpeg", "image/png", "image/gif", "image/webp" or None.
+    """
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, media_type in _MEDIA_TYPES:
+        if head.startswith(signature):
+            return media_type
+    return None
+
+
+class SendfileResponse(Response):
+    """
+    Response with count bytes of file from offset.
+
+    The file is sent with the ASGI zero-copy extension (os.sendfile in the
+    server) when the server offers it, otherwise in chunks read in a thread.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: Path, offset: int, count: int, status_code: int,
+                 headers: Mapping[str, str], media_type: str):
+        super().__init__(status_code=status_code,
+                         headers={**headers, "content-length": str(count)},
+                         media_type=media_type)
+        self.path = path
+        self.offset = offset
+        self.count = count
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with self.path.open("rb") as file:
+                await send({"type": "http.response.zerocopysend",
+                            "file": file,
+                            "offset": self.offset,
+                            "count": self.count})
+            return
+
+        async with await anyio.open_file(self.path, "rb") as file:
+            await file.seek(self.offset)
+            remaining = self.count
+            while remaining:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining:
+                # file was truncated while sent
+                await send({"type": "http.response.body", "body": b""})
+
+
+def create_storage() -> StorageBackend:
+    """
+    Storage backend selected by settings.storage_backend.
+
+    Returns:
+        StorageBackend:  LocalStorage for "local", CloudinaryStorage otherwise.
+    """
+    if settings.storage_backend == "local":
+        return LocalStorage()
+    from app.services.cloudinary import CloudinaryStorage
+    return CloudinaryStorage()
+
+
+_storage: StorageBackend | None = None
+
+
+def get_storage() -> StorageBackend:
+    """
+    Storage backend of the app, created on first use.
+
+    Returns:
+        StorageBackend:  Storage.
+    """
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
+
+
+def set_storage(storage: StorageBackend | None) -> None:
+    """
+    Replace storage backend, None recreates it from settings on next use.
+
+    Args:
+        storage (StorageBackend | None):  Storage.
+    """
+    global _storage
+    _storage = storage
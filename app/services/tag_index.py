@@ -0,0 +1,181 @@
+import heapq
+import math
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.conf.config import settings
+from app.models import Tag, post_m2m_tag, maybe_await
+
+# same threshold as pg_trgm.similarity_threshold
+SIMILARITY_THRESHOLD = 0.3
+PREFIX_BONUS = 0.5
+POPULARITY_WEIGHT = 0.1
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+    Trigrams of text, words are padded like in pg_trgm.
+
+    Args:
+        text (str):  Text.
+    Returns:
+        Set[str]:  Trigrams.
+    """
+    result = set()
+    for word in text.lower().split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            result.add(padded[i:i + 3])
+    return result
+
+
+@dataclass
+class TagSuggestion:
+    id: int
+    text: str
+    posts_count: int
+    score: float
+
+
+class TagSuggestIndex:
+    """
+    In-process trigram and prefix index of tags for autocomplete.
+
+    Index is built from the tags table with the number of posts per tag and
+    rebuilt every settings.tag_suggest_ttl seconds, so tags created by other
+    workers show up. Tags created by this process are added at once.
+    """
+
+    def __init__(self, ttl: int = settings.tag_suggest_ttl):
+        self.ttl = ttl
+        self.built_at = None
+        self._tags: Dict[int, Tuple[str, int, int]] = {}
+        self._trigrams: Dict[str, Set[int]] = defaultdict(set)
+        self._texts: List[Tuple[str, int]] = []
+
+    @property
+    def is_fresh(self) -> bool:
+        """
+        Index is built and not older than ttl.
+        """
+        return self.built_at is not None and time.monotonic() - self.built_at < self.ttl
+
+    def build(self, tags: Iterable[Tuple[int, str, int]]) -> None:
+        """
+        Build index.
+
+        Args:
+            tags (Iterable[Tuple[int, str, int]]):  Tag.id, Tag.text, number of posts.
+        """
+        self._tags = {}
+        self._trigrams = defaultdict(set)
+        self._texts = []
+        for tag_id, text, posts_count in tags:
+            self._add(tag_id, text, posts_count)
+        self._texts.sort()
+        self.built_at = time.monotonic()
+
+    async def load(self, db: Session) -> None:
+        """
+        Build index from the tags table.
+
+        Args:
+            db (Session):  The database session.
+        """
+        rows = await maybe_await(db.execute(
+            select(Tag.id, Tag.text, func.count(post_m2m_tag.c.post_id))
+            .outerjoin(post_m2m_tag, post_m2m_tag.c.tag_id == Tag.id)
+            .group_by(Tag.id, Tag.text)
+        ))
+        self.build(rows.all())
+
+    def add(self, tag: Tag) -> None:
+        """
+        Add new tag. Does nothing until index is built.
+
+        Args:
+            tag (Tag):  Database object Tag.
+        """
+        if self.built_at is None or tag.id in self._tags:
+            return
+        self._add(tag.id, tag.text, 0, keep_sorted=True)
+
+    def suggest(self, query: str, limit: int = 10) -> List[TagSuggestion]:
+        """
+        Top tags for query.
+
+        Tags starting with query and tags similar to query are ranked by
+        trigram similarity, prefix match and number of posts.
+
+        Args:
+            query (str):  Beginning or part of tag.
+            limit (int, optional):  Number of tags, defaults to 10.
+        Returns:
+            List[TagSuggestion]:  Tags, best first.
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        query_trigrams = trigrams(query)
+
+        shared: Dict[int, int] = defaultdict(int)
+        for trigram in query_trigrams:
+            for tag_id in self._trigrams.get(trigram, ()):
+                shared[tag_id] += 1
+        prefixed = set(self._prefixed(query))
+
+        candidates = []
+        for tag_id in prefixed.union(shared):
+            text, posts_count, trigrams_count = self._tags[tag_id]
+            common = shared.get(tag_id, 0)
+            similarity = common / (len(query_trigrams) + trigrams_count - common)
+            is_prefix = tag_id in prefixed
+            if similarity < SIMILARITY_THRESHOLD and not is_prefix:
+                continue
+            score = similarity + (PREFIX_BONUS if is_prefix else 0) + POPULARITY_WEIGHT * math.log1p(posts_count)
+            candidates.append(TagSuggestion(tag_id, text, posts_count, round(score, 4)))
+        return heapq.nlargest(limit, candidates, key=lambda tag: (tag.score, -tag.id))
+
+    def _prefixed(self, prefix: str) -> List[int]:
+        result = []
+        for i in range(bisect_left(self._texts, (prefix, -1)), len(self._texts)):
+            text, tag_id = self._texts[i]
+            if not text.startswith(prefix):
+                break
+            result.append(tag_id)
+        return result
+
+    def _add(self, tag_id: int, text: str, posts_count: int, keep_sorted: bool = False) -> None:
+        tag_trigrams = trigrams(text)
+        self._tags[tag_id] = (text, posts_count, len(tag_trigrams))
+        for trigram in tag_trigrams:
+            self._trigrams[trigram].add(tag_id)
+        if keep_sorted:
+            insort(self._texts, (text.lower(), tag_id))
+        else:
+            self._texts.append((text.lower(), tag_id))
+
+
+tag_suggest_index = TagSuggestIndex()
+
+
+async def suggest_tags(query: str, limit: int, db: Session) -> List[TagSuggestion]:
+    """
+    Tags autocomplete.
+
+    Args:
+        query (str):  Beginning or part of tag.
+        limit (int):  Number of tags.
+        db (Session):  The database session, used only to rebuild index.
+    Returns:
+        List[TagSuggestion]:  Tags, best first.
+    """
+    if not tag_suggest_index.is_fresh:
+        await tag_suggest_index.load(db)
+    return tag_suggest_index.suggest(query, limit)
@@ -0,0 +1,558 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from io import BytesIO
+from typing import Any, AsyncIterator, BinaryIO, Callable, Dict
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.conf.config import settings
+from app.services.metrics import Metrics, metrics
+from app.services.storage import SNIFF_SIZE, get_storage, sniff_media_type
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# multipart boundaries and form fields on top of the file
+FORM_OVERHEAD = 64 * 1024
+# photos staged in the storage backend, see def stage_spooled
+STAGED_PREFIX = "staged:"
+STAGING_FOLDER = "staging"
+
+
+class UploadQueueFull(HTTPException):
+    """
+    All upload workers are busy and the queue is full.
+    """
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many uploads in progress, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class UploadTooLarge(HTTPException):
+    """
+    Upload is larger than allowed.
+    """
+
+    def __init__(self, max_size: int):
+        super().__init__(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File is larger than {max_size} bytes",
+        )
+
+
+class UnsupportedMediaType(HTTPException):
+    """
+    Upload is not an image of a supported format.
+    """
+
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="File is not a JPEG, PNG, GIF or WebP image",
+        )
+
+
+class UploadStats:
+    """
+    Timing of one kind of upload.
+
+    Wait is the time in the queue before a worker picks the upload,
+    duration is the time of the upload itself.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.duration_total = 0.0
+        self.duration_max = 0.0
+
+    def record(self, wait: float, duration: float, failed: bool) -> None:
+        self.count += 1
+        self.errors += int(failed)
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.duration_total += duration
+        self.duration_max = max(self.duration_max, duration)
+
+    def as_dict(self) -> dict:
+        count = self.count or 1
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "wait_avg_ms": round(self.wait_total / count * 1000, 3),
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+            "duration_avg_ms": round(self.duration_total / count * 1000, 3),
+            "duration_max_ms": round(self.duration_max * 1000, 3),
+        }
+
+
+class UploadExecutor:
+    """
+    Bounded thread pool for blocking uploads to Cloudinary.
+
+    At most workers uploads run at once and at most queue_size wait for a
+    worker, the next one is rejected with HTTP 429, so a burst of uploads
+    can't pile up in memory. The event loop keeps serving other requests
+    while uploads are in flight.
+    """
+
+    def __init__(self, workers: int = settings.upload_workers,
+                 queue_size: int = settings.upload_queue_size):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.pending = 0
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, UploadStats] = defaultdict(UploadStats)
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_size
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upload")
+        return self._executor
+
+    def ensure_capacity(self, name: str = "upload") -> None:
+        """
+        Reject early when there is no room for one more upload.
+
+        Args:
+            name (str, optional):  Kind of upload for stats.
+        Raises:
+            UploadQueueFull:  HTTP_429_TOO_MANY_REQUESTS
+        """
+        with self._lock:
+            if self.pending >= self.capacity:
+                self._stats[name].rejected += 1
+                raise UploadQueueFull()
+
+    async def run(self, name: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run blocking function in upload worker.
+
+        Args:
+            name (str):  Kind of upload for stats.
+            func (Callable):  Blocking function.
+        Raises:
+            UploadQueueFull:  HTTP_429_TOO_MANY_REQUESTS
+        Returns:
+            Any:  Result of func.
+        """
+        with self._lock:
+            if self.pending >= self.capacity:
+                self._stats[name].rejected += 1
+                raise UploadQueueFull()
+            self.pending += 1
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self._stats[name].record(started - submitted, finished - started, failed)
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, timed)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def stats(self) -> dict:
+        """
+        Executor state and timing per kind of upload.
+
+        Returns:
+            dict:  Stats, times in milliseconds.
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "pending": self.pending,
+                "uploads": {name: stats.as_dict() for name, stats in self._stats.items()},
+            }
+
+    def collect_metrics(self, registry: Metrics) -> None:
+        """
+        Set gauges of executor, see app.services.metrics.Metrics.add_collector.
+
+        Args:
+            registry (Metrics):  Metrics of this process.
+        """
+        registry.set_gauge("upload_executor_pending", self.pending)
+        registry.set_gauge("upload_executor_capacity", self.capacity)
+
+    def shutdown(self) -> None:
+        """
+        Wait for running uploads and stop workers.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+upload_executor = UploadExecutor()
+metrics.add_collector(upload_executor.collect_metrics)
+
+
+class SpooledUpload:
+    """
+    Upload streamed to memory and, past threshold bytes, to a file in the
+    spool directory.
+
+    Size, SHA-256 and media type are computed while the stream is written,
+    so the content is read once and never held in memory beyond threshold.
+    """
+
+    def __init__(self, directory: str, threshold: int):
+        self.directory = directory
+        self.threshold = threshold
+        self.size = 0
+        self.media_type: str | None = None
+        self.path: str | None = None
+        self._digest = hashlib.sha256()
+        self._file: BinaryIO = BytesIO()
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    @property
+    def file(self) -> BinaryIO:
+        self._file.seek(0)
+        return self._file
+
+    def write(self, chunk: bytes) -> None:
+        """
+        Append chunk, blocking once the upload is on disk.
+
+        Args:
+            chunk (bytes):  Next bytes of upload.
+        """
+        self._digest.update(chunk)
+        self.size += len(chunk)
+        if self.path is None and self.size > self.threshold:
+            self._roll_over()
+        self._file.write(chunk)
+
+    def persist(self) -> str:
+        """
+        Leave upload in the spool directory for the job worker, blocking.
+
+        Returns:
+            str:  Path of spooled file, the caller removes it with def discard_spooled.
+        """
+        if self.path is None:
+            self._roll_over()
+        self._file.close()
+        return self.path
+
+    def discard(self) -> None:
+        """
+        Drop upload and its spooled file, blocking.
+        """
+        self._file.close()
+        if self.path is not None:
+            discard_spooled(self.path)
+
+    def _roll_over(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        spooled = tempfile.NamedTemporaryFile(dir=self.directory, prefix="upload-", delete=False)
+        spooled.write(self._file.getvalue())
+        self._file = spooled
+        self.path = spooled.name
+
+
+async def ingest_stream(chunks: AsyncIterator[bytes],
+                        directory: str | None = None,
+                        max_size: int | None = None,
+                        threshold: int | None = None) -> SpooledUpload:
+    """
+    Stream upload to a SpooledUpload, checking it before anything else is done with it.
+
+    The media type is sniffed from the first bytes and the size is checked
+    on every chunk, so a wrong or oversized upload is rejected as soon as
+    it shows, without reading the rest of it.
+
+    Args:
+        chunks (AsyncIterator[bytes]):  Content of upload.
+        directory (str, optional):  Spool directory, defaults to settings.upload_spool_dir.
+        max_size (int, optional):  Largest size, defaults to settings.upload_max_size.
+        threshold (int, optional):  Bytes kept in memory, defaults to settings.upload_memory_threshold.
+    Raises:
+        UploadTooLarge:  HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        UnsupportedMediaType:  HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    Returns:
+        SpooledUpload:  Upload with size, SHA-256 and media type.
+    """
+    max_size = max_size or settings.upload_max_size
+    upload = SpooledUpload(directory or settings.upload_spool_dir,
+                           threshold if threshold is not None else settings.upload_memory_threshold)
+    head = b""
+    try:
+        async for chunk in chunks:
+            if upload.size + len(chunk) > max_size:
+                raise UploadTooLarge(max_size)
+            if upload.media_type is None and len(head) < SNIFF_SIZE:
+                head += chunk[:SNIFF_SIZE - len(head)]
+                if len(head) == SNIFF_SIZE:
+                    upload.media_type = __sniff(head)
+            if upload.path is not None or upload.size + len(chunk) > upload.threshold:
+                await run_in_threadpool(upload.write, chunk)
+            else:
+                upload.write(chunk)
+        if upload.media_type is None:
+            upload.media_type = __sniff(head)
+    except BaseException:
+        await run_in_threadpool(upload.discard)
+        raise
+    return upload
+
+
+def __sniff(head: bytes) -> str:
+    """
+    Internal function for def ingest_stream
+
+    Args:
+        head (bytes):  First bytes of upload.
+    Raises:
+        UnsupportedMediaType:  HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    Returns:
+        str:  Media type.
+    """
+    media_type = sniff_media_type(head)
+    if media_type is None:
+        raise UnsupportedMediaType()
+    return media_type
+
+
+async def ingest_upload(file: UploadFile,
+                        directory: str | None = None,
+                        max_size: int | None = None) -> SpooledUpload:
+    """
+    Stream UploadFile of a multipart form to a SpooledUpload, see def ingest_stream.
+
+    Args:
+        file (UploadFile):  Uploaded file.
+        directory (str, optional):  Spool directory, defaults to settings.upload_spool_dir.
+        max_size (int, optional):  Largest size, defaults to settings.upload_max_size.
+    Raises:
+        UploadTooLarge:  HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        UnsupportedMediaType:  HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    Returns:
+        SpooledUpload:  Upload with size, SHA-256 and media type.
+    """
+    await file.seek(0)
+    return await ingest_stream(__chunks(file), directory, max_size)
+
+
+async def __chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    """
+    Internal function for def ingest_upload
+
+    Args:
+        file (UploadFile):  Uploaded file.
+    Returns:
+        AsyncIterator[bytes]:  Chunks of CHUNK_SIZE.
+    """
+    while chunk := await file.read(CHUNK_SIZE):
+        yield chunk
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Reject request bodies larger than max_size with HTTP 413.
+
+    A declared Content-Length is checked before the body is read, a chunked
+    body is counted while the app reads it, so a multipart upload is cut
+    off before it is parsed to the end.
+    """
+
+    def __init__(self, app: ASGIApp, max_size: int):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_size:
+            error = UploadTooLarge(self.max_size)
+            response = JSONResponse({"detail": error.detail}, status_code=error.status_code)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    raise UploadTooLarge(self.max_size)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def discard_spooled(path: str) -> None:
+    """
+    Remove spooled file, if it is still there.
+
+    Args:
+        path (str):  Path of spooled file.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def stage_spooled(path: str) -> str:
+    """
+    Make spooled file readable by the job worker on any host, by settings.upload_staging.
+
+    With "spool" the job gets the path, the spool directory must be shared
+    by all hosts consuming the job queue. With "storage" the file is
+    uploaded to the storage backend and removed from the spool.
+
+    Args:
+        path (str):  Path of spooled file.
+    Raises:
+        UploadQueueFull:  HTTP_429_TOO_MANY_REQUESTS
+    Returns:
+        str:  Staged photo for the job, read it with def fetch_staged, remove it with def discard_staged.
+    """
+    if settings.upload_staging != "storage":
+        return path
+    public_id = f"{STAGING_FOLDER}/{os.path.basename(path)}"
+    await upload_executor.run("stage_photo", __upload_spooled, path, public_id)
+    discard_spooled(path)
+    return STAGED_PREFIX + public_id
+
+
+def __upload_spooled(path: str, public_id: str) -> None:
+    """
+    Internal function for def stage_spooled
+
+    Args:
+        path (str):  Path of spooled file.
+        public_id (str):  Public id in storage.
+    """
+    with open(path, "rb") as file:
+        get_storage().upload(file, public_id)
+
+
+@asynccontextmanager
+async def fetch_staged(staged: str) -> AsyncIterator[str]:
+    """
+    Local path of staged photo while the block runs.
+
+    A photo staged in the storage backend is downloaded to the spool
+    directory and removed from there after the block, it stays in storage
+    until def discard_staged.
+
+    Args:
+        staged (str):  Result of def stage_spooled.
+    Returns:
+        AsyncIterator[str]:  Path of photo.
+    """
+    if not staged.startswith(STAGED_PREFIX):
+        yield staged
+        return
+    data = await upload_executor.run("fetch_photo", get_storage().read, staged.removeprefix(STAGED_PREFIX))
+    path = await run_in_threadpool(__spool_bytes, data)
+    try:
+        yield path
+    finally:
+        discard_spooled(path)
+
+
+def __spool_bytes(data: bytes) -> str:
+    """
+    Internal function for def fetch_staged
+
+    Args:
+        data (bytes):  Photo.
+    Returns:
+        str:  Path of file in the spool directory.
+    """
+    os.makedirs(settings.upload_spool_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=settings.upload_spool_dir, prefix="staged-", delete=False) as spooled:
+        spooled.write(data)
+    return spooled.name
+
+
+async def discard_staged(staged: str) -> None:
+    """
+    Remove staged photo from the spool or the storage backend.
+
+    A failed removal from storage is logged, the photo is left behind.
+
+    Args:
+        staged (str):  Result of def stage_spooled.
+    """
+    if not staged.startswith(STAGED_PREFIX):
+        discard_spooled(staged)
+        return
+    try:
+        await upload_executor.run("discard_photo", get_storage().delete, staged.removeprefix(STAGED_PREFIX))
+    except Exception as err:
+        logger.warning("Staged photo %s is not removed: %s", staged, err)
+
+
+async def file_digest(file: BinaryIO) -> str:
+    """
+    SHA-256 of file content, read in a thread.
+
+    Args:
+        file (BinaryIO):  File object, read from the start.
+    Returns:
+        str:  Hex digest.
+    """
+    return await run_in_threadpool(__digest, file)
+
+
+def __digest(file: BinaryIO) -> str:
+    """
+    Internal function for def file_digest
+
+    Args:
+        file (BinaryIO):  File object.
+    Returns:
+        str:  Hex digest.
+    """
+    file.seek(0)
+    return hashlib.file_digest(file, "sha256").hexdigest()
@@ -0,0 +1,109 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+from PIL import Image
+
+from app.conf.config import settings
+from app.services.storage import get_storage
+from app.services.uploads import upload_executor
+
+VARIANT_WIDTHS = (256, 512, 1024)
+VARIANT_FORMATS = ("webp", "jpeg")
+
+_PIL_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+
+
+def render_variants(image: Image.Image,
+                    widths: Iterable[int],
+                    formats: Iterable[str] = VARIANT_FORMATS,
+                    quality: int = 80) -> Dict[Tuple[int, str], bytes]:
+    """
+    Resize decoded photo to every width, in every format.
+
+    Runs in a worker process of VariantPool, see
+    app.services.analysis.analyse_photo. Every width is resized from the
+    previous larger one, so a big photo is scanned once.
+
+    Args:
+        image (Image.Image):  Upright RGB photo.
+        widths (Iterable[int]):  Widths in pixels, narrower than the original photo.
+        formats (Iterable[str], optional):  "webp" and/or "jpeg".
+        quality (int, optional):  Encoder quality.
+    Returns:
+        Dict[Tuple[int, str], bytes]:  (width, format) -> encoded image.
+    """
+    result = {}
+    ratio = image.height / image.width
+    for width in sorted(set(widths), reverse=True):
+        image = image.resize((width, max(1, round(width * ratio))), Image.Resampling.LANCZOS)
+        for variant_format in formats:
+            buffer = BytesIO()
+            image.save(buffer, _PIL_FORMATS[variant_format], quality=quality, optimize=True)
+            result[(width, variant_format)] = buffer.getvalue()
+    return result
+
+
+class VariantPool:
+    """
+    Process pool for resizing photos and rendering effects.
+
+    Image work is CPU bound, in threads it would hold the GIL and slow down
+    the event loop, so it runs in worker processes.
+    """
+
+    def __init__(self, workers: int = settings.variant_workers):
+        self.workers = workers
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # forked children would inherit locks of upload threads
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def run(self, func: Callable, *args) -> Any:
+        """
+        Run picklable function in a worker process.
+
+        Args:
+            func (Callable):  Module level function.
+        Returns:
+            Any:  Result of func.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def shutdown(self) -> None:
+        """
+        Wait for running jobs and stop worker processes.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+variant_pool = VariantPool()
+
+
+async def store_variants(rendered: Dict[Tuple[int, str], bytes], public_id: str) -> Dict[str, Dict[str, str]]:
+    """
+    Store thumbnails of photo next to it.
+
+    Args:
+        rendered (Dict[Tuple[int, str], bytes]):  PhotoAnalysis.variants of app.services.analysis.
+        public_id (str):  Storage public id of photo.
+    Returns:
+        Dict[str, Dict[str, str]]:  {"256": {"webp": url, "jpeg": url}, ...}
+    """
+    storage = get_storage()
+    variants: Dict[str, Dict[str, str]] = {}
+    for (width, variant_format), content in rendered.items():
+        stored = await upload_executor.run("upload_variant", storage.upload,
+                                           BytesIO(content), f"{public_id}_{width}_{variant_format}")
+        variants.setdefault(str(width), {})[variant_format] = stored.url
+    return variants
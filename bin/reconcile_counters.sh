@@ -0,0 +1,3 @@
+#!/bin/bash
+
+docker-compose exec fastapi-app poetry run python -m app.commands.reconcile_counters
@@ -1,3 +1,4 @@
+import logging
 from typing import Annotated, Optional
 import httpx
 
@@ -21,6 +22,8 @@ from app.schemas.user import UserResponse
 
 # app = FastAPI()
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 templates = Jinja2Templates(directory="front/templates")
@@ -55,7 +58,6 @@ async def get_user_from_request(request: Request) -> Optional[User]:
             async with AsyncClient() as client:
                 response = await client.get(api_url, headers=headers)
                 response_json = response.json()
-                print(f"!!!!!!!!!!  {response_json=}")
                 if response.status_code == 200:
                     user = User(**response_json)
     return user
@@ -93,6 +95,7 @@ async def get_home(
 )
 async def get_my_posts_page(
     request: Request,
+    cursor: Optional[str] = None,
     token: Optional[str] = Depends(get_token_optional),
     user: Optional[User] = Depends(get_user_from_request),
 ):
@@ -100,13 +103,14 @@ async def get_my_posts_page(
 
     api_path = app.url_path_for("get_posts")
     api_url = f"{request.url.scheme}://{request.url.netloc}{api_path}"
+    params = {"cursor": cursor} if cursor else {}
     if token:
         headers = {"Authorization": f"Bearer {token}"}
         try:
             async with httpx.AsyncClient() as client:
-                response = await client.get(api_url, headers=headers)
+                response = await client.get(api_url, params=params, headers=headers)
         except Exception as err:
-            print(f"##### Exception {err=}")
+            logger.warning("Posts are not loaded: %s", err)
             ...
         if response.status_code != 200:
             return templates.TemplateResponse(
@@ -125,12 +129,12 @@ async def get_my_posts_page(
             context={
                 "request": request,
                 "posts": response.json(),
+                "next_cursor": response.headers.get("X-Next-Cursor"),
                 "user": user,
                 "is_user": True if user else False,
             },
         )
     else:
-        print("_______ Not user and token")
         return templates.TemplateResponse(
             request=request,
             name="posts_my.html",
@@ -150,6 +154,7 @@ async def get_my_posts_page(
 )
 async def get_all_posts_page(
     request: Request,
+    cursor: Optional[str] = None,
     token: Optional[str] = Depends(get_token_optional),
     user: Optional[User] = Depends(get_user_from_request),
 ):
@@ -162,15 +167,15 @@ async def get_all_posts_page(
         headers = {"Authorization": f"Bearer {token}"}
     else:
         headers = request.headers
+    params = {"cursor": cursor} if cursor else {}
 
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.get(api_url, headers=headers)
+            response = await client.get(api_url, params=params, headers=headers)
     except Exception as err:
-        print("!!!!! error", err)
+        logger.warning("Posts are not loaded: %s", err)
         return {"err": err}
 
-    print(f"{response=}")
     if response.status_code != 200:
         return templates.TemplateResponse(
             request=request,
@@ -189,6 +194,7 @@ async def get_all_posts_page(
         context={
             "request": request,
             "posts": response.json(),
+            "next_cursor": response.headers.get("X-Next-Cursor"),
             "user": user,
             "is_user": True if user else False,
         },
@@ -243,10 +249,9 @@ async def post_create_post_page(
         api_url = f"{request.url.scheme}://{request.url.netloc}{api_path}"
         api_url = str(request.url_for("create_post"))
 
-        file_content = await photo.read()
-
+        # photo is streamed from its spooled file, not read into memory
         params = {"description": description, "tags": tags}
-        file = {"file": (photo.filename, file_content, photo.content_type)}
+        file = {"file": (photo.filename, photo.file, photo.content_type)}
 
         async with httpx.AsyncClient() as client:
             response = await client.post(
@@ -254,8 +259,8 @@ async def post_create_post_page(
             )
 
         response_json_py = response.json()
-        if response.status_code != 201:
-            print(f"create error:{response.status_code=}")
+        if response.status_code not in (status.HTTP_201_CREATED, status.HTTP_202_ACCEPTED):
+            logger.info("Post is not created: %s", response.status_code)
             return templates.TemplateResponse(
                 request=request,
                 name="post_create.html",
@@ -266,9 +271,8 @@ async def post_create_post_page(
                     "is_user": True if user else False,
                 },
             )
-        print("Return ")
         return JSONResponse(
-            content=response_json_py, status_code=status.HTTP_201_CREATED
+            content=response_json_py, status_code=response.status_code
         )
     return templates.TemplateResponse(
         request=request,
@@ -354,7 +358,6 @@ async def post_update_post_page(
         api_url = str(request.url_for("update_post", post_id=post_id))
 
         if True:
-            print(f"############# file {photo}")
             file_content = await photo.read()
             params = {"description": description, "tags": tags}
             file = {"file": (photo.filename, file_content, photo.content_type)}
@@ -365,7 +368,7 @@ async def post_update_post_page(
 
         response_json_py = response.json()
         if response.status_code != 200:
-            print(f"create error:{response.status_code=}")
+            logger.info("Post is not updated: %s", response.status_code)
             return templates.TemplateResponse(
                 request=request,
                 name="post_create.html",
@@ -434,7 +437,7 @@ async def fe_signup(
         async with httpx.AsyncClient() as client:
             response = await client.post(api_url, json=form_data)
     except Exception as err:
-        print("!!!!! error", err)
+        logger.warning("Sign up failed: %s", err)
         return {"err": err}
     if response.status_code != 201:
         return templates.TemplateResponse(
@@ -512,7 +515,7 @@ async def signin_page(
                     "is_user": True if user else False,
                 },
             )
-        print(f"create error:{response.status_code=}")
+        logger.info("Sign in failed: %s", response.status_code)
         return templates.TemplateResponse(
             request=request,
             name="auth/signin.html",
@@ -556,10 +559,7 @@ async def confirm_activation_form(
     async with httpx.AsyncClient() as client:
         response = await client.post(api_url, json={"token": token})
     if response.status_code != 200:
-        print(
-            response.status_code,
-            response.json(),
-        )
+        logger.info("Email is not confirmed: %s", response.status_code)
         res_json = response.json()
         message = f"Error activation email.\n{res_json}"
 
@@ -706,7 +706,6 @@ async def enter_new_password(
     password: str = Form(...),
     user: Optional[User] = Depends(get_user_from_request),
 ):
-    print("route post /new_password", token, password)
     from main import app
 
     api_path = app.url_path_for("reset_password")
@@ -754,15 +753,12 @@ async def comments_add_page(
 ):
     from main import app
 
-    print("route post /posts/{post_id}/comments", post_id, comment)
-    print(f"post_id = {post_id} {type(post_id)}, comment = {comment}")
 
     headers = {}
     is_token = False
     if "authorization" in request.headers:
         headers["Authorization"] = request.headers["Authorization"]
         is_token = True
-    print(f"/post create token = {is_token}")
     if is_token:
         api_path = app.url_path_for("create_comments")
         api_url = f"{request.url.scheme}://{request.url.netloc}{api_path}"
@@ -774,8 +770,8 @@ async def comments_add_page(
             response = await client.post(api_url, json=params, headers=headers)
 
         response_json_py = response.json()
-        if response.status_code != 201:
-            print(f"create error:{response.status_code=}")
+        if response.status_code not in (status.HTTP_201_CREATED, status.HTTP_202_ACCEPTED):
+            logger.info("Comment is not created: %s", response.status_code)
             return templates.TemplateResponse(
                 request=request,
                 name="post_id.html",
@@ -787,9 +783,8 @@ async def comments_add_page(
                     "is_user": True if user else False,
                 },
             )
-        print("Return ")
         return JSONResponse(
-            content=response_json_py, status_code=status.HTTP_201_CREATED
+            content=response_json_py, status_code=response.status_code
         )
     return templates.TemplateResponse(
         request=request,
@@ -0,0 +1,85 @@
+// Paints BlurHash placeholders of photos while they load, hashes are
+// computed at upload by app/services/placeholders.py.
+(function () {
+  const digits = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+  function decode83(text) {
+    let value = 0
+    for (const char of text) {
+      value = value * 83 + digits.indexOf(char)
+    }
+    return value
+  }
+
+  function toLinear(value) {
+    const v = value / 255
+    return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4)
+  }
+
+  function toSrgb(value) {
+    const v = Math.max(0, Math.min(1, value))
+    return v <= 0.0031308 ? Math.trunc(v * 12.92 * 255 + 0.5) : Math.trunc((1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255 + 0.5)
+  }
+
+  function signPow(value, exponent) {
+    return Math.sign(value) * Math.pow(Math.abs(value), exponent)
+  }
+
+  function decode(hash, width, height) {
+    const sizeFlag = decode83(hash[0])
+    const componentsY = Math.floor(sizeFlag / 9) + 1
+    const componentsX = (sizeFlag % 9) + 1
+    const maximum = (decode83(hash[1]) + 1) / 166
+    const dc = decode83(hash.substring(2, 6))
+    const colors = [[toLinear(dc >> 16), toLinear((dc >> 8) & 255), toLinear(dc & 255)]]
+    for (let i = 1; i < componentsX * componentsY; i++) {
+      const value = decode83(hash.substring(4 + i * 2, 6 + i * 2))
+      colors.push([
+        signPow((Math.floor(value / 361) - 9) / 9, 2) * maximum,
+        signPow((Math.floor(value / 19) % 19 - 9) / 9, 2) * maximum,
+        signPow((value % 19 - 9) / 9, 2) * maximum,
+      ])
+    }
+
+    const pixels = new Uint8ClampedArray(width * height * 4)
+    for (let y = 0; y < height; y++) {
+      for (let x = 0; x < width; x++) {
+        let red = 0, green = 0, blue = 0
+        for (let j = 0; j < componentsY; j++) {
+          for (let i = 0; i < componentsX; i++) {
+            const basis = Math.cos((Math.PI * x * i) / width) * Math.cos((Math.PI * y * j) / height)
+            const color = colors[i + j * componentsX]
+            red += color[0] * basis
+            green += color[1] * basis
+            blue += color[2] * basis
+          }
+        }
+        const offset = 4 * (x + y * width)
+        pixels[offset] = toSrgb(red)
+        pixels[offset + 1] = toSrgb(green)
+        pixels[offset + 2] = toSrgb(blue)
+        pixels[offset + 3] = 255
+      }
+    }
+    return pixels
+  }
+
+  function paint(canvas) {
+    try {
+      const pixels = decode(canvas.dataset.blurhash, canvas.width, canvas.height)
+      canvas.getContext('2d').putImageData(new ImageData(pixels, canvas.width, canvas.height), 0, 0)
+    } catch (error) {
+      console.error('BlurHash error:', error)
+    }
+  }
+
+  function paintAll() {
+    document.querySelectorAll('canvas[data-blurhash]').forEach(paint)
+  }
+
+  if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', paintAll)
+  } else {
+    paintAll()
+  }
+})()
@@ -4,10 +4,30 @@ from fastapi.staticfiles import StaticFiles
 from starlette.middleware.base import BaseHTTPMiddleware
 
 
-from app.routes import auth, users, posts, comments, tags, qrcode, admin
+from app.routes import auth, users, posts, comments, tags, qrcode, admin, internal, media, metrics
+from app.conf.config import settings
+from app.services.duplicates import rebuild_duplicate_index
+from app.services.jobs import job_worker
+from app.services.logs import RequestIdMiddleware, setup_logging
+from app.services.metrics import MetricsMiddleware, metrics as process_metrics
+from app.services.query_stats import QueryStatsMiddleware
+from app.services.resumable import collect_upload_sessions
+from app.services.uploads import FORM_OVERHEAD, RequestSizeLimitMiddleware, upload_executor
+from app.services.variants import variant_pool
 from front.routes import home
 
+setup_logging()
+
 app = FastAPI()
+app.add_event_handler("startup", rebuild_duplicate_index)
+app.add_event_handler("startup", collect_upload_sessions)
+app.add_event_handler("startup", process_metrics.start)
+app.add_event_handler("shutdown", process_metrics.stop)
+app.add_event_handler("shutdown", upload_executor.shutdown)
+app.add_event_handler("shutdown", variant_pool.shutdown)
+if settings.job_worker_in_app:
+    app.add_event_handler("startup", job_worker.start)
+    app.add_event_handler("shutdown", job_worker.stop)
 
 
 class HTTPSRedirectMiddleware(BaseHTTPMiddleware):
@@ -19,6 +39,11 @@ class HTTPSRedirectMiddleware(BaseHTTPMiddleware):
 
 
 app.add_middleware(HTTPSRedirectMiddleware)
+app.add_middleware(RequestSizeLimitMiddleware, max_size=settings.upload_max_size + FORM_OVERHEAD)
+# outermost, so they see the statements and time of all other middleware
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
 
 home.router.app = app
 
@@ -48,6 +73,9 @@ app.include_router(comments.router, prefix="/api")
 app.include_router(tags.router, prefix="/api")
 app.include_router(qrcode.router, prefix="/api")
 app.include_router(admin.router, prefix="/api")
+app.include_router(internal.router, prefix="/api")
+app.include_router(media.router, prefix="/api")
+app.include_router(metrics.router)
 app.include_router(home.router, include_in_schema=False)
 
 
@@ -0,0 +1,30 @@
+"""posts keyset pagination indexes
+
+Revision ID: 3b9d1f0a7c21
+Revises: ed764b44a4ac
+Create Date: 2026-10-18 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9d1f0a7c21'
+down_revision: Union[str, None] = 'ed764b44a4ac'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_posts_created_at_id', 'posts', ['created_at', 'id'])
+    op.create_index('ix_posts_rating_id', 'posts', [sa.text('coalesce(rating, 0)'), 'id'])
+    op.create_index('ix_posts_user_id_created_at_id', 'posts', ['user_id', 'created_at', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_posts_user_id_created_at_id', table_name='posts')
+    op.drop_index('ix_posts_rating_id', table_name='posts')
+    op.drop_index('ix_posts_created_at_id', table_name='posts')
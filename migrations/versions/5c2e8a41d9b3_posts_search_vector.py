@@ -0,0 +1,99 @@
+"""posts full text search vector
+
+Revision ID: 5c2e8a41d9b3
+Revises: 3b9d1f0a7c21
+Create Date: 2026-10-18 11:02:17.384520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2e8a41d9b3'
+down_revision: Union[str, None] = '3b9d1f0a7c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('posts', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+
+    # Tags have weight A, description has weight B
+    op.execute("""
+        CREATE FUNCTION posts_search_document(p_id integer, p_description text)
+        RETURNS tsvector AS $$
+            SELECT setweight(to_tsvector('simple', coalesce(
+                       (SELECT string_agg(tags.text, ' ')
+                        FROM tags JOIN post_m2m_tag ON post_m2m_tag.tag_id = tags.id
+                        WHERE post_m2m_tag.post_id = p_id), '')), 'A')
+                || setweight(to_tsvector('simple', coalesce(p_description, '')), 'B')
+        $$ LANGUAGE sql STABLE
+    """)
+    op.execute("""
+        CREATE FUNCTION posts_search_vector_trigger() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := posts_search_document(NEW.id, NEW.description);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER posts_search_vector_update
+        BEFORE INSERT OR UPDATE OF description ON posts
+        FOR EACH ROW EXECUTE FUNCTION posts_search_vector_trigger()
+    """)
+    op.execute("""
+        CREATE FUNCTION post_m2m_tag_search_vector_trigger() RETURNS trigger AS $$
+        DECLARE
+            changed_post_id integer;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                changed_post_id := OLD.post_id;
+            ELSE
+                changed_post_id := NEW.post_id;
+            END IF;
+            UPDATE posts SET search_vector = posts_search_document(id, description)
+            WHERE id = changed_post_id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER post_m2m_tag_search_vector_update
+        AFTER INSERT OR UPDATE OR DELETE ON post_m2m_tag
+        FOR EACH ROW EXECUTE FUNCTION post_m2m_tag_search_vector_trigger()
+    """)
+    op.execute("""
+        CREATE FUNCTION tags_search_vector_trigger() RETURNS trigger AS $$
+        BEGIN
+            UPDATE posts SET search_vector = posts_search_document(posts.id, posts.description)
+            FROM post_m2m_tag
+            WHERE post_m2m_tag.post_id = posts.id AND post_m2m_tag.tag_id = NEW.id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER tags_search_vector_update
+        AFTER UPDATE OF text ON tags
+        FOR EACH ROW EXECUTE FUNCTION tags_search_vector_trigger()
+    """)
+
+    op.execute("UPDATE posts SET search_vector = posts_search_document(id, description)")
+    op.create_index('ix_posts_search_vector', 'posts', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_posts_search_vector', table_name='posts', postgresql_using='gin')
+    op.execute("DROP TRIGGER tags_search_vector_update ON tags")
+    op.execute("DROP FUNCTION tags_search_vector_trigger()")
+    op.execute("DROP TRIGGER post_m2m_tag_search_vector_update ON post_m2m_tag")
+    op.execute("DROP FUNCTION post_m2m_tag_search_vector_trigger()")
+    op.execute("DROP TRIGGER posts_search_vector_update ON posts")
+    op.execute("DROP FUNCTION posts_search_vector_trigger()")
+    op.execute("DROP FUNCTION posts_search_document(integer, text)")
+    op.drop_column('posts', 'search_vector')
@@ -0,0 +1,28 @@
+"""tags text trigram index
+
+Revision ID: 7e41c0b2f6a8
+Revises: 5c2e8a41d9b3
+Create Date: 2026-10-18 11:48:05.190377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e41c0b2f6a8'
+down_revision: Union[str, None] = '5c2e8a41d9b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_tags_text_trgm', 'tags', ['text'],
+                    postgresql_using='gin', postgresql_ops={'text': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tags_text_trgm', table_name='tags')
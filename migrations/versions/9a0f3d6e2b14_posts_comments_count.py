@@ -0,0 +1,33 @@
+"""posts comments_count
+
+Revision ID: 9a0f3d6e2b14
+Revises: 7e41c0b2f6a8
+Create Date: 2026-10-18 12:31:44.671209
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a0f3d6e2b14'
+down_revision: Union[str, None] = '7e41c0b2f6a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('posts', sa.Column('comments_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from existing comments
+    op.execute("""
+        UPDATE posts SET comments_count = counts.comments_count
+        FROM (SELECT post_id, count(*) AS comments_count FROM comments GROUP BY post_id) AS counts
+        WHERE counts.post_id = posts.id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'comments_count')
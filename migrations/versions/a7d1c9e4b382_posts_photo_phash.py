@@ -0,0 +1,31 @@
+"""posts photo_phash and duplicate_of_id
+
+Revision ID: a7d1c9e4b382
+Revises: f5a8d3c2e917
+Create Date: 2026-10-18 18:41:26.504117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d1c9e4b382'
+down_revision: Union[str, None] = 'f5a8d3c2e917'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # filled on the next upload of post, lookups use the in-memory BK-tree, not an index
+    op.add_column('posts', sa.Column('photo_phash', sa.String(length=16), nullable=True))
+    op.add_column('posts', sa.Column('duplicate_of_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('posts_duplicate_of_id_fkey', 'posts', 'posts', ['duplicate_of_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    op.drop_constraint('posts_duplicate_of_id_fkey', 'posts', type_='foreignkey')
+    op.drop_column('posts', 'duplicate_of_id')
+    op.drop_column('posts', 'photo_phash')
@@ -0,0 +1,39 @@
+"""posts rating_sum and rating_count
+
+Revision ID: b4c7e2d91f05
+Revises: 9a0f3d6e2b14
+Create Date: 2026-10-18 13:05:52.908341
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4c7e2d91f05'
+down_revision: Union[str, None] = '9a0f3d6e2b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('posts', sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('posts', sa.Column('rating_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from existing ratings
+    op.execute("""
+        UPDATE posts
+        SET rating_sum = totals.rating_sum,
+            rating_count = totals.rating_count,
+            rating = round(totals.rating_sum::numeric / totals.rating_count, 2)
+        FROM (SELECT post_id, sum(rate) AS rating_sum, count(*) AS rating_count
+              FROM ratings GROUP BY post_id) AS totals
+        WHERE totals.post_id = posts.id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'rating_count')
+    op.drop_column('posts', 'rating_sum')
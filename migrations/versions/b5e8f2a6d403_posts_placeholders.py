@@ -0,0 +1,29 @@
+"""posts blurhash and dominant_color
+
+Revision ID: b5e8f2a6d403
+Revises: a7d1c9e4b382
+Create Date: 2026-10-18 19:12:40.218376
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e8f2a6d403'
+down_revision: Union[str, None] = 'a7d1c9e4b382'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # filled on the next upload of post
+    op.add_column('posts', sa.Column('blurhash', sa.String(length=64), nullable=True))
+    op.add_column('posts', sa.Column('dominant_color', sa.String(length=7), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'dominant_color')
+    op.drop_column('posts', 'blurhash')
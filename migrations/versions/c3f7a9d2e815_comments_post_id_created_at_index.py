@@ -0,0 +1,26 @@
+"""comments latest per post index
+
+Revision ID: c3f7a9d2e815
+Revises: b5e8f2a6d403
+Create Date: 2026-10-18 20:05:17.462931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f7a9d2e815'
+down_revision: Union[str, None] = 'b5e8f2a6d403'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_comments_post_id_created_at_id', 'comments', ['post_id', 'created_at', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_comments_post_id_created_at_id', table_name='comments')
@@ -0,0 +1,33 @@
+"""posts status
+
+Revision ID: c81e5a3f0d27
+Revises: b4c7e2d91f05
+Create Date: 2026-10-18 15:12:40.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81e5a3f0d27'
+down_revision: Union[str, None] = 'b4c7e2d91f05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+post_status_enum = postgresql.ENUM('pending', 'ready', 'failed', name='poststatus')
+
+
+def upgrade() -> None:
+    post_status_enum.create(op.get_bind(), checkfirst=True)
+
+    # Existing posts already have photos
+    op.add_column('posts', sa.Column('status', post_status_enum, server_default='ready', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'status')
+    post_status_enum.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,27 @@
+"""posts rating_override
+
+Revision ID: d2a6f1c8e340
+Revises: c3f7a9d2e815
+Create Date: 2026-10-18 20:12:40.518227
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a6f1c8e340'
+down_revision: Union[str, None] = 'c3f7a9d2e815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ratings set by admins before were overwritten by the next rate anyway
+    op.add_column('posts', sa.Column('rating_override', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'rating_override')
@@ -0,0 +1,26 @@
+"""posts variants
+
+Revision ID: e2f94b7a1c36
+Revises: c81e5a3f0d27
+Create Date: 2026-10-18 16:40:11.274519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2f94b7a1c36'
+down_revision: Union[str, None] = 'c81e5a3f0d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('posts', sa.Column('variants', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'variants')
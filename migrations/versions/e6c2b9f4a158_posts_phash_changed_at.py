@@ -0,0 +1,38 @@
+"""posts phash_changed_at, post_deletions
+
+Revision ID: e6c2b9f4a158
+Revises: d2a6f1c8e340
+Create Date: 2026-10-18 20:17:52.306914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6c2b9f4a158'
+down_revision: Union[str, None] = 'd2a6f1c8e340'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # existing posts get the time of the migration, running API processes build their indexes again anyway
+    op.add_column('posts', sa.Column('phash_changed_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+    op.create_index('ix_posts_phash_changed_at', 'posts', ['phash_changed_at'], unique=False)
+    op.create_table('post_deletions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_post_deletions_deleted_at'), 'post_deletions', ['deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_post_deletions_deleted_at'), table_name='post_deletions')
+    op.drop_table('post_deletions')
+    op.drop_index('ix_posts_phash_changed_at', table_name='posts')
+    op.drop_column('posts', 'phash_changed_at')
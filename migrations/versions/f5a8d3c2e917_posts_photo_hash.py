@@ -0,0 +1,27 @@
+"""posts photo_hash
+
+Revision ID: f5a8d3c2e917
+Revises: e2f94b7a1c36
+Create Date: 2026-10-18 17:55:03.861402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5a8d3c2e917'
+down_revision: Union[str, None] = 'e2f94b7a1c36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # filled on the next upload or effect of post
+    op.add_column('posts', sa.Column('photo_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'photo_hash')
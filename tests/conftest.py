@@ -1,10 +1,11 @@
 import sys
 import os
+from contextlib import contextmanager
 from unittest.mock import MagicMock
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
 # Add the parent directory to sys.path
@@ -12,6 +13,14 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from main import app
 from app.models import Base, User, get_db
+from app.services.cache import MemoryCacheBackend, response_cache, user_cache
+from app.services.duplicates import duplicate_index
+from app.services.effects import effect_cache
+from app.services.jobs import MemoryJobQueue, job_worker
+from app.services.metrics import metrics
+from app.services.query_stats import instrument_queries
+from app.services.resumable import UploadSessionStore, set_upload_sessions
+from app.services.similarity import VectorStore, set_vector_store
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 
@@ -19,6 +28,7 @@ engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+instrument_queries(engine)
 
 
 @pytest.fixture(scope="module")
@@ -35,6 +45,78 @@ def session():
         db.close()
 
 
+@pytest.fixture(autouse=True)
+def cache_backend():
+    # every test starts with empty in-memory caches
+    user_cache.backend = MemoryCacheBackend()
+    response_cache.backend = MemoryCacheBackend()
+    effect_cache.backend = MemoryCacheBackend()
+    yield response_cache.backend
+
+
+@pytest.fixture(autouse=True)
+def duplicates(monkeypatch):
+    # tests upload the same picture again and again, duplicate tests turn it on
+    monkeypatch.setattr("app.repository.posts.settings.duplicate_mode", "off")
+    duplicate_index.clear()
+    yield duplicate_index
+
+
+@pytest.fixture(autouse=True)
+def job_queue(tmp_path, monkeypatch):
+    # jobs wait in memory until the test runs them with job_worker.run_pending()
+    monkeypatch.setattr("app.services.uploads.settings.upload_spool_dir", str(tmp_path))
+    job_worker.queue = MemoryJobQueue()
+    job_worker.session_factory = TestingSessionLocal
+    # failed jobs are retried by the same run_pending
+    monkeypatch.setattr(job_worker, "retry_delay", 0)
+    yield job_worker.queue
+
+
+@pytest.fixture(autouse=True)
+def vector_store(tmp_path):
+    store = VectorStore(str(tmp_path / "similarity"))
+    set_vector_store(store)
+    yield store
+    set_vector_store(None)
+
+
+@pytest.fixture(autouse=True)
+def process_metrics(tmp_path, monkeypatch):
+    # snapshots of this test process only
+    monkeypatch.setattr("app.services.metrics.settings.metrics_dir", str(tmp_path / "metrics"))
+    metrics.reset()
+    yield metrics
+
+
+@pytest.fixture(autouse=True)
+def upload_sessions(tmp_path):
+    store = UploadSessionStore(str(tmp_path / "sessions"))
+    set_upload_sessions(store)
+    yield store
+    set_upload_sessions(None)
+
+
+@pytest.fixture()
+def assert_statements():
+    # with assert_statements(3): ... fails unless exactly 3 statements reach the test database
+    @contextmanager
+    def expect(count):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert len(statements) == count, "\n\n".join(statements)
+
+    return expect
+
+
 @pytest.fixture(scope="module")
 def client(session):
     # Dependency override
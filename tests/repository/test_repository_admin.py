@@ -10,7 +10,7 @@ from sqlalchemy.orm import Session
 from unittest.mock import AsyncMock
 from fastapi import UploadFile
 
-from app.models.post import Post
+from app.models.post import Post, PostDeletion
 from app.models.tag import Tag
 from app.repository.admin import delete_post_by_id, update_post_by_id
 
@@ -23,23 +23,26 @@ class TestPostReposetory(unittest.IsolatedAsyncioTestCase):
         self.session = AsyncMock(spec=Session)
         
     async def test_delete_post_by_id_post_not_found(self):
-        self.session.query().filter_by().first.return_value = None
+        self.session.execute.return_value.scalars.return_value.first.return_value = None
         result = await delete_post_by_id(post_id=1, db=self.session)
         self.assertEqual(result, None)
 
     async def test_delete_post_by_id_post_found(self):
         post = Post(id=1)
-        self.session.query().filter_by().first.return_value = post
+        self.session.execute.return_value.scalars.return_value.first.return_value = post
         result = await delete_post_by_id(post_id=1, db=self.session)
         self.assertIsInstance(result, Post)
         self.assertEqual(result.id, 1)
+        deletion = self.session.add.call_args.args[0]
+        self.assertIsInstance(deletion, PostDeletion)
+        self.assertEqual(deletion.post_id, 1)
 
     async def test_update_post_by_id_update_photo_post_found(self):
         test_file = UploadFile
         with self.file_path.open("rb") as file:
             binary_string = file.read()
             test_file = UploadFile(binary_string)
-        self.session.query().filter_by().first.return_value = Post(id=1,
+        self.session.execute.return_value.scalars.return_value.first.return_value = Post(id=1,
                                                                    photo_url='',
                                                                    photo_public_id=''
                                                                    )
@@ -54,13 +57,13 @@ class TestPostReposetory(unittest.IsolatedAsyncioTestCase):
         with self.file_path.open("rb") as file:
             binary_string = file.read()
             test_file = UploadFile(binary_string)
-        self.session.query().filter_by().first.return_value = None
+        self.session.execute.return_value.scalars.return_value.first.return_value = None
         result = await update_post_by_id(post_id=1, db=self.session, photo=test_file)
         self.assertEqual(result, None)
 
     async def test_update_post_by_id_update_description_post_found(self):
         new_description = "new description"
-        self.session.query().filter_by().first.return_value = Post(id=1,
+        self.session.execute.return_value.scalars.return_value.first.return_value = Post(id=1,
                                                                    description="test discription")
 
         result = await update_post_by_id(post_id=1, db=self.session, description=new_description)
@@ -69,7 +72,7 @@ class TestPostReposetory(unittest.IsolatedAsyncioTestCase):
 
     async def test_update_post_by_id_update_rating_post_found(self):
         new_rating = 4
-        self.session.query().filter_by().first.return_value = Post(id=1,
+        self.session.execute.return_value.scalars.return_value.first.return_value = Post(id=1,
                                                                    rating=1)
         result = await update_post_by_id(post_id=1, db=self.session, rating=new_rating)
         self.assertIsInstance(result, Post)
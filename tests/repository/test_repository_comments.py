@@ -69,7 +69,7 @@ class TestCommentsRepository(unittest.IsolatedAsyncioTestCase):
         comment_id = 1
         update_data = CommentUpdate(text="Updated comment")
         db_comment = Comment(id=comment_id, text="Old comment")
-        self.session.query().filter_by().first.return_value = db_comment
+        self.session.execute.return_value.scalar_one_or_none.return_value = db_comment
         self.session.commit = AsyncMock()
         self.session.refresh = AsyncMock()
 
@@ -79,7 +79,7 @@ class TestCommentsRepository(unittest.IsolatedAsyncioTestCase):
     async def test_delete_comment(self):
         comment_id = 1
         db_comment = Comment(id=comment_id, text="Test comment")
-        self.session.query().filter_by().first.return_value = db_comment
+        self.session.execute.return_value.scalar_one_or_none.return_value = db_comment
         self.session.delete = AsyncMock()
         self.session.commit = AsyncMock()
 
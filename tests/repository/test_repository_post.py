@@ -1,3 +1,4 @@
+from io import BytesIO
 from os import getcwd
 from pathlib import Path
 import sys
@@ -9,8 +10,10 @@ from sqlalchemy.orm import Session
 from unittest.mock import AsyncMock, MagicMock
 from fastapi import UploadFile
 
-from app.models import User, Tag, Post
+from app.models import User, Tag, Post, PostStatus
+from app.services.jobs import job_worker
 from app.repository.posts import (
+    UPLOAD_POST_PHOTO_JOB,
     create_post,
     find_posts,
     get_post_by_id,
@@ -81,9 +84,7 @@ class TestPostRepository(unittest.IsolatedAsyncioTestCase):
         """
         Test for function: app.repository.posts.create_post()
         """
-        test_file = UploadFile
-        with self.file_path.open("rb") as file:
-            test_file = UploadFile(file.read())
+        test_file = UploadFile(BytesIO(self.file_path.read_bytes()))
         result = await create_post(description="test success",
                                    tags="test, new, help",
                                    file=test_file,
@@ -92,11 +93,13 @@ class TestPostRepository(unittest.IsolatedAsyncioTestCase):
         
         self.assertIsInstance(result, Post)
         self.assertEqual(result.description, "test success")
+        self.assertEqual(result.status, PostStatus.pending)
+        job = await job_worker.queue.get(timeout=0)
+        self.assertEqual(job["name"], UPLOAD_POST_PHOTO_JOB)
+        self.assertEqual(Path(job["payload"]["path"]).read_bytes(), self.file_path.read_bytes())
 
     async def test_create_post_without_tags(self):
-        test_file = UploadFile
-        with self.file_path.open("rb") as file:
-            test_file = UploadFile(file.read())
+        test_file = UploadFile(BytesIO(self.file_path.read_bytes()))
         result = await create_post(description="test success",
                                    tags="",
                                    file=test_file,
@@ -114,7 +117,7 @@ class TestPostRepository(unittest.IsolatedAsyncioTestCase):
         """ 
         new_description = "Success"
         post = Post()
-        self.session.query().filter_by().first.return_value = post
+        self.session.execute.return_value.scalars.return_value.first.return_value = post
         self.session.commit.return_value = post
         result = await update_post(post_id=1,
                                    user=self.user,
@@ -131,7 +134,10 @@ class TestPostRepository(unittest.IsolatedAsyncioTestCase):
         """ 
         new_tags = 'test1,test2,test3'
         post = self.test_post
-        self.session.query().filter_by().first.return_value = post
+        # existing tags, then post
+        self.session.execute.return_value.scalars.return_value.first.side_effect = [
+            Tag(text="test1"), Tag(text="test2"), Tag(text="test3"), post
+        ]
         result = await update_post(post_id=1,
                                    user=self.user,
                                    db=self.session,
@@ -149,7 +155,7 @@ class TestPostRepository(unittest.IsolatedAsyncioTestCase):
         with self.file_path.open("rb") as file:
             test_file = UploadFile(file.read())
         post = self.test_post
-        self.session.query().filter_by().first.return_value = post
+        self.session.execute.return_value.scalars.return_value.first.return_value = post
         result = await update_post(post_id=1,
                                    user=self.user,
                                    db=self.session,
@@ -164,7 +170,7 @@ class TestPostRepository(unittest.IsolatedAsyncioTestCase):
         """ 
         test_file = "string for fail"
         post = self.test_post
-        self.session.query().filter_by().first.return_value = post
+        self.session.execute.return_value.scalars.return_value.first.return_value = post
         with self.assertRaises(AttributeError):
             await update_post(post_id=1,
                               user=self.user,
@@ -176,7 +182,7 @@ class TestPostRepository(unittest.IsolatedAsyncioTestCase):
         Test for function: app.repository.posts.find_posts()
         """        
         posts = [Post, Post, Post]
-        self.session.query.return_value.filter.return_value.all.return_value = posts
+        self.session.execute.return_value.scalars.return_value.all.return_value = posts
         result = await find_posts(find_str="test", user=self.user, db=self.session)
         self.assertEqual(result, posts)
 
@@ -185,7 +191,7 @@ class TestPostRepository(unittest.IsolatedAsyncioTestCase):
         Test for function: app.repository.posts.get_post_by_id()
         """ 
         post = Post()
-        self.session.query().filter_by().first.return_value = post
+        self.session.execute.return_value.scalars.return_value.first.return_value = post
         result = await get_post_by_id(post_id=1, db=self.session)
         self.assertEqual(result, post)
 
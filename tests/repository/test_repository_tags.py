@@ -42,7 +42,7 @@ class TestTagsRepository(unittest.IsolatedAsyncioTestCase):
             Tag(id=4, text="help"),
             Tag(id=5, text="ok")
         ]
-        self.session.query().filter().first.return_value = None
+        self.session.execute.return_value.scalars.return_value.first.return_value = None
         result = await get_list_of_tags_by_string(test_string, self.session)
         self.assertEqual(result[0].text, expected_result[0].text)
         self.assertEqual(result[1].text, expected_result[1].text)
@@ -62,7 +62,7 @@ class TestTagsRepository(unittest.IsolatedAsyncioTestCase):
             Tag(text="ok"),
             Tag(text="stop")
         ]
-        self.session.query().filter().first.return_value = None
+        self.session.execute.return_value.scalars.return_value.first.return_value = None
         result = await get_list_of_tags_by_string(test_string, self.session)
         self.assertEqual(result[0].text, expected_result[0].text)
         self.assertEqual(result[1].text, expected_result[1].text)
@@ -75,7 +75,7 @@ class TestTagsRepository(unittest.IsolatedAsyncioTestCase):
         Test if input string empty
         """  
         test_string = ""
-        self.session.query().filter().first.return_value = None
+        self.session.execute.return_value.scalars.return_value.first.return_value = None
         result = await get_list_of_tags_by_string(test_string, self.session)
         self.assertEqual(result, [])
 
@@ -85,7 +85,7 @@ class TestTagsRepository(unittest.IsolatedAsyncioTestCase):
         Found return database model Tag
         """   
         expected_result = Tag(id=123, text="seccess test")
-        self.session.query().filter().first.return_value = expected_result
+        self.session.execute.return_value.scalars.return_value.first.return_value = expected_result
         result = await get_tag_by_id(123, self.session)
         self.assertIsInstance(result, Tag)
         self.assertEqual(expected_result.id, result.id)
@@ -96,7 +96,7 @@ class TestTagsRepository(unittest.IsolatedAsyncioTestCase):
         Test for function: app.repository.tags.get_tag_by_id()
         Not found return None
         """  
-        self.session.query().filter().first.return_value = None
+        self.session.execute.return_value.scalars.return_value.first.return_value = None
         result = await get_tag_by_id(123, self.session)
         self.assertIsNone(result)
 
@@ -108,7 +108,7 @@ class TestTagsRepository(unittest.IsolatedAsyncioTestCase):
             Tag(id=4, text="help"),
             Tag(id=5, text="ok")
         ]
-        self.session.query().offset().limit().all.return_value = expected_result
+        self.session.execute.return_value.scalars.return_value.all.return_value = expected_result
         result = await get_tags(self.session)
         self.assertEqual(expected_result, result)
         self.assertEqual(expected_result[0], result[0])
@@ -119,7 +119,7 @@ class TestTagsRepository(unittest.IsolatedAsyncioTestCase):
         Found return database model Tag
         """  
         expected_result = Tag(id=1, text="expected_result")
-        self.session.query().filter().first.return_value = expected_result
+        self.session.execute.return_value.scalars.return_value.first.return_value = expected_result
         result = await get_tag_by_text(expected_result.text, self.session)
         self.assertIsInstance(result, Tag)
         self.assertEqual(expected_result.text, result.text)
@@ -130,7 +130,7 @@ class TestTagsRepository(unittest.IsolatedAsyncioTestCase):
         Not found return None
         """  
         expected_result = None
-        self.session.query().filter().first.return_value = expected_result
+        self.session.execute.return_value.scalars.return_value.first.return_value = expected_result
         result = await get_tag_by_text("test string", self.session)
         self.assertIsNone(result)
     
@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from libgravatar import Gravatar
 from sqlalchemy.orm import Session
 from app.models import User
@@ -24,14 +24,15 @@ class TestUserRepository(unittest.IsolatedAsyncioTestCase):
                                    email="test@example.com", password="hashedpassword")
 
     async def test_get_user_by_email(self):
-        self.db.query.return_value.filter.return_value.first.return_value = self.user
+        self.db.execute.return_value.scalars.return_value.first.return_value = self.user
 
         result = await get_user_by_email(self.user.email, self.db)
 
         self.assertEqual(result, self.user)
-        self.db.query.assert_called_once_with(User)
-        filter_call_args = self.db.query.return_value.filter.call_args[0][0]
-        self.assertEqual(str(filter_call_args), str(User.email == self.user.email))
+        self.db.execute.assert_called_once()
+        statement = self.db.execute.call_args[0][0]
+        self.assertEqual(statement.column_descriptions[0]["entity"], User)
+        self.assertEqual(str(statement.whereclause), str(User.email == self.user.email))
 
     @patch.object(Gravatar, 'get_image', return_value="avatar_url")
     async def test_create_user(self, mock_get_image):
@@ -56,7 +57,7 @@ class TestUserRepository(unittest.IsolatedAsyncioTestCase):
         self.db.commit.assert_called_once()
 
     async def test_confirmed_email(self):
-        self.db.query.return_value.filter.return_value.first.return_value = self.user
+        self.db.execute.return_value.scalars.return_value.first.return_value = self.user
 
         await confirmed_email(self.user.email, self.db)
 
@@ -64,7 +65,7 @@ class TestUserRepository(unittest.IsolatedAsyncioTestCase):
         self.db.commit.assert_called_once()
 
     async def test_update_avatar(self):
-        self.db.query.return_value.filter.return_value.first.return_value = self.user
+        self.db.execute.return_value.scalars.return_value.first.return_value = self.user
         new_avatar_url = "new_avatar_url"
 
         result = await update_avatar(self.user.email, new_avatar_url, self.db)
@@ -82,13 +83,21 @@ class TestUserRepository(unittest.IsolatedAsyncioTestCase):
         self.db.refresh.assert_called_once_with(self.user)
 
     async def test_ban_user(self):
-        self.db.query.return_value.filter.return_value.first.return_value = self.user
+        self.db.execute.return_value.scalars.return_value.first.return_value = self.user
 
         res_user = await ban_user(self.user.id, True, self.db)
 
         self.assertEqual(res_user.banned, True)
         self.db.commit.assert_called_once()
 
+    @patch('app.repository.users.user_cache', new_callable=AsyncMock)
+    async def test_ban_user_invalidates_user_cache(self, mock_user_cache):
+        self.db.execute.return_value.scalars.return_value.first.return_value = self.user
+
+        await ban_user(self.user.id, True, self.db)
+
+        mock_user_cache.invalidate.assert_awaited_once_with(self.user.email)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,104 @@
+import asyncio
+from pathlib import Path
+from os import getcwd
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from main import app
+from app.models import Base, User, get_db
+from app.services.jobs import job_worker
+from app.services.query_stats import instrument_queries
+
+file_path = Path(getcwd()) / "tests" / "user-default.png"
+
+
+@pytest.fixture(scope="module")
+def database(tmp_path_factory):
+    # the routes run on AsyncSession, like with DATABASE_ASYNC=true, on aiosqlite instead of asyncpg
+    path = tmp_path_factory.mktemp("async") / "async.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=sync_engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    instrument_queries(async_engine.sync_engine)
+    yield sync_engine, async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    asyncio.run(async_engine.dispose())
+    sync_engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def async_client(database):
+    _, session_factory = database
+
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
+
+    previous = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = override_get_db
+    yield TestClient(app)
+    if previous is None:
+        app.dependency_overrides.pop(get_db, None)
+    else:
+        app.dependency_overrides[get_db] = previous
+
+
+@pytest.fixture()
+def async_headers(async_client, database):
+    sync_engine, _ = database
+    user = {"username": "asyncpool", "email": "asyncpool@example.com",
+            "password": "123456789", "first_name": "Async", "last_name": "Pool"}
+    with patch("app.routes.auth.send_email", MagicMock()):
+        response = async_client.post("/api/auth/signup", json=user)
+    assert response.status_code == 201, response.text
+    with Session(sync_engine) as db:
+        db.query(User).filter(User.email == user["email"]).update({"confirmed": True})
+        db.commit()
+    response = async_client.post("/api/auth/login",
+                                 data={"username": user["email"], "password": user["password"]})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@patch("app.services.cloudinary.cloudinary.uploader.upload")
+def test_post_lifecycle_on_async_session(mock_uploader_upload, async_client, async_headers, database):
+    mock_uploader_upload.return_value = {"secure_url": "http://test_photo.com/photo.jpg", "public_id": "public_id"}
+    job_worker.session_factory = database[1]
+
+    response = async_client.post("/api/posts/create?description=sunny%20beach&tags=sun,sea",
+                                 headers=async_headers,
+                                 files={"file": ("user-default.png", file_path.read_bytes())})
+    assert response.status_code == 202, response.text
+    post_id = response.json()["id"]
+    assert asyncio.run(job_worker.run_pending()) == 1
+
+    response = async_client.get(f"/api/posts/{post_id}", headers=async_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "ready"
+    assert response.json()["photo_url"] == "http://test_photo.com/photo.jpg"
+    assert response.json()["tags"] == ["sun", "sea"]
+
+    response = async_client.get("/api/posts/all", headers=async_headers)
+    assert response.status_code == 200, response.text
+    assert [post["id"] for post in response.json()] == [post_id]
+
+    response = async_client.put(f"/api/posts/{post_id}?description=rainy%20day&tags=rain", headers=async_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["description"] == "rainy day"
+
+    response = async_client.post("/api/comments/create", json={"post_id": post_id, "text": "nice"},
+                                 headers=async_headers)
+    assert response.status_code == 201, response.text
+
+    response = async_client.post("/api/posts/search", json={"query": "rainy", "filter": {}},
+                                 headers=async_headers)
+    assert response.status_code == 200, response.text
+    assert [post["id"] for post in response.json()] == [post_id]
+
+    response = async_client.delete(f"/api/posts/{post_id}", headers=async_headers)
+    assert response.status_code == 200, response.text
+    response = async_client.get(f"/api/posts/{post_id}", headers=async_headers)
+    assert response.status_code == 404
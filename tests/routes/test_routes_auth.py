@@ -1,6 +1,8 @@
-from unittest.mock import MagicMock
+import asyncio
+from unittest.mock import MagicMock, patch
 
 from app.models import User
+from app.repository.users import ban_user, get_user_by_email
 
 
 def test_create_user(client, user, monkeypatch):
@@ -66,4 +68,20 @@ def test_login_wrong_email(client, user):
     )
     assert response.status_code == 401, response.text
     data = response.json()
-    assert data["detail"] == "Invalid email"
\ No newline at end of file
+    assert data["detail"] == "Invalid email"
+
+def test_current_user_cached_until_ban(client, session, token, user):
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with patch("app.services.auth.repository_users.get_user_by_email", wraps=get_user_by_email) as lookup:
+        assert client.get("/api/users/", headers=headers).status_code == 200
+        assert client.get("/api/users/", headers=headers).status_code == 200
+        assert lookup.call_count == 1
+
+    current_user = session.query(User).filter(User.email == user.get('email')).first()
+    asyncio.run(ban_user(current_user.id, True, session))
+
+    response = client.get("/api/users/", headers=headers)
+    asyncio.run(ban_user(current_user.id, False, session))
+
+    assert response.status_code == 403
@@ -6,6 +6,7 @@ from app.schemas.comments import CommentCreate, CommentUpdate
 from app.repository.comments import get_comment_by_id, get_comments_by_post, create_comment, update_comment, \
     delete_comment
 from app.repository.users import get_user_by_email
+from app.repository.posts import reconcile_comments_count
 
 
 @pytest.mark.asyncio
@@ -23,6 +24,9 @@ async def test_create_comment(client, session: Session, token: str, user: dict):
     data = response.json()
     assert data["text"] == comment_data["text"]
     assert data["post_id"] == comment_data["post_id"]
+    assert session.get(Post, 1).comments_count == 1
+    # comments are not edits of the post
+    assert session.get(Post, 1).updated_at is None
 
 
 @pytest.mark.asyncio
@@ -103,3 +107,27 @@ async def test_delete_comment_authorized(client: TestClient, session: Session, a
 
     data = response.json()
 
+
+@pytest.mark.asyncio
+async def test_delete_comment_decrements_comments_count(client: TestClient, session: Session, admin_token: str):
+    comments_count = session.get(Post, 1).comments_count
+    comment = session.query(Comment).filter_by(post_id=1).first()
+
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = client.delete(f"api/comments/{comment.id}", headers=headers)
+    assert response.status_code == 200
+
+    assert session.get(Post, 1).comments_count == comments_count - 1
+
+
+@pytest.mark.asyncio
+async def test_reconcile_comments_count(session: Session):
+    # comments added directly to database in tests above are not counted
+    post = session.get(Post, 10)
+    assert post.comments_count == 0
+
+    fixed = await reconcile_comments_count(session)
+
+    assert fixed >= 1
+    session.refresh(post)
+    assert post.comments_count == 5
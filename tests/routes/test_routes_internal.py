@@ -0,0 +1,40 @@
+from app.conf.config import settings
+
+
+def test_db_pool_stats_unauthorized(client):
+    response = client.get("api/internal/db-pool")
+    assert response.status_code == 401
+
+
+def test_db_pool_stats_not_admin(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("api/internal/db-pool", headers=headers)
+    assert response.status_code == 403
+
+
+def test_db_pool_stats(client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    response = client.get("api/internal/db-pool", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["pools"]["sync"]["pool"] == "InstrumentedQueuePool"
+    assert data["pools"]["sync"]["size"] == settings.db_pool_size
+
+
+def test_queries_stats(client, admin_token, caplog, monkeypatch):
+    monkeypatch.setattr("app.services.query_stats.settings.sql_repeat_threshold", 1)
+
+    response = client.get("api/posts/all?limit=1")
+    assert response.status_code == 200
+    assert 'statements"' in response.headers["Server-Timing"]
+    assert "Possible N+1 query in GET /api/posts/all" in caplog.text
+
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = client.get("api/internal/queries", headers=headers)
+    assert response.status_code == 200
+    feed = response.json()["routes"]["/api/posts/all"]
+    assert feed["statements"]["count"] == 1
+    assert feed["statements"]["buckets"]["+Inf"] == 1
+    assert feed["repeated"] == 1
@@ -0,0 +1,141 @@
+import asyncio
+from pathlib import Path
+from os import getcwd
+from unittest.mock import patch
+
+import pytest
+
+from app.services.jobs import job_worker
+from app.services.storage import LocalStorage, set_storage
+
+file_path = Path(getcwd()) / "tests" / "user-default.png"
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = LocalStorage(str(tmp_path), "/api/media")
+    set_storage(storage)
+    yield storage
+    set_storage(None)
+
+
+@pytest.fixture
+def photo(storage):
+    content = file_path.read_bytes()
+    storage.upload(file_path.open("rb"), "photos/1")
+    return content
+
+
+def test_get_media(client, photo):
+    response = client.get("api/media/photos/1")
+
+    assert response.status_code == 200
+    assert response.content == photo
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["content-length"] == str(len(photo))
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"]
+    assert response.headers["last-modified"]
+
+
+def test_get_media_head(client, photo):
+    response = client.head("api/media/photos/1")
+
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["content-length"] == str(len(photo))
+
+
+def test_get_media_not_modified(client, photo):
+    response = client.get("api/media/photos/1")
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+
+    response = client.get("api/media/photos/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.get("api/media/photos/1", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    response = client.get("api/media/photos/1", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("range_header, start, end", [
+    ("bytes=0-9", 0, 9),
+    ("bytes=10-", 10, None),
+    ("bytes=-5", -5, None),
+])
+def test_get_media_range(client, photo, range_header, start, end):
+    response = client.get("api/media/photos/1", headers={"Range": range_header})
+
+    expected = photo[start:end + 1 if end is not None else None]
+    first = start if start >= 0 else len(photo) + start
+    assert response.status_code == 206
+    assert response.content == expected
+    assert response.headers["content-range"] == f"bytes {first}-{first + len(expected) - 1}/{len(photo)}"
+
+
+def test_get_media_range_not_satisfiable(client, photo):
+    response = client.get("api/media/photos/1", headers={"Range": f"bytes={len(photo)}-"})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(photo)}"
+
+
+def test_get_media_if_range_changed_sends_whole_file(client, photo):
+    response = client.get("api/media/photos/1", headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+
+    assert response.status_code == 200
+    assert response.content == photo
+
+
+def test_get_media_not_found(client, storage):
+    assert client.get("api/media/photos/2").status_code == 404
+    assert client.get("api/media/..%2F..%2Fetc%2Fpasswd").status_code == 404
+
+
+def test_get_media_with_cloudinary_storage_not_found(client):
+    assert client.get("api/media/photos/1").status_code == 404
+
+
+def test_create_post_with_local_storage(client, token, storage, session):
+    headers = {"Authorization": f"Bearer {token}"}
+    test_file = {"file": ("user-default.png", file_path.read_bytes())}
+
+    response = client.post("api/posts/create?description=local%20photo", headers=headers, files=test_file)
+    post_id = response.json()["id"]
+    asyncio.run(job_worker.run_pending())
+
+    photo_url = client.get(f"api/posts/{post_id}").json()["photo_url"]
+    assert photo_url.startswith("/api/media/")
+    response = client.get(photo_url)
+    assert response.status_code == 200
+    assert response.content == file_path.read_bytes()
+
+    assert client.delete(f"api/posts/{post_id}", headers=headers).status_code == 200
+
+
+def test_post_effect_rendered_once(client, token, storage):
+    headers = {"Authorization": f"Bearer {token}"}
+    test_file = {"file": ("user-default.png", file_path.read_bytes())}
+    post_id = client.post("api/posts/create?description=effect%20photo", headers=headers, files=test_file).json()["id"]
+    asyncio.run(job_worker.run_pending())
+
+    response = client.put(f"api/posts/{post_id}?effect=sepia", headers=headers)
+    assert response.status_code == 200
+    transform_url = response.json()["transform_url"]
+    assert transform_url == f"/api/posts/{post_id}/effects/sepia"
+
+    with patch("app.services.effects.variant_pool.run") as run:
+        response = client.get(transform_url)
+        run.assert_not_called()
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.content[:3] == b"\xff\xd8\xff"
+
+    response = client.get(transform_url, headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+
+    assert client.get(f"api/posts/{post_id}/effects/unknown").status_code == 422
+    assert client.delete(f"api/posts/{post_id}", headers=headers).status_code == 200
@@ -0,0 +1,25 @@
+def test_metrics(client):
+    assert client.get("api/posts/all?limit=1").status_code == 200
+    assert client.get("api/posts/100000").status_code == 404
+
+    response = client.get("metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'http_requests_total{method="GET",route="/api/posts/all",status="200"} 1' in text
+    assert 'http_requests_total{method="GET",route="/api/posts/{post_id}",status="404"} 1' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/posts/all"} 1' in text
+    assert 'db_statements_per_request_count{route="/api/posts/all"} 1' in text
+    assert 'cache_requests_total{cache="cache",result="miss"}' in text
+    assert "upload_executor_capacity " in text
+    assert "job_queue_depth 0" in text
+    # the request for /metrics is still in flight
+    assert "http_requests_in_flight 1" in text
+
+
+def test_metrics_token(client, monkeypatch):
+    monkeypatch.setattr("app.routes.metrics.settings.metrics_token", "scraper")
+
+    assert client.get("metrics").status_code == 401
+    assert client.get("metrics", headers={"Authorization": "Bearer other"}).status_code == 401
+    assert client.get("metrics", headers={"Authorization": "Bearer scraper"}).status_code == 200
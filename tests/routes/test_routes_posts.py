@@ -1,17 +1,33 @@
 import asyncio
+from io import BytesIO
+from datetime import datetime
 from pathlib import Path
 from os import getcwd
 
 import pytest
+from PIL import Image
 from urllib.request import urlopen
 from urllib.parse import quote_plus
 from unittest.mock import patch
 
+from app.repository.admin import update_post_by_id
+from app.repository.posts import fail_stale_uploads, prune_post_deletions
 from app.repository.users import get_user_by_email
-from app.models import User
+from app.models import Comment, User, Post, PostDeletion, PostStatus, Rating
+from app.services.auth import auth_service
+from app.services.jobs import job_worker
+from app.services.rating import add_rate_to_post, reconcile_ratings
+from app.services.search import full_text_search
 
 file_path = Path(getcwd()) / "tests" / "user-default.png"
 
+
+def image_bytes(colour) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (64, 64), colour).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
 @patch("app.services.cloudinary.cloudinary.uploader.upload")
 def test_create_post_with_tags(mock_uploader_upload, client, token, user, ):
     mock_uploader_upload.return_value ={
@@ -30,14 +46,27 @@ def test_create_post_with_tags(mock_uploader_upload, client, token, user, ):
     response = client.post(f"api/posts/create?description={quote_plus(test_description)}&tags={quote_plus(test_tags)}",
                            headers=headers,
                            files=test_file)
-    assert response.status_code == 201
+    assert response.status_code == 202
     data = response.json()
     assert data["description"] == test_description
     assert data["user"]["email"] == user["email"]
     assert data["tags"][0]["text"] == "new"
     assert data["tags"][1]["text"] == "post"
-    assert data["photo_url"] is not None
-    mock_uploader_upload.assert_called_once()
+    assert data["status"] == "pending"
+    assert data["photo_url"] is None
+    mock_uploader_upload.assert_not_called()
+
+    assert asyncio.run(job_worker.run_pending()) == 1
+    # photo, then 256 and 512 px thumbnails in two formats, the photo is 646 px wide
+    assert mock_uploader_upload.call_count == 5
+    assert mock_uploader_upload.call_args_list[0].kwargs["public_id"] == f"project_web21/1/photos/{data['id']}"
+    response = client.get(f"api/posts/{data['id']}")
+    assert response.json()["status"] == "ready"
+    assert response.json()["photo_url"] == "http://test_photo.com/photo.jpg"
+    assert sorted(response.json()["variants"]) == ["256", "512"]
+    assert sorted(response.json()["variants"]["256"]) == ["jpeg", "webp"]
+    assert len(response.json()["blurhash"]) == 28
+    assert response.json()["dominant_color"].startswith("#")
 
 @patch("app.services.cloudinary.cloudinary.uploader.upload")
 def test_create_post_without_tags(mock_uploader_upload, client, token, user):
@@ -56,13 +85,123 @@ def test_create_post_without_tags(mock_uploader_upload, client, token, user):
     response = client.post(f"api/posts/create?description={quote_plus(test_description)}",
                            headers=headers,
                            files=test_file)
-    assert response.status_code == 201
+    assert response.status_code == 202
     data = response.json()
     assert data["user"]["email"] == user["email"]
     assert data["description"] == test_description
     assert data["tags"] == []
-    assert data["photo_url"] is not None
-    mock_uploader_upload.assert_called_once()
+    assert data["status"] == "pending"
+
+    asyncio.run(job_worker.run_pending())
+    assert mock_uploader_upload.call_args_list[0].kwargs["public_id"] == f"project_web21/1/photos/{data['id']}"
+    response = client.get(f"api/posts/{data['id']}")
+    assert response.json()["photo_url"] == "http://test_photo_1.com/photo.jpg"
+
+
+@patch("app.services.cloudinary.cloudinary.uploader.upload")
+def test_create_post_upload_failed(mock_uploader_upload, client, token, session):
+    mock_uploader_upload.side_effect = Exception("Cloudinary is down")
+    headers = {"Authorization": f"Bearer {token}"}
+    test_file = {"file": ("user-default.png", file_path.read_bytes())}
+
+    response = client.post("api/posts/create?description=failed%20post", headers=headers, files=test_file)
+    assert response.status_code == 202
+    post_id = response.json()["id"]
+
+    # every attempt is put back to the queue until job_max_attempts
+    asyncio.run(job_worker.run_pending())
+    assert mock_uploader_upload.call_count == job_worker.max_attempts
+    response = client.get(f"api/posts/{post_id}")
+    assert response.json()["status"] == "failed"
+    assert response.json()["photo_url"] is None
+
+    # failed post is not in the feed
+    assert post_id not in [post["id"] for post in client.get("api/posts/all").json()]
+    session.delete(session.get(Post, post_id))
+    session.commit()
+
+
+def test_fail_stale_uploads(session):
+    stale = Post(description="lost job", user_id=1, status=PostStatus.pending,
+                 created_at=datetime(2024, 7, 1, 10, 0, 0))
+    fresh = Post(description="queued job", user_id=1, status=PostStatus.pending,
+                 created_at=datetime(2024, 7, 1, 12, 0, 0))
+    session.add_all([stale, fresh])
+    session.commit()
+    stale_id, fresh_id = stale.id, fresh.id
+
+    assert asyncio.run(fail_stale_uploads(session, datetime(2024, 7, 1, 11, 0, 0))) == [stale_id]
+    assert session.get(Post, stale_id).status == PostStatus.failed
+    assert session.get(Post, fresh_id).status == PostStatus.pending
+
+    session.delete(session.get(Post, stale_id))
+    session.delete(session.get(Post, fresh_id))
+    session.commit()
+
+
+def test_prune_post_deletions(session):
+    session.add_all([PostDeletion(post_id=1001, deleted_at=datetime(2024, 7, 1, 10, 0, 0)),
+                     PostDeletion(post_id=1002, deleted_at=datetime(2024, 7, 1, 12, 0, 0))])
+    session.commit()
+
+    assert asyncio.run(prune_post_deletions(session, datetime(2024, 7, 1, 11, 0, 0))) == 1
+    assert [deletion.post_id for deletion in session.query(PostDeletion).filter(PostDeletion.post_id > 1000)] == [1002]
+
+    session.query(PostDeletion).filter(PostDeletion.post_id > 1000).delete()
+    session.commit()
+
+
+def test_create_post_duplicate_rejected(client, token, monkeypatch):
+    monkeypatch.setattr("app.repository.posts.settings.duplicate_mode", "reject")
+    headers = {"Authorization": f"Bearer {token}"}
+    test_file = {"file": ("user-default.png", file_path.read_bytes())}
+
+    response = client.post("api/posts/create?description=same%20photo", headers=headers, files=test_file)
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Photo is a duplicate of post 1"
+    assert asyncio.run(job_worker.run_pending()) == 0
+
+
+@patch("app.services.cloudinary.cloudinary.uploader.upload")
+def test_create_post_duplicate_linked(mock_uploader_upload, client, token, session, monkeypatch):
+    monkeypatch.setattr("app.repository.posts.settings.duplicate_mode", "link")
+    headers = {"Authorization": f"Bearer {token}"}
+    test_file = {"file": ("user-default.png", file_path.read_bytes())}
+
+    response = client.post("api/posts/create?description=same%20photo", headers=headers, files=test_file)
+    assert response.status_code == 202
+    data = response.json()
+    # photo of post 1 is shared, nothing is uploaded
+    assert data["status"] == "ready"
+    assert data["duplicate_of_id"] == 1
+    assert data["photo_url"] == client.get("api/posts/1").json()["photo_url"]
+    assert asyncio.run(job_worker.run_pending()) == 0
+    mock_uploader_upload.assert_not_called()
+    session.delete(session.get(Post, data["id"]))
+    session.commit()
+
+
+@patch("app.services.cloudinary.cloudinary.uploader.upload")
+def test_get_similar_posts(mock_uploader_upload, client, token, session):
+    mock_uploader_upload.return_value = {"secure_url": "http://test_photo.com/photo.jpg", "public_id": "public_id"}
+    headers = {"Authorization": f"Bearer {token}"}
+    photos = [file_path.read_bytes(), file_path.read_bytes(), image_bytes((30, 30, 220))]
+    post_ids = []
+    for photo in photos:
+        response = client.post("api/posts/create?description=similar", headers=headers,
+                               files={"file": ("photo", photo)})
+        post_ids.append(response.json()["id"])
+    asyncio.run(job_worker.run_pending())
+
+    response = client.get(f"api/posts/{post_ids[0]}/similar?limit=2")
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json()] == post_ids[1:]
+
+    session.query(Comment).filter(Comment.post_id.in_(post_ids)).delete()
+    for post_id in post_ids:
+        session.delete(session.get(Post, post_id))
+    session.commit()
+    assert client.get("api/posts/999/similar").status_code == 404
 
 
 def test_get_posts(client, token):
@@ -88,6 +227,125 @@ def test_get_all_posts(client, token):
     assert data[0]["id"] == 1
 
 
+def test_get_all_posts_next_cursor(client, session):
+    # same created_at for both posts, page borders are defined by id
+    session.query(Post).update({Post.created_at: datetime(2024, 7, 1, 10, 0, 0)})
+    session.commit()
+
+    response = client.get("api/posts/all?limit=1")
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json()] == [1]
+    next_cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f"api/posts/all?limit=1&cursor={next_cursor}")
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json()] == [2]
+    next_cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f"api/posts/all?limit=1&cursor={next_cursor}")
+    assert response.status_code == 200
+    assert response.json() == []
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_get_all_posts_by_rating_next_cursor(client):
+    response = client.get("api/posts/all?limit=1&order_by=rating&order=desc")
+    assert response.status_code == 200
+    first = [post["id"] for post in response.json()]
+
+    response = client.get(f"api/posts/all?limit=1&cursor={response.headers['X-Next-Cursor']}")
+    assert response.status_code == 200
+    assert sorted(first + [post["id"] for post in response.json()]) == [1, 2]
+
+
+def test_get_all_posts_by_relevance(client, token):
+    # only search has a query to order by
+    response = client.get("api/posts/all?limit=1&order_by=relevance")
+    assert response.status_code == 422
+    response = client.get("api/posts/?limit=1&order_by=relevance", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 422
+
+
+def test_get_all_posts_invalid_cursor(client):
+    response = client.get("api/posts/all?cursor=invalid")
+    assert response.status_code == 400
+
+
+def test_search_posts_limit_and_cursor(client):
+    body = {"limit": 1, "order": "asc", "filter": {}}
+
+    response = client.post("api/posts/search", json=body)
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json()] == [1]
+    assert response.headers["X-Total-Count"] == "2"
+    assert "X-Total-Count-Capped" not in response.headers
+
+    body["cursor"] = response.headers["X-Next-Cursor"]
+    response = client.post("api/posts/search", json=body)
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json()] == [2]
+
+
+def test_search_posts_full_text_relevance(client):
+    body = {"query": "new pos", "order_by": "relevance", "filter": {}}
+
+    response = client.post("api/posts/search", json=body)
+    assert response.status_code == 200
+    # post 1 has "new" and "post" in tags as well
+    assert [post["id"] for post in response.json()] == [1, 2]
+    assert "X-Next-Cursor" not in response.headers
+
+    body["query"] = "not found"
+    with patch("app.repository.posts.full_text_search", wraps=full_text_search) as search:
+        response = client.post("api/posts/search", json=body)
+    # the page and the count share one expression
+    search.assert_awaited_once()
+    assert response.status_code == 200
+    assert response.json() == []
+    assert response.headers["X-Total-Count"] == "0"
+
+
+def test_search_posts_limit_out_of_range(client):
+    response = client.post("api/posts/search", json={"limit": 1000, "filter": {}})
+    assert response.status_code == 422
+
+
+def test_rate_post_keeps_rating_sum_and_count(client, session):
+    appraisers = [User(id=100 + i, first_name="rate", last_name=str(i), email=f"rate{i}@example.com", password="password")
+                  for i in range(2)]
+    session.add_all(appraisers)
+    session.commit()
+    post = session.get(Post, 2)
+    updated_at = post.updated_at
+
+    asyncio.run(add_rate_to_post(appraisers[0], post, 3, session))
+    result = asyncio.run(add_rate_to_post(appraisers[1], post, 5, session))
+
+    assert result == {"post_id": 2, "rating": 4.0}
+    post = session.get(Post, 2)
+    assert (post.rating_sum, post.rating_count, post.rating) == (8, 2, 4.0)
+    # rates are not edits of the post
+    assert post.updated_at == updated_at
+
+    session.query(Post).filter_by(id=2).update({Post.rating_sum: 0, Post.rating_count: 0, Post.rating: None})
+    session.commit()
+    assert asyncio.run(reconcile_ratings(session)) == 1
+    post = session.get(Post, 2)
+    assert (post.rating_sum, post.rating_count, post.rating) == (8, 2, 4.0)
+
+
+def test_admin_rating_kept_over_rates(session):
+    assert asyncio.run(update_post_by_id(1, session, rating=2)).rating == 2
+
+    result = asyncio.run(add_rate_to_post(session.get(User, 100), session.get(Post, 1), 5, session))
+    assert result == {"post_id": 1, "rating": 2.0}
+    post = session.get(Post, 1)
+    assert (post.rating_sum, post.rating_count, post.rating) == (5, 1, 2.0)
+
+    asyncio.run(reconcile_ratings(session))
+    assert session.get(Post, 1).rating == 2.0
+
+
 def test_get_post_user_unauthorized(client):
     response = client.get("api/posts/1")
     assert response.status_code == 200
@@ -135,6 +393,21 @@ def test_update_post_owner_authorized_update_description(client, token):
     assert data["description"] == new_description
 
 
+def test_get_post_cached_until_update(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("api/posts/1")
+    assert response.headers["X-Cache"] == "MISS"
+    response = client.get("api/posts/1")
+    assert response.headers["X-Cache"] == "HIT"
+
+    client.put(f"api/posts/1?description={quote_plus('cached no more')}", headers=headers)
+
+    response = client.get("api/posts/1")
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json()["description"] == "cached no more"
+
+
 def test_update_post_owner_authorized_update_tags(client, token):
     post_id = 2
     new_tests = "super, star"
@@ -164,7 +437,8 @@ def test_update_post_owner_authorized_update_file(mock_uploader_upload, client,
 
     response = client.put(f"api/posts/{post_id}", headers=headers, files=test_file)
     assert response.status_code == 200
-    mock_uploader_upload.assert_called_once()
+    assert mock_uploader_upload.call_args_list[0].kwargs["public_id"] == "project_web21/1/photos/1"
+    assert response.json()["variants"]["512"]["webp"] == "http://test_photo_999.com/photo.jpg"
 
 
 def test_delete_post_user_owner(client, token):
@@ -264,3 +538,235 @@ def test_delete_post_user_not_owner(client, token, session, user):
     session.refresh(user)
 
     assert response.status_code == 403
+
+
+def test_admin_duplicates(client, admin_token, session):
+    posts = [Post(description="duplicate", photo_phash="f0f0f0f0f0f0f0f0", user_id=1),
+             Post(description="duplicate", photo_phash="f0f0f0f0f0f0f0f1", user_id=1),
+             Post(description="unique", photo_phash="0123456789abcdef", user_id=1)]
+    session.add_all(posts)
+    session.commit()
+    first, second, unique = [post.id for post in posts]
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    response = client.get("api/admin/duplicates", headers=headers)
+    assert response.status_code == 200
+    clusters = [cluster["post_ids"] for cluster in response.json()]
+    assert [first, second] in clusters
+    assert all(unique not in cluster for cluster in clusters)
+
+    response = client.get("api/admin/duplicates?max_distance=0", headers=headers)
+    assert [first, second] not in [cluster["post_ids"] for cluster in response.json()]
+
+    for post_id in (first, second, unique):
+        session.delete(session.get(Post, post_id))
+    session.commit()
+
+
+@patch("app.services.cloudinary.cloudinary.uploader.upload")
+def test_create_post_upload_rejected(mock_uploader_upload, client, token, session, monkeypatch):
+    headers = {"Authorization": f"Bearer {token}"}
+    posts = session.query(Post).count()
+
+    response = client.post("api/posts/create?description=not%20a%20photo", headers=headers,
+                           files={"file": ("photo.png", b"<html>not a photo</html>", "image/png")})
+    assert response.status_code == 415
+
+    monkeypatch.setattr("app.services.uploads.settings.upload_max_size", 1000)
+    response = client.post("api/posts/create?description=too%20large", headers=headers,
+                           files={"file": ("photo.png", file_path.read_bytes(), "image/png")})
+    assert response.status_code == 413
+
+    assert session.query(Post).count() == posts
+    assert len(job_worker.queue) == 0
+    mock_uploader_upload.assert_not_called()
+
+
+@patch("app.services.cloudinary.cloudinary.uploader.upload")
+def test_update_post_upload_rejected(mock_uploader_upload, client, token, user, session, monkeypatch):
+    headers = {"Authorization": f"Bearer {token}"}
+    owner = session.query(User).filter(User.email == user["email"]).first()
+    post = Post(description="photo kept", user_id=owner.id, status=PostStatus.ready,
+                photo_url="http://test_photo.com/kept.jpg")
+    session.add(post)
+    session.commit()
+    post_id = post.id
+
+    # a new photo is checked like a photo of a new post
+    response = client.put(f"api/posts/{post_id}", headers=headers,
+                          files={"file": ("photo.png", b"<html>not a photo</html>", "image/png")})
+    assert response.status_code == 415
+
+    monkeypatch.setattr("app.services.uploads.settings.upload_max_size", 1000)
+    response = client.put(f"api/posts/{post_id}", headers=headers,
+                          files={"file": ("photo.png", file_path.read_bytes(), "image/png")})
+    assert response.status_code == 413
+
+    post = session.get(Post, post_id)
+    assert post.photo_url == "http://test_photo.com/kept.jpg"
+    mock_uploader_upload.assert_not_called()
+    session.delete(post)
+    session.commit()
+
+
+@patch("app.services.cloudinary.cloudinary.uploader.upload")
+def test_resumable_upload(mock_uploader_upload, client, token, upload_sessions):
+    mock_uploader_upload.return_value = {"secure_url": "http://test_photo.com/photo.jpg", "public_id": "public_id"}
+    headers = {"Authorization": f"Bearer {token}"}
+    photo = file_path.read_bytes()
+    upload_sessions.chunk_size = 4096
+
+    response = client.post("api/posts/uploads", headers=headers, json={"size": len(photo), "filename": "photo.png"})
+    assert response.status_code == 201
+    session = response.json()
+    upload_id, chunks = session["upload_id"], session["chunks"]
+    assert session["received"] == []
+    assert chunks == -(-len(photo) // 4096)
+
+    # all chunks but the first, as if the connection dropped
+    for index in range(1, chunks):
+        response = client.put(f"api/posts/uploads/{upload_id}/chunks/{index}?offset={index * 4096}",
+                              headers=headers, content=photo[index * 4096:(index + 1) * 4096])
+        assert response.status_code == 200
+    response = client.post(f"api/posts/uploads/{upload_id}/finalize?description=resumed", headers=headers)
+    assert response.status_code == 409
+
+    response = client.get(f"api/posts/uploads/{upload_id}", headers=headers)
+    assert response.json()["received"] == list(range(1, chunks))
+    response = client.put(f"api/posts/uploads/{upload_id}/chunks/0?offset=0", headers=headers, content=photo[:4096])
+    assert response.json()["received"] == list(range(chunks))
+
+    response = client.post(f"api/posts/uploads/{upload_id}/finalize?description=resumed&tags=sea", headers=headers)
+    assert response.status_code == 202
+    data = response.json()
+    assert data["description"] == "resumed"
+    assert data["tags"][0]["text"] == "sea"
+    assert data["status"] == "pending"
+    assert client.get(f"api/posts/uploads/{upload_id}", headers=headers).status_code == 404
+
+    assert asyncio.run(job_worker.run_pending()) == 1
+    response = client.get(f"api/posts/{data['id']}")
+    assert response.json()["status"] == "ready"
+    assert response.json()["photo_url"] == "http://test_photo.com/photo.jpg"
+
+
+def test_resumable_upload_abandoned(client, token, upload_sessions):
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.post("api/posts/uploads", headers=headers, json={"size": 100})
+    upload_id = response.json()["upload_id"]
+    response = client.put(f"api/posts/uploads/{upload_id}/chunks/0?offset=0", headers=headers, content=b"x" * 100)
+    assert response.status_code == 415
+
+    assert client.delete(f"api/posts/uploads/{upload_id}", headers=headers).status_code == 204
+    assert client.get(f"api/posts/uploads/{upload_id}", headers=headers).status_code == 404
+    assert list(upload_sessions.directory.iterdir()) == []
+
+
+def test_feed_has_latest_comments_only(client, token, session, user):
+    owner_id = session.query(User).filter_by(email=user["email"]).first().id
+    post = Post(description="busy post", user_id=owner_id, comments_count=5)
+    session.add(post)
+    session.commit()
+    post_id = post.id
+    session.add_all([Comment(text=f"comment {number}", post_id=post_id, user_id=owner_id,
+                             created_at=datetime(2026, 1, 1, 12, number))
+                     for number in range(5)])
+    session.commit()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("api/posts/all?limit=1&order=desc")
+    assert response.status_code == 200
+    item = response.json()[0]
+    assert item["id"] == post_id
+    assert "comments" not in item
+    assert item["comments_count"] == 5
+    assert [comment["text"] for comment in item["latest_comments"]] == ["comment 4", "comment 3", "comment 2"]
+    assert item["latest_comments"][0]["user"]["id"] == owner_id
+
+    response = client.get("api/posts/?limit=100", headers=headers)
+    item = next(item for item in response.json() if item["id"] == post_id)
+    assert len(item["latest_comments"]) == 3
+
+    response = client.get(f"api/posts/{post_id}")
+    assert len(response.json()["comments"]) == 5
+
+    # the test database does not enforce ON DELETE CASCADE
+    session.query(Comment).filter_by(post_id=post_id).delete()
+    session.delete(session.get(Post, post_id))
+    session.commit()
+
+
+def test_feed_and_detail_statements(client, token, session, user, assert_statements):
+    owner_id = session.query(User).filter_by(email=user["email"]).first().id
+    posts = [Post(description=f"feed post {number}", user_id=owner_id, comments_count=2) for number in range(3)]
+    session.add_all(posts)
+    session.commit()
+    session.add_all([Comment(text="comment", post_id=post.id, user_id=owner_id) for post in posts for _ in range(2)])
+    session.commit()
+    post_ids = [post.id for post in posts]
+
+    # posts joined with owners, tags, latest comments joined with authors, whatever the page size
+    with assert_statements(3):
+        response = client.get("api/posts/all?limit=3&order=desc")
+    assert [item["id"] for item in response.json()] == post_ids[::-1]
+
+    # post joined with owner, tags, comments joined with authors
+    with assert_statements(3):
+        response = client.get(f"api/posts/{post_ids[0]}")
+    assert len(response.json()["comments"]) == 2
+
+    session.query(Comment).filter(Comment.post_id.in_(post_ids)).delete()
+    for post_id in post_ids:
+        session.delete(session.get(Post, post_id))
+    session.commit()
+
+
+@patch("app.services.cloudinary.cloudinary.uploader.upload")
+def test_write_statements(mock_uploader_upload, client, token, session, assert_statements):
+    mock_uploader_upload.return_value = {"secure_url": "http://test_photo.com/photo.jpg", "public_id": "public_id"}
+    session.add(User(first_name="rate", last_name="pinned", email="pinned@example.com", password="password",
+                     avatar="http://test_avatar.com/pinned.png", confirmed=True))
+    session.commit()
+    headers = {"Authorization": f"Bearer {token}"}
+    appraiser_token = asyncio.run(auth_service.create_access_token(data={"sub": "pinned@example.com"}))
+    appraiser_headers = {"Authorization": f"Bearer {appraiser_token}"}
+    # the current users are read once, then served from user_cache, the search index is loaded once
+    client.get("api/users/", headers=headers)
+    client.get("api/users/", headers=appraiser_headers)
+    client.post("api/posts/search", json={"query": "pinned", "filter": {}})
+
+    # a statement or two per tag, the post with its tags, then the post joined with owner and its tags
+    with assert_statements(9):
+        response = client.post("api/posts/create?description=pinned&tags=pinned",
+                               headers=headers, files={"file": ("user-default.png", file_path.read_bytes())})
+    assert response.status_code == 202, response.text
+    post_id = response.json()["id"]
+    assert asyncio.run(job_worker.run_pending()) == 1
+
+    # owner check, tags, the post with comments for the update, then the post again for the response
+    with assert_statements(16):
+        response = client.put(f"api/posts/{post_id}?description=pinned%20again&tags=pinned,again", headers=headers)
+    assert response.status_code == 200, response.text
+
+    # the post, an earlier rate of the user, the rate and counters in one transaction, the post after commit
+    with assert_statements(5):
+        response = client.post(f"api/posts/rate/{post_id}?rating=4", headers=appraiser_headers)
+    assert response.status_code == 200, response.text
+
+    # the post, Post.comments_count and the comment, then the comment joined with its author
+    with assert_statements(5):
+        response = client.post("api/comments/create", json={"post_id": post_id, "text": "pinned"}, headers=headers)
+    assert response.status_code == 201, response.text
+
+    # posts joined with owners, tags and latest comments of the whole page, then the count
+    with assert_statements(4):
+        response = client.post("api/posts/search", json={"query": "pinned", "limit": 10, "filter": {}})
+    assert response.status_code == 200, response.text
+    assert [item["id"] for item in response.json()] == [post_id]
+
+    session.query(Comment).filter_by(post_id=post_id).delete()
+    session.query(Rating).filter_by(post_id=post_id).delete()
+    session.delete(session.get(Post, post_id))
+    session.query(User).filter_by(email="pinned@example.com").delete()
+    session.commit()
@@ -57,6 +57,17 @@ def test_create_tags_by_string(client):
     with pytest.raises(IndexError):
         data[5]
 
+def test_suggest_tags(client):
+    response = client.get("/api/tags/suggest?q=fif")
+    assert response.status_code == 200
+    data = response.json()
+    assert data[0]["text"] == "fifth"
+    assert data[0]["posts_count"] == 0
+
+def test_suggest_tags_empty_query(client):
+    response = client.get("/api/tags/suggest?q=")
+    assert response.status_code == 422
+
     
 
 
@@ -0,0 +1,61 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from app.services.analysis import analyse_photo, analyse_upload, photo_phash
+from app.services.duplicates import hamming
+from app.services.similarity import FEATURE_SIZE
+
+
+def image_bytes(width: int, height: int, image_format: str = "PNG") -> bytes:
+    image = Image.new("RGB", (width, height), (10, 120, 200))
+    ImageDraw.Draw(image).ellipse((width // 4, height // 4, width * 3 // 4, height * 3 // 4), fill=(240, 200, 10))
+    buffer = BytesIO()
+    image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def test_analyse_photo():
+    analysis = analyse_photo(image_bytes(1200, 600), (256, 512, 1024))
+
+    assert sorted(analysis.variants) == [(256, "jpeg"), (256, "webp"), (512, "jpeg"), (512, "webp"),
+                                         (1024, "jpeg"), (1024, "webp")]
+    with Image.open(BytesIO(analysis.variants[(512, "webp")])) as image:
+        assert image.size == (512, 256)
+    assert len(analysis.phash) == 16
+    assert analysis.vector.shape == (FEATURE_SIZE,)
+    assert len(analysis.blurhash) == 28
+    assert analysis.dominant_color == "#0a78c8"
+
+
+def test_analyse_photo_never_upscales():
+    assert sorted(analyse_photo(image_bytes(300, 300), (256, 512)).variants) == [(256, "jpeg"), (256, "webp")]
+    assert analyse_photo(image_bytes(200, 100), (256, 512)).variants == {}
+
+
+def test_analyse_photo_hash_survives_resize_and_recompression():
+    original = analyse_photo(image_bytes(800, 600))
+    resized = analyse_photo(image_bytes(400, 300, "JPEG"), (256,))
+    assert hamming(int(original.phash, 16), int(resized.phash, 16)) <= 4
+    assert original.vector @ resized.vector > 0.95
+
+
+@pytest.mark.asyncio
+async def test_analyse_upload(tmp_path):
+    photo = tmp_path / "upload-1"
+    photo.write_bytes(image_bytes(600, 400))
+
+    analysis = await analyse_upload(str(photo))
+    assert sorted(analysis.variants) == [(256, "jpeg"), (256, "webp"), (512, "jpeg"), (512, "webp")]
+    assert await photo_phash(str(photo)) == analysis.phash
+    assert isinstance(analysis.vector, np.ndarray)
+
+
+@pytest.mark.asyncio
+async def test_analyse_upload_of_not_image(tmp_path):
+    photo = tmp_path / "upload-1"
+    photo.write_bytes(b"not an image")
+    assert await analyse_upload(str(photo)) is None
+    assert await photo_phash(str(photo)) is None
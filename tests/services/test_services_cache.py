@@ -0,0 +1,92 @@
+import json
+from unittest.mock import patch
+
+import pytest
+from fastapi import Response
+from pydantic import BaseModel
+
+from app.services.cache import MemoryCacheBackend, ResponseCache, POST_TAG
+
+
+class Item(BaseModel):
+    id: int
+    text: str
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache(MemoryCacheBackend(max_entries=2), ttl=60)
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2)
+    await backend.set("a", b"1", 60, [])
+    await backend.set("b", b"2", 60, [])
+    await backend.get("a")
+    await backend.set("c", b"3", 60, [])
+
+    assert await backend.get("a") == b"1"
+    assert await backend.get("b") is None
+    assert await backend.get("c") == b"3"
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_expires_entries():
+    backend = MemoryCacheBackend()
+    with patch("app.services.cache.time.monotonic", return_value=100.0):
+        await backend.set("a", b"1", 10, [])
+    with patch("app.services.cache.time.monotonic", return_value=111.0):
+        assert await backend.get("a") is None
+    assert len(backend) == 0
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_invalidate_tags():
+    backend = MemoryCacheBackend()
+    await backend.set("a", b"1", 60, ["posts", "post:1"])
+    await backend.set("b", b"2", 60, ["post:2"])
+
+    await backend.invalidate(["post:1"])
+
+    assert await backend.get("a") is None
+    assert await backend.get("b") == b"2"
+
+
+@pytest.mark.asyncio
+async def test_cached_route_hit_and_invalidate(cache):
+    calls = []
+
+    @cache.cached(Item, tags=(POST_TAG,))
+    async def get_item(post_id: int, response: Response):
+        calls.append(post_id)
+        response.headers["X-Next-Cursor"] = "next"
+        return {"id": post_id, "text": "text"}
+
+    first = await get_item(post_id=1, response=Response())
+    second = await get_item(post_id=1, response=Response())
+
+    assert calls == [1]
+    assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("MISS", "HIT")
+    assert second.headers["X-Next-Cursor"] == "next"
+    assert json.loads(second.body) == {"id": 1, "text": "text"}
+
+    await cache.invalidate(POST_TAG.format(post_id=1))
+    await get_item(post_id=1, response=Response())
+    assert calls == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_cached_route_key_depends_on_arguments(cache):
+    calls = []
+
+    @cache.cached(list[Item])
+    async def get_items(limit: int):
+        calls.append(limit)
+        return []
+
+    await get_items(limit=1)
+    await get_items(limit=2)
+    await get_items(limit=1)
+
+    assert calls == [1, 2]
@@ -53,13 +53,13 @@ async def test_upload_avatar(mock_build_url, mock_upload, img_file, user):
 
 
 @pytest.mark.asyncio
-@patch("app.services.cloudinary.cloudinary.uploader.destroy", new_callable=AsyncMock)
+@patch("app.services.cloudinary.cloudinary.uploader.destroy")
 async def test_delete_avatar(mock_destroy):
     mock_destroy.return_value = {"result": "ok"}
 
     result = await delete_avatar("public_id")
 
-    assert result == {"result": "ok"}
+    assert result is None
     mock_destroy.assert_called_once_with("public_id")
 
 
@@ -77,13 +77,13 @@ def test_upload_photo(mock_upload, img_file, post):
 
 
 @pytest.mark.asyncio
-@patch("app.services.cloudinary.cloudinary.uploader.destroy", new_callable=AsyncMock)
+@patch("app.services.cloudinary.cloudinary.uploader.destroy")
 async def test_delete_photo(mock_destroy):
     mock_destroy.return_value = {"result": "ok"}
 
     result = await delete_photo("public_id")
 
-    assert result == {"result": "ok"}
+    assert result is None
     mock_destroy.assert_called_once_with("public_id")
 
 
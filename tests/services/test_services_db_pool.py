@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from app.services.db_pool import InstrumentedQueuePool, instrument_engine, pools_stats
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}",
+                           poolclass=InstrumentedQueuePool,
+                           pool_size=1,
+                           max_overflow=0,
+                           pool_timeout=0.05)
+    yield engine
+    engine.dispose()
+
+
+def test_pool_metrics_count_checkouts_and_waits(engine):
+    metrics = instrument_engine(engine, "test")
+
+    for _ in range(3):
+        with engine.connect() as connection:
+            connection.execute(text("select 1"))
+
+    stats = metrics.stats(engine.pool)
+    assert (stats["checkouts"], stats["checkins"], stats["connects"]) == (3, 3, 1)
+    assert stats["size"] == 1
+    assert stats["checked_out"] == 0
+    assert stats["wait_max_ms"] >= stats["wait_avg_ms"] > 0
+
+
+def test_pool_metrics_count_timeouts(engine):
+    metrics = instrument_engine(engine, "test")
+
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+        assert metrics.stats(engine.pool)["checked_out"] == 1
+
+    assert metrics.timeouts == 1
+
+
+def test_pools_stats_skips_not_instrumented(engine):
+    instrument_engine(engine, "test")
+
+    result = pools_stats({"test": engine, "other": engine})
+
+    assert list(result["pools"]) == ["test"]
+    assert result["pid"] > 0
@@ -0,0 +1,166 @@
+import random
+from datetime import datetime
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw
+from sqlalchemy import func, update
+
+from app.models import Post, PostDeletion, PostStatus
+from app.services.duplicates import BKTree, DuplicateIndex, dhash, hamming, load_duplicate_index
+
+
+def photo(width: int, height: int, image_format: str = "PNG", shift: int = 0) -> Image.Image:
+    image = Image.new("RGB", (width, height), (30, 60, 90))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((width // 4 + shift, height // 4, width * 3 // 4 + shift, height * 3 // 4), fill=(240, 200, 10))
+    draw.rectangle((0, 0, width // 5, height // 2), fill=(250, 250, 250))
+    buffer = BytesIO()
+    image.save(buffer, image_format)
+    return Image.open(buffer)
+
+
+def test_dhash_survives_resize_and_recompression():
+    original = dhash(photo(800, 600))
+    assert len(original) == 16
+    resized = dhash(photo(400, 300, "JPEG"))
+    assert hamming(int(original, 16), int(resized, 16)) <= 4
+
+
+def test_dhash_differs_for_other_image():
+    original = dhash(photo(800, 600))
+    other = dhash(photo(800, 600, shift=300))
+    assert hamming(int(original, 16), int(other, 16)) > 4
+
+
+def test_bk_tree_search_matches_linear_scan():
+    generator = random.Random(7)
+    hashes = {item: generator.getrandbits(64) for item in range(500)}
+    # near copies of a few hashes
+    for item in range(500, 520):
+        hashes[item] = hashes[item - 500] ^ (1 << generator.randrange(64))
+    tree = BKTree()
+    for item, value in hashes.items():
+        tree.add(value, item)
+
+    for query in (hashes[3], hashes[510], generator.getrandbits(64)):
+        expected = sorted(((item, hamming(query, value)) for item, value in hashes.items()
+                           if hamming(query, value) <= 6), key=lambda found: (found[1], found[0]))
+        assert tree.search(query, 6) == expected
+
+
+def test_bk_tree_remove():
+    tree = BKTree()
+    tree.add(0b1010, 1)
+    tree.add(0b1010, 2)
+    tree.add(0b1011, 3)
+
+    tree.remove(0b1010, 1)
+    tree.remove(0b1111, 3)
+    assert tree.search(0b1010, 1) == [(2, 0), (3, 1)]
+
+
+def test_duplicate_index_find_and_clusters():
+    index = DuplicateIndex()
+    index.add(1, "ffffffffffffffff")
+    assert index.find("ffffffffffffffff", 4) == []
+
+    index.build([(1, "ffffffffffffffff"), (2, "fffffffffffffffe"), (3, "fffffffffffffff8"),
+                 (4, "0000000000000000"), (5, "0000000000000000")])
+    assert index.find("ffffffffffffffff", 1) == [(1, 0), (2, 1)]
+    assert index.find("ffffffffffffffff", 1, exclude=1) == [(2, 1)]
+    # 1 and 3 are 3 bits apart, 2 links them
+    assert index.clusters(2) == [[1, 2, 3], [4, 5]]
+
+    index.add(2, "0f0f0f0f0f0f0f0f")
+    index.remove(5)
+    assert index.clusters(2) == []
+    assert len(index) == 4
+
+
+@pytest.mark.asyncio
+async def test_duplicate_index_catches_up_with_other_process(session):
+    # two API processes share the database, each has its own index
+    first, second = DuplicateIndex(), DuplicateIndex()
+    post = Post(description="first", photo_phash="ffffffffffffffff", status=PostStatus.ready)
+    session.add(post)
+    session.commit()
+    await load_duplicate_index(session, first)
+    await load_duplicate_index(session, second)
+
+    # created by the first process
+    other = Post(description="second", photo_phash="0000000000000000", status=PostStatus.pending)
+    session.add(other)
+    session.commit()
+    first.add(other.id, other.photo_phash)
+    index = await load_duplicate_index(session, second)
+    assert index is second
+    assert index.find("0000000000000000", 0) == [(other.id, 0)]
+
+    # new photo
+    other.photo_phash = "0f0f0f0f0f0f0f0f"
+    other.phash_changed_at = func.now()
+    session.commit()
+    await load_duplicate_index(session, second)
+    assert second.find("0f0f0f0f0f0f0f0f", 0) == [(other.id, 0)]
+    assert second.find("0000000000000000", 0) == []
+
+    # failed upload
+    session.execute(update(Post).where(Post.id == post.id).values(status=PostStatus.failed, phash_changed_at=func.now()))
+    session.commit()
+    await load_duplicate_index(session, second)
+    assert second.find("ffffffffffffffff", 0) == []
+
+    # deleted
+    session.delete(other)
+    session.add(PostDeletion(post_id=other.id))
+    session.commit()
+    await load_duplicate_index(session, second)
+    assert len(second) == 0
+
+    session.delete(session.get(Post, post.id))
+    session.commit()
+
+
+@pytest.mark.asyncio
+async def test_duplicate_index_catches_up_without_rebuild(session, monkeypatch):
+    monkeypatch.setattr("app.services.duplicates.settings.duplicate_sync_overlap", 1)
+    index = DuplicateIndex()
+    old = Post(description="old", photo_phash="ffffffffffffffff", phash_changed_at=datetime(2000, 1, 1))
+    session.add(old)
+    session.commit()
+    await load_duplicate_index(session, index)
+    assert index.last_changed == datetime(2000, 1, 1)
+
+    def build(hashes):
+        raise AssertionError("index is built again")
+
+    monkeypatch.setattr(index, "build", build)
+    new = Post(description="new", photo_phash="0000000000000000", phash_changed_at=datetime(2000, 1, 2))
+    session.add(new)
+    session.commit()
+    await load_duplicate_index(session, index)
+    assert index.find("0000000000000000", 0) == [(new.id, 0)]
+    assert index.last_changed == datetime(2000, 1, 2)
+
+    # written without the mark, e.g. like a counter update, the post is not read again
+    old.photo_phash = "00000000ffffffff"
+    session.commit()
+    await load_duplicate_index(session, index)
+    assert index.find("ffffffffffffffff", 0) == [(old.id, 0)]
+
+    session.delete(new)
+    session.add(PostDeletion(post_id=new.id))
+    session.commit()
+    await load_duplicate_index(session, index)
+    assert index.find("0000000000000000", 0) == []
+
+    # idle for longer than tombstones are kept, the index is built again
+    monkeypatch.undo()
+    index.synced -= 604800
+    await load_duplicate_index(session, index)
+    assert index.find("00000000ffffffff", 0) == [(old.id, 0)]
+
+    session.delete(session.get(Post, old.id))
+    session.query(PostDeletion).delete()
+    session.commit()
@@ -0,0 +1,126 @@
+import asyncio
+from io import BytesIO
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.models import Post
+from app.services.cache import MemoryCacheBackend
+from app.services.cloudinary import Effect
+from app.services.effects import EFFECTS, EffectCache, render_effect
+
+
+@pytest.fixture
+def pixels():
+    rng = np.random.default_rng(1)
+    return rng.uniform(0, 255, (40, 60, 3)).astype(np.float32)
+
+
+def test_grayscale_has_equal_channels(pixels):
+    result = EFFECTS["grayscale"](pixels)
+
+    assert result.shape == pixels.shape
+    assert np.allclose(result[..., 0], result[..., 1]) and np.allclose(result[..., 1], result[..., 2])
+
+
+def test_sepia_of_white_is_warm():
+    result = EFFECTS["sepia"](np.full((1, 1, 3), 100, dtype=np.float32))[0, 0]
+
+    assert result[0] > result[1] > result[2]
+
+
+@pytest.mark.parametrize("effect", ["blur", "sharpen"])
+def test_filters_keep_flat_image(effect):
+    flat = np.full((20, 30, 3), 77, dtype=np.float32)
+
+    assert np.allclose(EFFECTS[effect](flat), flat, atol=1e-3)
+
+
+def test_blur_smooths_and_sharpen_amplifies(pixels):
+    assert EFFECTS["blur"](pixels).std() < pixels.std()
+    assert EFFECTS["sharpen"](pixels).std() > pixels.std()
+
+
+def test_contrast_spreads_values(pixels):
+    assert EFFECTS["contrast"](pixels).std() > pixels.std()
+
+
+def test_vignette_darkens_corners():
+    flat = np.full((41, 41, 3), 200, dtype=np.float32)
+    result = EFFECTS["vignette"](flat)
+
+    assert result[20, 20, 0] == pytest.approx(200)
+    assert result[0, 0, 0] < 100
+
+
+def test_every_effect_has_engine():
+    assert set(EFFECTS) == {effect.value for effect in Effect}
+
+
+def test_render_effect_scales_down_to_max_width():
+    buffer = BytesIO()
+    Image.new("RGB", (800, 400), (10, 200, 30)).save(buffer, "PNG")
+
+    rendered = render_effect(buffer.getvalue(), "grayscale", max_width=200)
+
+    with Image.open(BytesIO(rendered)) as image:
+        assert image.format == "JPEG"
+        assert image.size == (200, 100)
+        red, green, blue = image.getpixel((100, 50))
+        assert abs(red - green) <= 2 and abs(green - blue) <= 2
+
+
+@pytest.mark.asyncio
+async def test_effect_cache_renders_once():
+    cache = EffectCache(MemoryCacheBackend())
+    post = Post(id=1, photo_hash="abc", photo_public_id="photos/1")
+
+    with patch("app.services.effects.variant_pool.run", new_callable=AsyncMock) as run:
+        async def render(*args):
+            await asyncio.sleep(0.01)
+            return b"rendered"
+        run.side_effect = render
+
+        results = await asyncio.gather(*(cache.get(post, Effect.sepia, b"photo") for _ in range(3)))
+        assert await cache.get(post, Effect.sepia) == b"rendered"
+
+    assert results == [b"rendered"] * 3
+    run.assert_awaited_once()
+    assert run.await_args.args[1:3] == (b"photo", "sepia")
+
+
+@pytest.mark.asyncio
+async def test_effect_cache_waiter_takes_over_cancelled_render():
+    cache = EffectCache(MemoryCacheBackend())
+    post = Post(id=1, photo_hash="abc", photo_public_id="photos/1")
+    started = asyncio.Event()
+
+    with patch("app.services.effects.variant_pool.run", new_callable=AsyncMock) as run:
+        async def render(*args):
+            started.set()
+            await asyncio.sleep(0.05)
+            return b"rendered"
+        run.side_effect = render
+
+        leader = asyncio.create_task(cache.get(post, Effect.sepia, b"photo"))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get(post, Effect.sepia, b"photo"))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        assert await asyncio.wait_for(waiter, timeout=1) == b"rendered"
+    assert leader.cancelled()
+    assert run.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_effect_cache_serves_render_when_cache_write_fails():
+    backend = MemoryCacheBackend()
+    backend.set = AsyncMock(side_effect=ConnectionError("no redis"))
+    cache = EffectCache(backend)
+    post = Post(id=1, photo_hash="abc", photo_public_id="photos/1")
+
+    with patch("app.services.effects.variant_pool.run", new_callable=AsyncMock, return_value=b"rendered"):
+        assert await cache.get(post, Effect.sepia, b"photo") == b"rendered"
@@ -0,0 +1,104 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from app.services.jobs import JobQueueUnavailable, JobWorker, MemoryJobQueue, RedisJobQueue
+
+
+@pytest.fixture
+def worker():
+    return JobWorker(queue=MemoryJobQueue(), concurrency=1, max_attempts=2, retry_delay=0, session_factory=MagicMock)
+
+
+@pytest.mark.asyncio
+async def test_run_pending_calls_handler_with_payload(worker):
+    handler = AsyncMock()
+    worker.register("job", handler)
+
+    await worker.enqueue("job", post_id=1, path="/tmp/photo")
+    await worker.enqueue("job", post_id=2, path="/tmp/photo")
+
+    assert await worker.run_pending() == 2
+    assert [call.kwargs for call in handler.await_args_list] == [
+        {"post_id": 1, "path": "/tmp/photo"},
+        {"post_id": 2, "path": "/tmp/photo"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_retried_then_on_failure_called(worker):
+    handler = AsyncMock(side_effect=ValueError("upload failed"))
+    on_failure = AsyncMock()
+    worker.register("job", handler, on_failure=on_failure)
+
+    await worker.enqueue("job", post_id=1)
+
+    assert await worker.run_pending() == 2
+    assert handler.await_count == 2
+    on_failure.assert_awaited_once()
+    assert on_failure.await_args.kwargs == {"post_id": 1}
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_retried_after_delay(worker):
+    handler = AsyncMock(side_effect=[ValueError("upload failed"), None])
+    worker.register("job", handler)
+    worker.retry_delay = 0.05
+
+    await worker.enqueue("job", post_id=1)
+
+    # the retry is not due yet
+    assert await worker.run_pending() == 1
+    assert await worker.queue.size() == 1
+    job = await worker.queue.get(timeout=1)
+    assert job["attempts"] == 1
+    assert await worker.run_job(job)
+
+
+@pytest.mark.asyncio
+async def test_consumer_outlives_failing_on_failure(worker):
+    done = asyncio.Event()
+    worker.register("broken", AsyncMock(side_effect=ValueError("upload failed")),
+                    on_failure=AsyncMock(side_effect=RuntimeError("database gone")))
+    worker.register("job", AsyncMock(side_effect=lambda db, **payload: done.set()))
+    worker.poll_timeout = 0.01
+
+    await worker.enqueue("broken", post_id=1)
+    await worker.enqueue("job", post_id=2)
+    await worker.start()
+    try:
+        await asyncio.wait_for(done.wait(), timeout=2)
+    finally:
+        await worker.stop()
+
+
+@pytest.mark.asyncio
+async def test_retry_not_queued_calls_on_failure(worker):
+    on_failure = AsyncMock()
+    worker.register("job", AsyncMock(side_effect=ValueError("upload failed")), on_failure=on_failure)
+    worker.queue.put = AsyncMock(side_effect=ConnectionError("no redis"))
+
+    assert not await worker.run_job({"name": "job", "payload": {"post_id": 1}, "attempts": 0})
+    on_failure.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_memory_queue_get_waits_for_timeout():
+    queue = MemoryJobQueue()
+
+    assert await queue.get(timeout=0.01) is None
+    await queue.put({"name": "job"})
+    assert await queue.get(timeout=0.01) == {"name": "job"}
+
+
+@pytest.mark.asyncio
+async def test_enqueue_without_redis_raises_503():
+    client = MagicMock()
+    client.lpush = AsyncMock(side_effect=ConnectionError("no redis"))
+    worker = JobWorker(queue=RedisJobQueue(client))
+
+    with pytest.raises(JobQueueUnavailable) as error:
+        await worker.enqueue("job", post_id=1)
+    assert error.value.status_code == 503
@@ -0,0 +1,55 @@
+import json
+import logging
+import queue
+
+from app.services.logs import JsonFormatter, RequestIdFilter, SamplingFilter, _QueueHandler, _request_id
+
+
+def record(name: str = "app.services.auth", level: int = logging.INFO, **kwargs) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, "user %s", ("deadpool",), None, **kwargs)
+
+
+def test_sampling_rate_by_longest_prefix():
+    sampling = SamplingFilter({"app": 1.0, "app.services": 0.5, "app.services.auth": 0.0})
+
+    assert sampling.rate("app.services.auth") == 0.0
+    assert sampling.rate("app.services.cache") == 0.5
+    assert sampling.rate("app.routes.posts") == 1.0
+    assert sampling.rate("uvicorn") == 1.0
+    assert not sampling.filter(record())
+    assert sampling.filter(record(level=logging.WARNING))
+
+
+def test_json_through_queue_keeps_request_id_extra_and_exception():
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(RequestIdFilter())
+    logger = logging.getLogger("tests.logs")
+    logger.addHandler(handler)
+    logger.propagate = False
+    token = _request_id.set("abc123")
+    try:
+        try:
+            raise ValueError("broken")
+        except ValueError:
+            logger.exception("user %s failed", "deadpool", extra={"post_id": 7})
+    finally:
+        _request_id.reset(token)
+        logger.removeHandler(handler)
+        logger.propagate = True
+
+    entry = json.loads(JsonFormatter().format(records.get_nowait()))
+    assert entry["message"] == "user deadpool failed"
+    assert entry["level"] == "ERROR"
+    assert entry["logger"] == "tests.logs"
+    assert entry["request_id"] == "abc123"
+    assert entry["post_id"] == 7
+    assert "ValueError: broken" in entry["exception"]
+
+
+def test_request_id(client):
+    response = client.get("test", headers={"X-Request-ID": "proxy-42"})
+    assert response.headers["X-Request-ID"] == "proxy-42"
+
+    response = client.get("test", headers={"X-Request-ID": "bad id"})
+    assert len(response.headers["X-Request-ID"]) == 32
@@ -0,0 +1,73 @@
+import json
+
+from app.services.metrics import EXITED_FILE, collect, cumulative, render
+
+DEAD_PID = 2 ** 30
+
+
+def test_render_counters_and_histograms(process_metrics):
+    registry = process_metrics
+    registry.inc("http_requests_total", method="GET", route="/api/posts/{post_id}", status=200)
+    registry.inc("http_requests_total", method="GET", route="/api/posts/{post_id}", status=200)
+    registry.observe("http_request_duration_seconds", 0.02, method="GET", route='/a"b')
+    registry.observe("http_request_duration_seconds", 20, method="GET", route='/a"b')
+
+    registry.flush()
+    text = render(collect())
+
+    assert "# TYPE http_requests_total counter" in text
+    assert 'http_requests_total{method="GET",route="/api/posts/{post_id}",status="200"} 2' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/a\\"b",le="0.01"} 0' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/a\\"b",le="0.025"} 1' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/a\\"b",le="+Inf"} 2' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/a\\"b"} 2' in text
+
+
+def test_collect_sums_workers_and_drops_gauges_of_dead_ones(process_metrics, tmp_path):
+    process_metrics.inc("cache_requests_total", cache="cache", result="hit")
+    process_metrics.set_gauge("emails_in_progress", 2)
+    process_metrics.flush()
+    dead = {"pid": DEAD_PID,
+            "counters": [["cache_requests_total", [["cache", "cache"], ["result", "hit"]], 3]],
+            "gauges": [["emails_in_progress", [], 5]],
+            "histograms": []}
+    (tmp_path / "metrics" / f"{DEAD_PID}-1.json").write_text(json.dumps(dead))
+
+    collected = collect()
+
+    assert collected["counters"][("cache_requests_total", (("cache", "cache"), ("result", "hit")))] == 4
+    assert collected["gauges"][("emails_in_progress", ())] == 2
+
+
+def test_collect_merges_snapshots_of_dead_workers(process_metrics, tmp_path):
+    process_metrics.inc("cache_requests_total", cache="cache", result="hit")
+    process_metrics.flush()
+    for started in (1, 2):
+        dead = {"pid": DEAD_PID,
+                "counters": [["cache_requests_total", [["cache", "cache"], ["result", "hit"]], 3]],
+                "gauges": [],
+                "histograms": [["db_statements_per_request", [["route", "other"]], [1] + [0] * 10, 1, 1]]}
+        (tmp_path / "metrics" / f"{DEAD_PID}-{started}.json").write_text(json.dumps(dead))
+
+    first = collect()
+    assert sorted(path.name for path in (tmp_path / "metrics").glob("*.json")) == sorted(
+        [EXITED_FILE, process_metrics._file])
+    assert collect() == first
+    assert first["counters"][("cache_requests_total", (("cache", "cache"), ("result", "hit")))] == 7
+    assert first["histograms"][("db_statements_per_request", (("route", "other"),))] == [[2] + [0] * 10, 2, 2]
+
+
+def test_cumulative():
+    assert cumulative((1, 5), [2, 1, 1]) == {"1": 2, "5": 3, "+Inf": 4}
+
+
+def test_last_flush_has_no_gauges(process_metrics):
+    process_metrics.inc("http_requests_in_flight")
+    process_metrics.inc("emails_sent_total", result="sent")
+
+    process_metrics.flush(live=False)
+
+    collected = collect()
+    assert collected["gauges"] == {}
+    assert collected["counters"] == {("emails_sent_total", (("result", "sent"),)): 1}
+
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import Query
+
+from app.models import Post
+from app.schemas.post import OrderByEnum, OrderEnum
+from app.services.pagination import PostCursor
+
+
+@pytest.fixture
+def posts():
+    return [
+        Post(id=1, created_at=datetime(2024, 7, 1, 10, 0, 0), rating=4.5),
+        Post(id=2, created_at=datetime(2024, 7, 1, 10, 0, 0), rating=None),
+    ]
+
+
+def test_token_round_trip_created_at():
+    cursor = PostCursor(OrderByEnum.created_at, OrderEnum.desc,
+                        datetime(2024, 7, 1, 10, 0, 0, 123), 7)
+
+    result = PostCursor.from_token(cursor.to_token())
+
+    assert result == cursor
+
+
+def test_token_round_trip_rating():
+    cursor = PostCursor(OrderByEnum.rating, OrderEnum.asc, 3.5, 12)
+
+    result = PostCursor.from_token(cursor.to_token())
+
+    assert result == cursor
+
+
+@pytest.mark.parametrize("token", ["not a cursor", "e30", ""])
+def test_from_token_invalid(token):
+    with pytest.raises(HTTPException) as err:
+        PostCursor.from_token(token)
+    assert err.value.status_code == 400
+
+
+def test_next_token_full_page(posts):
+    cursor = PostCursor(OrderByEnum.rating, OrderEnum.desc)
+
+    result = PostCursor.from_token(cursor.next_token(posts, limit=2))
+
+    assert result.last_id == 2
+    assert result.last_value == 0.0
+    assert result.order == OrderEnum.desc
+
+
+def test_next_token_last_page(posts):
+    cursor = PostCursor()
+
+    assert cursor.next_token(posts, limit=3) is None
+    assert cursor.next_token([], limit=3) is None
+
+
+def test_apply_first_page_has_no_filter():
+    query = Query(Post)
+
+    sql = str(PostCursor().apply(query))
+
+    assert "WHERE" not in sql
+    assert "ORDER BY posts.created_at ASC, posts.id ASC" in sql
+
+
+def test_apply_started_cursor_filters_by_keyset():
+    query = Query(Post)
+    cursor = PostCursor(OrderByEnum.created_at, OrderEnum.desc,
+                        datetime(2024, 7, 1, 10, 0, 0), 5)
+
+    sql = str(cursor.apply(query))
+
+    assert "WHERE (posts.created_at, posts.id) <" in sql
+    assert "ORDER BY posts.created_at DESC, posts.id DESC" in sql
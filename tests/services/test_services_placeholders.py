@@ -0,0 +1,40 @@
+from PIL import Image, ImageDraw
+
+from app.services.placeholders import _BASE83, blurhash, dominant_color
+
+
+def decode83(text: str) -> int:
+    value = 0
+    for char in text:
+        value = value * 83 + _BASE83.index(char)
+    return value
+
+
+def test_blurhash_of_solid_colour():
+    result = blurhash(Image.new("RGB", (100, 60), (255, 0, 0)))
+
+    # 4 x 3 components: size flag, maximum, DC and 11 AC components
+    assert len(result) == 2 + 4 + 11 * 2
+    assert decode83(result[0]) == 3 + 2 * 9
+    assert decode83(result[2:6]) == 0xff0000
+    # same as the reference encoder of blurha.sh
+    assert result == "LGTI:j;$fQ;$|co1fQo1fQfQfQfQ"
+
+
+def test_blurhash_components():
+    image = Image.new("RGB", (64, 64), (0, 0, 0))
+    ImageDraw.Draw(image).rectangle((0, 0, 31, 63), fill=(255, 255, 255))
+
+    result = blurhash(image, components_x=2, components_y=1)
+    assert len(result) == 2 + 4 + 2
+    # left bright, right dark: the first horizontal component is positive in every channel
+    value = decode83(result[6:8])
+    assert value // (19 * 19) > 9 and value // 19 % 19 > 9 and value % 19 > 9
+
+
+def test_dominant_color_is_the_largest_area():
+    image = Image.new("RGB", (100, 100), (200, 30, 30))
+    ImageDraw.Draw(image).rectangle((0, 0, 30, 30), fill=(250, 250, 0))
+
+    assert dominant_color(image) == "#c81e1e"
+
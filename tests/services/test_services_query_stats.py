@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from app.services.metrics import collect
+from app.services.query_stats import QueryStatsMiddleware, RequestQueries, instrument_queries, queries_stats
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'queries.db'}")
+    instrument_queries(engine)
+    instrument_queries(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_queries_stats_are_cumulative(process_metrics):
+    for statements in (0, 1, 4, 100):
+        process_metrics.observe("db_statements_per_request", statements, route="/api/posts/all")
+        process_metrics.observe("db_seconds_per_request", 0.002, route="/api/posts/all")
+    process_metrics.inc("db_repeated_statements_total", route="/api/posts/all")
+    process_metrics.flush()
+
+    feed = queries_stats(collect())["routes"]["/api/posts/all"]
+    assert feed["statements"]["buckets"] == {"1": 2, "2": 2, "3": 2, "5": 3, "8": 3, "13": 3, "21": 3, "34": 3,
+                                             "55": 3, "89": 3, "+Inf": 4}
+    assert (feed["statements"]["sum"], feed["statements"]["count"]) == (105, 4)
+    assert feed["db_seconds"]["buckets"]["0.0025"] == 4
+    assert feed["repeated"] == 1
+
+
+def test_repeated_shapes():
+    queries = RequestQueries()
+    for _ in range(3):
+        queries.record("SELECT *\n  FROM users WHERE id = ?", 0.001)
+    queries.record("SELECT * FROM posts", 0.001)
+
+    assert queries.statements == 4
+    assert queries.repeated(3) == [("SELECT * FROM users WHERE id = ?", 3)]
+    assert queries.repeated(4) == []
+
+
+def test_statements_counted_only_in_request(engine, process_metrics):
+    messages = []
+
+    async def app(scope, receive, send):
+        with engine.connect() as connection:
+            connection.execute(text("select 1"))
+            with pytest.raises(exc.OperationalError):
+                connection.execute(text("select * from missing"))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    async def send(message):
+        messages.append(message)
+
+    with engine.connect() as connection:
+        connection.execute(text("select 1"))
+    asyncio.run(QueryStatsMiddleware(app)({"type": "http", "method": "GET", "headers": []}, None, send))
+
+    timing = dict(messages[0]["headers"])[b"server-timing"].decode()
+    assert 'desc="2 statements"' in timing
+    process_metrics.flush()
+    assert queries_stats(collect())["routes"]["other"]["statements"] == {
+        "buckets": {"1": 0, "2": 1, "3": 1, "5": 1, "8": 1, "13": 1, "21": 1, "34": 1, "55": 1, "89": 1, "+Inf": 1},
+        "sum": 2, "count": 1}
@@ -0,0 +1,90 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import pytest
+
+from app.services.resumable import (UploadSessionConflict, UploadSessionNotFound, UploadSessionStore,
+                                    ingest_session)
+from app.services.uploads import UnsupportedMediaType, UploadTooLarge
+
+PHOTO = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadSessionStore(str(tmp_path / "sessions"), ttl=3600, chunk_size=400)
+
+
+def test_chunks_in_any_order_and_again(store, tmp_path, monkeypatch):
+    monkeypatch.setattr("app.services.uploads.settings.upload_spool_dir", str(tmp_path / "spool"))
+    session = store.create(1, len(PHOTO), "photo.png")
+    assert session.chunks == 3
+    assert session.chunk_length(2) == len(PHOTO) - 800
+
+    store.write_chunk(session, 2, 800, PHOTO[800:])
+    store.write_chunk(session, 0, 0, PHOTO[:400])
+    assert store.get(session.upload_id, 1).received() == [0, 2]
+    with pytest.raises(UploadSessionConflict):
+        store.claim(session)
+
+    store.write_chunk(session, 1, 400, PHOTO[400:800])
+    store.write_chunk(session, 1, 400, PHOTO[400:800])
+    claimed = store.claim(session)
+    with pytest.raises(UploadSessionNotFound):
+        store.get(session.upload_id, 1)
+
+    upload = asyncio.run(ingest_session(claimed))
+    assert upload.size == len(PHOTO)
+    assert upload.sha256 == hashlib.sha256(PHOTO).hexdigest()
+    assert upload.media_type == "image/png"
+    store.discard(claimed)
+    assert os.listdir(store.directory) == []
+
+
+def test_chunk_checks(store):
+    session = store.create(1, len(PHOTO))
+
+    with pytest.raises(UploadSessionConflict):
+        store.write_chunk(session, 1, 399, PHOTO[400:800])
+    with pytest.raises(UploadSessionConflict):
+        store.write_chunk(session, 3, 1200, b"")
+    with pytest.raises(UploadSessionConflict):
+        store.write_chunk(session, 1, 400, PHOTO[400:799])
+    with pytest.raises(UnsupportedMediaType):
+        store.write_chunk(session, 0, 0, b"<html>" + PHOTO[6:400])
+    assert session.received() == []
+
+
+def test_sessions_of_other_users_and_unknown_ids(store):
+    session = store.create(1, len(PHOTO))
+
+    with pytest.raises(UploadSessionNotFound):
+        store.get(session.upload_id, 2)
+    with pytest.raises(UploadSessionNotFound):
+        store.get("../../etc", 1)
+    with pytest.raises(UploadSessionNotFound):
+        store.get("a" * 32, 1)
+
+
+def test_create_rejects_too_large(store, monkeypatch):
+    monkeypatch.setattr("app.services.resumable.settings.upload_max_size", 1000)
+
+    with pytest.raises(UploadTooLarge):
+        store.create(1, 1001)
+
+
+def test_collect_removes_idle_sessions(store):
+    idle = store.create(1, len(PHOTO))
+    store.write_chunk(idle, 0, 0, PHOTO[:400])
+    active = store.create(1, len(PHOTO))
+    past = time.time() - 7200
+    idle.created_at = past
+    (idle.directory / "session.json").write_text(json.dumps(idle.to_dict()))
+    os.utime(idle.chunk_path(0), (past, past))
+
+    assert store.collect() == 1
+    assert not idle.directory.exists()
+    assert active.directory.exists()
@@ -0,0 +1,75 @@
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.models import Post, Tag
+from app.services.search import PostSearchIndex, tokenize, ts_query, full_text_search
+
+
+@pytest.fixture
+def index():
+    index = PostSearchIndex()
+    index.build([
+        Post(id=1, description="Sunset over the sea", tags=[Tag(id=1, text="sea")]),
+        Post(id=2, description="Mountain sunrise", tags=[Tag(id=2, text="mountains")]),
+        Post(id=3, description="Seagulls at the harbour", tags=[]),
+    ])
+    return index
+
+
+def test_tokenize():
+    assert tokenize("Sunset, over the SEA!") == ["sunset", "over", "the", "sea"]
+    assert tokenize(None) == []
+
+
+def test_ts_query():
+    assert ts_query("Sunset sea") == "sunset:* & sea:*"
+    assert ts_query("'; drop table posts; --") == "drop:* & table:* & posts:*"
+    assert ts_query("!!!") is None
+
+
+def test_search_prefix(index):
+    result = index.search("sea")
+
+    assert set(result) == {1, 3}
+    # tag and description match ranks above prefix match
+    assert result[1] > result[3]
+
+
+def test_search_all_words_required(index):
+    assert set(index.search("sun sea")) == {1}
+    assert index.search("sunset mountain") == {}
+
+
+def test_add_reindexes_post(index):
+    index.add(Post(id=1, description="Forest", tags=[]))
+
+    assert set(index.search("sea")) == {3}
+    assert set(index.search("forest")) == {1}
+
+
+def test_remove(index):
+    index.remove(3)
+
+    assert set(index.search("sea")) == {1}
+
+
+def test_add_before_build_does_nothing():
+    index = PostSearchIndex()
+
+    index.add(Post(id=1, description="Forest", tags=[]))
+
+    assert not index.built
+    assert index.search("forest") == {}
+
+
+@pytest.mark.asyncio
+async def test_full_text_search_postgres():
+    db = MagicMock(spec=Session)
+    db.get_bind.return_value.dialect.name = "postgresql"
+
+    expr, rank = await full_text_search("sea", db)
+
+    assert "@@ to_tsquery" in str(expr)
+    assert "ts_rank" in str(rank)
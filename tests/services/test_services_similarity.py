@@ -0,0 +1,92 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from app.services.similarity import FEATURE_SIZE, VectorStore, feature_vector, index_photo, similar_post_ids
+
+
+def photo(colour, background=(20, 20, 20), width=320, height=240) -> Image.Image:
+    image = Image.new("RGB", (width, height), background)
+    ImageDraw.Draw(image).rectangle((0, 0, width // 2, height), fill=colour)
+    buffer = BytesIO()
+    image.save(buffer, "JPEG")
+    return Image.open(buffer)
+
+
+def unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_feature_vector_ranks_similar_photo_higher():
+    red = feature_vector(photo((220, 30, 30)))
+    assert red.shape == (FEATURE_SIZE,)
+    assert np.linalg.norm(red) == pytest.approx(1, abs=1e-5)
+
+    darker_red = feature_vector(photo((200, 25, 25), width=640, height=480))
+    blue = feature_vector(photo((30, 30, 220), background=(240, 240, 240)))
+    assert red @ darker_red > red @ blue
+
+
+def test_vector_store_add_search_remove(tmp_path):
+    store = VectorStore(str(tmp_path), dim=3)
+    store.add(1, [1, 0, 0])
+    store.add(2, [0.9, 0.1, 0])
+    store.add(3, [0, 1, 0])
+    store.add(2, [0.8, 0.2, 0])
+
+    assert len(store) == 3
+    assert np.allclose(store.get(2), unit([0.8, 0.2, 0]))
+    assert [post_id for post_id, _ in store.search(unit([1, 0, 0]), 2)] == [1, 2]
+    assert [post_id for post_id, _ in store.search(unit([1, 0, 0]), 5, exclude=1)] == [2, 3]
+
+    store.remove(1)
+    assert store.get(1) is None
+    assert [post_id for post_id, _ in store.search(unit([1, 0, 0]), 5)] == [2, 3]
+
+
+def test_vector_store_is_shared_through_files(tmp_path):
+    writer = VectorStore(str(tmp_path), dim=4)
+    reader = VectorStore(str(tmp_path), dim=4)
+    assert reader.search(unit([1, 1, 0, 0]), 3) == []
+
+    vectors = np.random.default_rng(1).random((1500, 4), dtype=np.float32)
+    for post_id, vector in enumerate(vectors, start=1):
+        writer.add(post_id, vector)
+
+    # the reader maps rows written by another store, files grew past the first capacity
+    assert len(reader) == 1500
+    assert np.allclose(reader.get(1500), unit(vectors[-1]))
+    with pytest.raises(ValueError):
+        len(VectorStore(str(tmp_path), dim=5))
+
+
+def test_vector_store_quantiser_finds_nearest(tmp_path):
+    generator = np.random.default_rng(3)
+    centres = generator.normal(size=(20, 16))
+    store = VectorStore(str(tmp_path), dim=16)
+    vectors = centres[np.arange(2000) % 20] + generator.normal(scale=0.05, size=(2000, 16))
+    for post_id, vector in enumerate(vectors, start=1):
+        store.add(post_id, vector)
+    query = unit(vectors[0])
+    exact = [post_id for post_id, _ in store.search(query, 10)]
+
+    assert store.train(lists=20) == 2000
+    # rows added after training are scanned too
+    store.add(5000, vectors[0])
+    approximate = [post_id for post_id, _ in store.search(query, 11, nprobe=2)]
+    assert approximate[0] in (1, 5000)
+    assert set(exact) <= set(approximate)
+
+    assert VectorStore(str(tmp_path), dim=16).search(query, 11, nprobe=2) == store.search(query, 11, nprobe=2)
+
+
+@pytest.mark.asyncio
+async def test_index_photo(vector_store):
+    await index_photo(1, feature_vector(photo((220, 30, 30))))
+    await index_photo(2, feature_vector(photo((30, 30, 220))))
+
+    assert [post_id for post_id, _ in await similar_post_ids(1, 5)] == [2]
+    assert await similar_post_ids(3, 5) is None
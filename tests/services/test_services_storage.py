@@ -0,0 +1,44 @@
+from io import BytesIO
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.storage import LocalStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(str(tmp_path), "/api/media")
+
+
+def test_local_upload_writes_file_and_returns_versioned_url(storage, tmp_path):
+    stored = storage.upload(BytesIO(b"photo"), "folder/1/photos/1")
+
+    assert (tmp_path / "folder/1/photos/1").read_bytes() == b"photo"
+    assert stored.public_id == "folder/1/photos/1"
+    assert stored.url == f"/api/media/folder/1/photos/1?v={stored.version}"
+    # no temporary files are left
+    assert [path.name for path in (tmp_path / "folder/1/photos").iterdir()] == ["1"]
+
+
+def test_local_upload_overwrites_and_delete_removes(storage, tmp_path):
+    storage.upload(BytesIO(b"old"), "avatar")
+    storage.upload(BytesIO(b"new"), "avatar")
+    assert (tmp_path / "avatar").read_bytes() == b"new"
+
+    storage.delete("avatar")
+    storage.delete("avatar")
+    assert not (tmp_path / "avatar").exists()
+
+
+@pytest.mark.parametrize("public_id", ["../outside", "folder/../../outside", ""])
+def test_local_path_outside_root_not_found(storage, public_id):
+    with pytest.raises(HTTPException) as error:
+        storage.path(public_id)
+    assert error.value.status_code == 404
+
+
+def test_local_transform_not_supported(storage):
+    with pytest.raises(HTTPException) as error:
+        storage.transform("photo", "sepia")
+    assert error.value.status_code == 501
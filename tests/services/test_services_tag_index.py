@@ -0,0 +1,58 @@
+import pytest
+
+from app.models import Tag
+from app.services.tag_index import TagSuggestIndex, trigrams
+
+
+@pytest.fixture
+def index():
+    index = TagSuggestIndex(ttl=60)
+    index.build([
+        (1, "sunset", 3),
+        (2, "sun", 40),
+        (3, "sunrise", 0),
+        (4, "mountains", 10),
+        (5, "sea", 1),
+    ])
+    return index
+
+
+def test_trigrams():
+    assert trigrams("Cat") == {"  c", " ca", "cat", "at "}
+
+
+def test_suggest_prefix_ranked_by_popularity(index):
+    result = index.suggest("su")
+
+    assert [tag.text for tag in result] == ["sun", "sunset", "sunrise"]
+
+
+def test_suggest_fuzzy(index):
+    result = index.suggest("mountain")
+
+    assert [tag.id for tag in result] == [4]
+
+
+def test_suggest_limit(index):
+    assert len(index.suggest("su", limit=2)) == 2
+
+
+def test_suggest_empty_query(index):
+    assert index.suggest("  ") == []
+
+
+def test_add_new_tag(index):
+    index.add(Tag(id=6, text="surf"))
+
+    assert 6 in [tag.id for tag in index.suggest("sur")]
+
+
+def test_is_fresh():
+    index = TagSuggestIndex(ttl=60)
+    assert not index.is_fresh
+
+    index.build([])
+    assert index.is_fresh
+
+    index.ttl = 0
+    assert not index.is_fresh
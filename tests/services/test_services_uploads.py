@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import os
+import threading
+
+import pytest
+
+from app.services.storage import LocalStorage, set_storage
+from app.services.uploads import (UnsupportedMediaType, UploadExecutor, UploadQueueFull, UploadTooLarge,
+                                  RequestSizeLimitMiddleware, discard_spooled, discard_staged, fetch_staged,
+                                  ingest_stream, stage_spooled)
+
+
+@pytest.fixture
+def executor():
+    executor = UploadExecutor(workers=1, queue_size=0)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_run_returns_result_and_records_timing(executor):
+    result = await executor.run("upload_photo", lambda a, b: a + b, 1, 2)
+
+    assert result == 3
+    stats = executor.stats()
+    assert stats["pending"] == 0
+    assert stats["uploads"]["upload_photo"]["count"] == 1
+    assert stats["uploads"]["upload_photo"]["errors"] == 0
+
+
+@pytest.mark.asyncio
+async def test_run_records_errors(executor):
+    def fail():
+        raise ValueError("upload failed")
+
+    with pytest.raises(ValueError):
+        await executor.run("upload_photo", fail)
+
+    assert executor.stats()["uploads"]["upload_photo"]["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_run_rejects_when_full_and_keeps_loop_free(executor):
+    release = threading.Event()
+    upload = asyncio.create_task(executor.run("upload_photo", release.wait, 5))
+    await asyncio.sleep(0.01)
+
+    # event loop is not blocked by the running upload
+    assert not upload.done()
+    with pytest.raises(UploadQueueFull) as error:
+        await executor.run("upload_photo", lambda: None)
+    assert error.value.status_code == 429
+    with pytest.raises(UploadQueueFull):
+        executor.ensure_capacity("upload_photo")
+
+    release.set()
+    assert await upload is True
+    assert executor.stats()["uploads"]["upload_photo"]["rejected"] == 2
+    executor.ensure_capacity("upload_photo")
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+PNG_HEAD = b"\x89PNG\r\n\x1a\n" + b"\x00" * 8
+
+
+@pytest.mark.asyncio
+async def test_ingest_stream_hashes_and_keeps_small_upload_in_memory(tmp_path):
+    upload = await ingest_stream(stream(PNG_HEAD[:4], PNG_HEAD[4:], b"rest"), str(tmp_path), 100, 64)
+
+    assert upload.media_type == "image/png"
+    assert upload.size == len(PNG_HEAD) + 4
+    assert upload.sha256 == hashlib.sha256(PNG_HEAD + b"rest").hexdigest()
+    assert upload.path is None
+    assert os.listdir(tmp_path) == []
+
+    path = upload.persist()
+    with open(path, "rb") as spooled:
+        assert spooled.read() == PNG_HEAD + b"rest"
+    discard_spooled(path)
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_ingest_stream_spools_large_upload_to_disk(tmp_path):
+    upload = await ingest_stream(stream(PNG_HEAD, b"a" * 40, b"b" * 40), str(tmp_path), 100, 64)
+
+    assert upload.path is not None
+    assert os.path.dirname(upload.path) == str(tmp_path)
+    assert upload.file.read() == PNG_HEAD + b"a" * 40 + b"b" * 40
+
+    upload.discard()
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_ingest_stream_rejects_too_large(tmp_path):
+    with pytest.raises(UploadTooLarge) as error:
+        await ingest_stream(stream(PNG_HEAD, b"a" * 60, b"b" * 60), str(tmp_path), 100, 64)
+
+    assert error.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_ingest_stream_rejects_not_image(tmp_path):
+    async def chunks():
+        yield b"<html><body>not a photo</body></html>"
+        raise AssertionError("rest of upload is read")
+
+    with pytest.raises(UnsupportedMediaType) as error:
+        await ingest_stream(chunks(), str(tmp_path), 100, 64)
+
+    assert error.value.status_code == 415
+    with pytest.raises(UnsupportedMediaType):
+        await ingest_stream(stream(b"x"), str(tmp_path), 100, 64)
+
+
+@pytest.mark.asyncio
+async def test_stage_spooled_keeps_path_with_shared_spool(tmp_path):
+    spooled = tmp_path / "upload-1"
+    spooled.write_bytes(PNG_HEAD)
+
+    staged = await stage_spooled(str(spooled))
+
+    assert staged == str(spooled)
+    async with fetch_staged(staged) as path:
+        assert path == str(spooled)
+    await discard_staged(staged)
+    assert not spooled.exists()
+
+
+@pytest.mark.asyncio
+async def test_stage_spooled_moves_photo_to_storage(tmp_path, monkeypatch):
+    # another host fetches the photo from storage, not from the spool of this one
+    monkeypatch.setattr("app.services.uploads.settings.upload_staging", "storage")
+    set_storage(LocalStorage(str(tmp_path / "media"), "/api/media"))
+    spooled = tmp_path / "upload-1"
+    spooled.write_bytes(PNG_HEAD)
+    try:
+        staged = await stage_spooled(str(spooled))
+
+        assert staged == "staged:staging/upload-1"
+        assert not spooled.exists()
+        assert (tmp_path / "media" / "staging" / "upload-1").read_bytes() == PNG_HEAD
+        async with fetch_staged(staged) as path:
+            with open(path, "rb") as photo:
+                assert photo.read() == PNG_HEAD
+        assert not os.path.exists(path)
+
+        await discard_staged(staged)
+        assert not (tmp_path / "media" / "staging" / "upload-1").exists()
+    finally:
+        set_storage(None)
+
+
+def test_request_size_limit_middleware():
+    from fastapi import FastAPI, Request
+    from fastapi.testclient import TestClient
+
+    app = FastAPI()
+    app.add_middleware(RequestSizeLimitMiddleware, max_size=10)
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    client = TestClient(app)
+    assert client.post("/echo", content=b"a" * 10).json() == {"size": 10}
+    response = client.post("/echo", content=b"a" * 11)
+    assert response.status_code == 413
+
+    def chunked():
+        yield b"a" * 8
+        yield b"a" * 8
+
+    response = client.post("/echo", content=chunked())
+    assert response.status_code == 413
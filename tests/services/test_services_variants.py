@@ -0,0 +1,35 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.services.storage import LocalStorage, set_storage
+from app.services.variants import render_variants, store_variants
+
+
+def test_render_variants_keeps_aspect_ratio_and_formats():
+    rendered = render_variants(Image.new("RGB", (1200, 600), (200, 120, 40)), (256, 512, 1024))
+
+    assert sorted(rendered) == [(256, "jpeg"), (256, "webp"), (512, "jpeg"), (512, "webp"),
+                                (1024, "jpeg"), (1024, "webp")]
+    with Image.open(BytesIO(rendered[(512, "webp")])) as image:
+        assert image.format == "WEBP"
+        assert image.size == (512, 256)
+    with Image.open(BytesIO(rendered[(1024, "jpeg")])) as image:
+        assert image.format == "JPEG"
+        assert image.size == (1024, 512)
+
+
+@pytest.mark.asyncio
+async def test_store_variants(tmp_path):
+    rendered = render_variants(Image.new("RGB", (600, 400), (200, 120, 40)), (256, 512))
+    set_storage(LocalStorage(str(tmp_path), "/api/media"))
+    try:
+        variants = await store_variants(rendered, "photos/1")
+    finally:
+        set_storage(None)
+
+    assert sorted(variants) == ["256", "512"]
+    assert variants["256"]["webp"].startswith("/api/media/photos/1_256_webp")
+    with Image.open(tmp_path / "photos" / "1_512_jpeg") as image:
+        assert image.size == (512, 341)